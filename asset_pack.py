@@ -0,0 +1,256 @@
+"""
+Packed file of the original images of the game. The pixels of all images are stored uncompressed in one file after
+an index, and the file is memory-mapped. An image is copied out of the mapping only when the images are scaled, so
+the full-size originals do not have to be kept in memory for the whole session.
+
+The index records the modification time and the size of the image files each asset key was made from. If the files
+have changed since, the game loads that key from the image files. Build the pack again after changing the images:
+python asset_pack.py
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import pygame
+import settings
+
+MAGIC = b"ONOPACK2"
+# Magic and the length of the JSON index
+HEADER = struct.Struct("<8sQ")
+# Byte order of the pixels. The same as in the surfaces made by convert_alpha, so no conversion is needed.
+PIXEL_FORMAT = "BGRA"
+
+
+def resident_bytes(images, seen=None):
+    """
+    Return the memory used by the pixels of an image, or a list or a dict of them.
+    :param images: Surface, list or dict
+    :param seen: set of ids of the surfaces already counted. Each surface is counted only once.
+    :return: bytes
+    """
+
+    if type(images) == dict:
+        return sum(resident_bytes(image, seen) for image in images.values())
+    elif type(images) == list:
+        return sum(resident_bytes(image, seen) for image in images)
+
+    if seen is not None:
+        if id(images) in seen:
+            return 0
+        seen.add(id(images))
+    return images.get_pitch() * images.get_height()
+
+
+def file_names(files):
+    """
+    Return the names of the image files of an asset key as a flat list.
+    :param files: file name, or a list or a dict of them (like the values of ASSET_FILES)
+    :return: list of file names
+    """
+
+    if type(files) == dict:
+        return [name for key in files for name in file_names(files[key])]
+    elif type(files) == list:
+        return [name for item in files for name in file_names(item)]
+    return [files]
+
+
+def source_stamps(files):
+    """
+    Return the modification time and the size of image files, for checking whether a pack is up to date.
+    :param files: file name, or a list or a dict of them
+    :return: list of [file name, modification time in ns, size in bytes]. Missing files have None for both.
+    """
+
+    stamps = []
+    for name in file_names(files):
+        try:
+            status = os.stat(os.path.join("graphics", name))
+            stamps.append([name, status.st_mtime_ns, status.st_size])
+        except OSError:
+            stamps.append([name, None, None])
+    return stamps
+
+
+def write_pack(path, images, sources):
+    """
+    Write images to a pack file.
+    :param path: Name of the file
+    :param images: dict, key: asset key, value: Surface or a list or a dict of them (like Game.original_files)
+    :param sources: dict, key: asset key, value: the image files the images were loaded from
+    :return: -
+    """
+
+    chunks = []
+    offset = 0
+
+    def index_entry(image):
+        nonlocal offset
+        if type(image) == dict:
+            return {"dict": {name: index_entry(image[name]) for name in image}}
+        elif type(image) == list:
+            return {"list": [index_entry(item) for item in image]}
+
+        data = pygame.image.tobytes(image, PIXEL_FORMAT)
+        chunks.append(data)
+        entry = {"offset": offset, "size": image.get_size()}
+        offset += len(data)
+        return entry
+
+    index = {"format": PIXEL_FORMAT, "images": {key: index_entry(images[key]) for key in images},
+             "sources": {key: source_stamps(sources[key]) for key in images}}
+    index_data = json.dumps(index).encode()
+
+    with open(path, "wb") as pack_file:
+        pack_file.write(HEADER.pack(MAGIC, len(index_data)))
+        pack_file.write(index_data)
+        for data in chunks:
+            pack_file.write(data)
+
+
+class AssetPack():
+    """
+    A memory-mapped pack file. The images of an asset key are copied out of it when they are loaded.
+    """
+
+    def __init__(self, path):
+        """
+        Open a pack file. Raises ValueError if the file is not a pack or is truncated.
+        :param path: Name of the file
+        """
+
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # An empty file cannot be mapped
+            self._file.close()
+            raise ValueError("Not an asset pack: " + path)
+
+        try:
+            self._read_index(path)
+        except ValueError:
+            self.close()
+            raise
+
+        # Is each asset key up to date with its image files. Checked when the key is first loaded.
+        self._current = {}
+
+    def _read_index(self, path):
+        """
+        Read the index and check that the data of every image is in the file.
+        """
+
+        if len(self._map) < HEADER.size:
+            raise ValueError("Not an asset pack: " + path)
+        magic, index_length = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            raise ValueError("Not an asset pack: " + path)
+
+        self._data_start = HEADER.size + index_length
+        if self._data_start > len(self._map):
+            raise ValueError("The index of the asset pack is truncated: " + path)
+        try:
+            index = json.loads(self._map[HEADER.size:self._data_start])
+            self._format = index["format"]
+            self._images = index["images"]
+            self._sources = index["sources"]
+            data_end = max([self._entry_end(entry) for entry in self._images.values()], default=0)
+        except (KeyError, TypeError) as error:
+            raise ValueError("The index of the asset pack is broken: " + path + " " + repr(error))
+
+        if self._data_start + data_end > len(self._map):
+            raise ValueError("The asset pack is truncated: " + path)
+
+    def _entry_end(self, entry):
+        """
+        Return the end of the data of an index entry from the start of the data.
+        """
+
+        if "dict" in entry:
+            return max([self._entry_end(item) for item in entry["dict"].values()], default=0)
+        elif "list" in entry:
+            return max([self._entry_end(item) for item in entry["list"]], default=0)
+
+        width, height = entry["size"]
+        return entry["offset"] + width * height * 4
+
+    def keys(self):
+        return list(self._images.keys())
+
+    def __contains__(self, key):
+        return key in self._images
+
+    def mapped_bytes(self):
+        return len(self._map)
+
+    def is_current(self, key, files):
+        """
+        Tell whether the images of an asset key were packed from the image files as they are now.
+        :param key: Asset key
+        :param files: the image files of the key, like the values of ASSET_FILES
+        :return: boolean
+        """
+
+        if key not in self._current:
+            self._current[key] = self._sources.get(key) == source_stamps(files)
+            if not self._current[key]:
+                print("The asset pack is older than the images of", key + ", loading the image files")
+        return self._current[key]
+
+    def load(self, key):
+        """
+        Copy the images of an asset key out of the pack.
+        :param key: Asset key, for example "animal_animations"
+        :return: Surface, or a list or a dict of them
+        """
+        return self._load_entry(self._images[key])
+
+    def _load_entry(self, entry):
+
+        if "dict" in entry:
+            return {name: self._load_entry(item) for name, item in entry["dict"].items()}
+        elif "list" in entry:
+            return [self._load_entry(item) for item in entry["list"]]
+
+        width, height = entry["size"]
+        start = self._data_start + entry["offset"]
+        view = memoryview(self._map)[start:start + width * height * 4]
+        mapped_image = pygame.image.frombuffer(view, (width, height), self._format)
+        image = mapped_image.copy()
+        del mapped_image
+        view.release()
+        return image
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+def main():
+    """
+    Load the images of the game from the PNG files and write them to the pack.
+    """
+
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    from main import Game
+    from sound_interfaces import SilentSoundInterface
+    from species import all_species
+
+    pygame.init()
+    screen = pygame.display.set_mode((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT))
+    path = os.path.join("graphics", settings.ASSET_PACK)
+    # Load the PNG files even if there is an old pack
+    settings.ASSET_PACK = ""
+    game = Game(screen, SilentSoundInterface(), add_levels=False)
+    game.load_species([species.id for species in all_species()])
+
+    write_pack(path, game.original_files, {key: game.asset_files(key) for key in game.original_files})
+    print("Wrote", path, os.path.getsize(path) // 1024, "KB")
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
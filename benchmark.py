@@ -0,0 +1,120 @@
+"""
+Headless benchmark for the game levels. Runs levels with many animals without a window and prints how long updating
+and drawing a frame takes.
+
+Usage: python benchmark.py [number of animals] ...
+
+The play area is not made bigger for big herds, so with hundreds of animals most of them overlap and are pushed
+apart on every frame. Set ANIMAL_SEPARATION_SPEED to 0 in settings.py to measure without the separation.
+
+Set RENDER_BACKEND to "sdl2" in settings.py to measure drawing through the SDL renderer. Without a display SDL's
+software renderer is used.
+
+Set PIPELINED_DRAWING to True in settings.py to draw in a render thread while the next frame is updated. The draw
+time is then only the time for making the render list, and the frame time shows what was saved.
+"""
+
+import os
+import sys
+import time
+import random
+
+# Run without a window unless a video driver has been chosen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import settings
+from sound_interfaces import SilentSoundInterface
+
+ANIMAL_COUNTS = [100, 500, 2000]
+FRAMES = 300
+SPECIES = ["dog", "cat", "pig", "sheep", "cow"]
+BENCHMARK_LEVEL = "benchmark_level"
+
+
+def run_level(game, number_of_animals, frames=FRAMES, dt=None):
+    """
+    Play a level with the given number of animals and measure the time used for updating and drawing.
+    :param game: Game object whose images are used for the level
+    :param number_of_animals: Number of animals on the level
+    :param frames: Number of frames to run
+    :param dt: Simulated milliseconds per frame. By default one frame at FPS, sped up by TIME_SCALE.
+    :return: dict of results
+    """
+
+    if dt is None:
+        dt = 1000 / settings.FPS * settings.TIME_SCALE
+
+    from game_state import GameState
+
+    animals = [SPECIES[i % len(SPECIES)] for i in range(number_of_animals)]
+    level = game.create_level(animals)
+    GameState.game_state_manager.add_state(level, BENCHMARK_LEVEL)
+    GameState.game_state_manager.set_state(BENCHMARK_LEVEL)
+
+    update_time = 0
+    draw_time = 0
+    games = 1
+    frames_start = time.perf_counter()
+    for i in range(frames):
+        start = time.perf_counter()
+        level.update(dt)
+        update_time += time.perf_counter() - start
+
+        # A lost game is started again, so that every frame measures a level that is being played
+        if GameState.game_state_manager.get_current_state_name() != BENCHMARK_LEVEL:
+            GameState.game_state_manager.set_state(BENCHMARK_LEVEL)
+            games += 1
+
+        start = time.perf_counter()
+        level.draw()
+        draw_time += time.perf_counter() - start
+
+    GameState.wait_for_render_thread()
+    frame_time = time.perf_counter() - frames_start
+
+    return {"animals": number_of_animals,
+            "games": games,
+            "drawn sprites": len(level._all_sprites),
+            "updated sprites": len(level._active_sprites),
+            "update ms": 1000 * update_time / frames,
+            "draw ms": 1000 * draw_time / frames,
+            "frame ms": 1000 * frame_time / frames}
+
+
+def main(animal_counts):
+    from main import Game
+    from game_state import GameState
+    from texture_renderer import TextureRenderer
+    from render_thread import RenderThread
+
+    pygame.init()
+    if settings.RENDER_BACKEND == "sdl2":
+        GameState.renderer = TextureRenderer.create("Benchmark", (settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT))
+
+    if GameState.renderer is not None:
+        screen = GameState.renderer.canvas
+    else:
+        screen = pygame.display.set_mode((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT))
+        if settings.PIPELINED_DRAWING:
+            GameState.render_thread = RenderThread()
+    random.seed(0)
+    game = Game(screen, SilentSoundInterface())
+
+    if GameState.renderer is not None:
+        print("drawing: sdl2")
+    else:
+        print("drawing: software" + (", pipelined" if GameState.render_thread is not None else ""))
+    print("animals  games  drawn sprites  updated sprites  update ms  draw ms  frame ms")
+    for number_of_animals in animal_counts:
+        result = run_level(game, number_of_animals)
+        print("{animals:>7} {games:>6} {drawn sprites:>14} {updated sprites:>16} {update ms:>10.2f} {draw ms:>8.2f} "
+              "{frame ms:>9.2f}".format(**result))
+
+    if GameState.render_thread is not None:
+        GameState.render_thread.stop()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main([int(count) for count in sys.argv[1:]] or ANIMAL_COUNTS)
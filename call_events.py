@@ -0,0 +1,65 @@
+import asyncio
+
+
+class CallEvents():
+    """
+    Animal calls heard by the audio classification, as awaitable events for the asyncio game loop (Game.run_async).
+    An audio input that can push its calls (set_call_listener) pushes each call when it is classified, so the game
+    does not poll for calls:
+
+        events.push("dog")          # from any thread, for example the classification thread
+        call = await events.get()   # in the game loop
+
+    Calls can also be iterated with "async for call in events". The game loop only runs its tasks while it waits
+    between the frames, so a pushed call reaches the level at the start of the next frame.
+    """
+
+    def __init__(self, loop=None):
+        """
+        :param loop: event loop of the game loop. By default the running loop.
+        """
+
+        self._loop = loop or asyncio.get_running_loop()
+        self._calls = asyncio.Queue()
+
+    def push(self, call):
+        """
+        Add a heard call. Can be called from any thread.
+        :param call: Name of the species whose call was heard
+        :return: -
+        """
+        self._loop.call_soon_threadsafe(self._calls.put_nowait, call)
+
+    async def get(self):
+        """
+        Wait for the next call.
+        :return: Name of the species whose call was heard
+        """
+        return await self._calls.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+
+async def forward_polled_calls(sound_event_interface, events, interval_ms, hears_calls):
+    """
+    Push the calls of a sound event interface that can only be polled (get_animal_call) to the call events. Used
+    for the interfaces that cannot push their calls themselves (set_call_listener). This is still polling: the task runs while the game loop waits between the frames, so the interface is polled at most
+    once every interval_ms and at least once a frame. Like the game levels, it is not polled while the player is
+    calling (the calling attribute of the interface is set) or while no game level is shown.
+    :param sound_event_interface: object with get_animal_call, like SoundEventInterface
+    :param events: CallEvents
+    :param interval_ms: Time between the polls in milliseconds
+    :param hears_calls: function that tells whether the current state handles calls
+    :return: -
+    """
+
+    while True:
+        if hears_calls() and not sound_event_interface.calling:
+            call = sound_event_interface.get_animal_call()
+            if call is not None:
+                events.push(call)
+        await asyncio.sleep(interval_ms / 1000)
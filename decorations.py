@@ -0,0 +1,206 @@
+import pygame
+from help_functions import world_size, world_to_screen
+
+
+class Decoration():
+    """
+    A small image that belongs to a character, like a shadow or an exclamation mark. Decorations are not sprites,
+    they are drawn all at once by a DecorationBatch. Shadows are drawn underneath the sprites and the other
+    decorations on top of them.
+
+    Decorations are moved in world coordinates (world_rect). The batch places them on the screen (rect) when they are
+    drawn.
+    """
+
+    __slots__ = ("image", "rect", "world_rect", "visible", "_drawn_rect", "_batch")
+
+    # Is the decoration drawn on top of the sprites (True) or underneath them (False)
+    on_top = True
+
+    def __init__(self, image):
+        self._batch = None
+        self.reset(image)
+
+    def reset(self, image):
+        """
+        Initialize the decoration. Used also when a released decoration is taken back into use from a SpritePool.
+        :param image: Image of the decoration
+        :return: -
+        """
+
+        self.image = image
+        self.rect = image.get_rect()
+        self.world_rect = pygame.Rect((0, 0), world_size(image))
+        self.visible = 0
+        # Area of the screen where the decoration was drawn last time
+        self._drawn_rect = None
+
+    def kill(self):
+        """
+        Remove the decoration from its batch, so it is not drawn anymore.
+        :return: -
+        """
+        if self._batch is not None:
+            self._batch.remove(self)
+
+    def alive(self):
+        return self._batch is not None
+
+    def snapshot(self, values):
+        """
+        Append the visibility and the place of the decoration to the values of a level snapshot.
+        :param values: array of numbers
+        :return: -
+        """
+        values.extend((self.visible, self.world_rect.x, self.world_rect.y))
+
+    def restore(self, values):
+        """
+        Take the visibility and the place of the decoration from the values of a level snapshot.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.visible = int(next(values))
+        self.world_rect.topleft = (int(next(values)), int(next(values)))
+
+
+class DecorationBatch():
+    """
+    Draws the decorations of a game level. Shadows are drawn on a ground surface (background + shadows), which is
+    used as the background of the sprite group, so they end up underneath the sprites. The other decorations are
+    drawn on the screen after the sprites.
+    """
+
+    def __init__(self):
+        self._under = []
+        self._on_top = []
+        # Areas of removed decorations that must be cleared: list of (rect, on_top)
+        self._removed = []
+        self._background = None
+        self.ground = None
+        # Are the shadows drawn. Set the background again after changing this, so the old shadows are removed.
+        self.draw_shadows = True
+
+    def set_background(self, background):
+        """
+        Set the background image. The shadows are drawn again on a copy of it.
+        :param background: Background image of the level
+        :return: -
+        """
+
+        self._background = background
+        self.ground = background.copy()
+        for decoration in self._under:
+            decoration._drawn_rect = None
+
+    def add(self, decoration):
+        decoration._batch = self
+        decoration._drawn_rect = None
+        if decoration.on_top:
+            self._on_top.append(decoration)
+        else:
+            self._under.append(decoration)
+
+    def remove(self, decoration):
+        if decoration.on_top:
+            self._on_top.remove(decoration)
+        else:
+            self._under.remove(decoration)
+
+        if decoration._drawn_rect is not None:
+            self._removed.append((decoration._drawn_rect, decoration.on_top))
+            decoration._drawn_rect = None
+        decoration._batch = None
+
+    def decorations(self):
+        """
+        Return a list of all decorations in the batch.
+        :return: list of Decoration
+        """
+        return self._under + self._on_top
+
+    def visible(self, on_top):
+        """
+        Return the visible decorations that are drawn on top of the sprites or underneath them.
+        :param on_top: True for the decorations on top, False for the shadows
+        :return: list of Decoration
+        """
+        if not on_top and not self.draw_shadows:
+            return []
+        return [decoration for decoration in (self._on_top if on_top else self._under) if decoration.visible]
+
+    def place_on_screen(self):
+        """
+        Place the visible decorations on the screen (rect) according to their places in the game world.
+        :return: -
+        """
+
+        for decoration in self._under + self._on_top:
+            if decoration.visible:
+                decoration.rect.topleft = world_to_screen(decoration.world_rect.topleft)
+                decoration.rect.size = decoration.image.get_size()
+
+    def forget_removed(self):
+        """
+        Forget the areas of the removed decorations. Used when the decorations are drawn without the ground surface
+        (SDL renderer). The ground must be set again with set_background before it is used.
+        :return: -
+        """
+        self._removed.clear()
+
+    def prepare(self, sprites):
+        """
+        Draw the shadows on the ground surface and tell the sprite group which areas of the screen have to be repainted
+        because decorations have moved, appeared or disappeared. Call before drawing the sprite group.
+        :param sprites: LayeredDirty group whose background is the ground surface
+        :return: -
+        """
+
+        repaint_rect = sprites.repaint_rect
+        self.place_on_screen()
+
+        for rect, on_top in self._removed:
+            if not on_top:
+                self.ground.blit(self._background, rect, rect)
+            repaint_rect(rect)
+        self._removed.clear()
+
+        # Shadows: clear all old shadows and draw the visible ones again, so overlapping shadows stay correct
+        shadows = self._under if self.draw_shadows else []
+        old_rects = [decoration._drawn_rect for decoration in shadows if decoration._drawn_rect is not None]
+        self.ground.blits([(self._background, rect, rect) for rect in old_rects], False)
+        self.ground.blits([(decoration.image, decoration.rect) for decoration in shadows if decoration.visible],
+                          False)
+
+        # Only the areas of moved shadows have changed on the ground
+        for decoration in shadows:
+            drawn_rect = decoration._drawn_rect
+            if decoration.visible:
+                if drawn_rect != decoration.rect:
+                    if drawn_rect is not None:
+                        repaint_rect(drawn_rect)
+                    repaint_rect(decoration.rect)
+                    decoration._drawn_rect = decoration.rect.copy()
+            elif drawn_rect is not None:
+                repaint_rect(drawn_rect)
+                decoration._drawn_rect = None
+
+        # Decorations on top are drawn over the sprites every frame, so their old areas are always repainted
+        for decoration in self._on_top:
+            if decoration._drawn_rect is not None:
+                repaint_rect(decoration._drawn_rect)
+                decoration._drawn_rect = None
+
+    def draw(self, surface):
+        """
+        Draw the decorations that are on top of the sprites. Call after drawing the sprite group.
+        :param surface: Surface to draw on
+        :return: list of changed areas
+        """
+
+        visible = [decoration for decoration in self._on_top if decoration.visible]
+        for decoration in visible:
+            decoration._drawn_rect = decoration.rect.copy()
+
+        return surface.blits([(decoration.image, decoration.rect) for decoration in visible])
@@ -0,0 +1,203 @@
+"""
+Waiting for the next frame in the game loop. Clock.tick sleeps, and the sleep of the operating system is not exact, so
+the frames come at uneven intervals and the uneven dt shows as judder in the movement. The pacing modes trade CPU time
+for even frames:
+
+    "tick"       Clock.tick: sleeps, uses little CPU, the least even frames
+    "busy_loop"  Clock.tick_busy_loop: busy-waits, the most even frames, keeps a core busy
+    "hybrid"     sleeps until FRAME_PACING_SPIN_MS before the frame and busy-waits the rest, so at most
+                 FRAME_PACING_SPIN_MS of CPU time is spent waiting in each frame
+
+The asyncio game loop (tick_async) only sleeps in all modes, so that the other tasks can run while it waits.
+
+Usage: python frame_pacing.py [seconds] runs each mode and prints the jitter of the frame intervals.
+"""
+
+import sys
+import time
+import asyncio
+from collections import deque
+import pygame
+import settings
+
+MODES = ["tick", "busy_loop", "hybrid"]
+# Upper limits of the jitter histogram bins in milliseconds. The jitter is how far a frame interval is from 1 / FPS.
+JITTER_BINS = [0.25, 0.5, 1, 2, 4, 8, float("inf")]
+
+
+class FramePacer():
+    """
+    Waits for the next frame, measures the frame intervals and gives the dt of the frames, optionally smoothed.
+    """
+
+    def __init__(self, fps, mode=None, spin_ms=None, smoothing_frames=None):
+        """
+        :param fps: Frames per second
+        :param mode: "tick", "busy_loop" or "hybrid". By default settings.FRAME_PACING.
+        :param spin_ms: Busy-wait time at most in each frame in the hybrid mode. By default
+                        settings.FRAME_PACING_SPIN_MS.
+        :param smoothing_frames: Number of frames averaged for dt. By default settings.DT_SMOOTHING_FRAMES.
+        """
+
+        self.fps = fps
+        self.mode = settings.FRAME_PACING if mode is None else mode
+        if self.mode not in MODES:
+            print("Unknown frame pacing", self.mode, "using tick")
+            self.mode = "tick"
+        self._spin_time = (settings.FRAME_PACING_SPIN_MS if spin_ms is None else spin_ms) / 1000
+        smoothing_frames = settings.DT_SMOOTHING_FRAMES if smoothing_frames is None else smoothing_frames
+
+        self._clock = pygame.time.Clock()
+        self._last_time = time.perf_counter()
+        # Time when the next frame is due in the hybrid mode
+        self._deadline = self._last_time
+        # dt of the latest frames for smoothing
+        self._dts = deque(maxlen=max(1, smoothing_frames))
+
+        # Number of frame intervals in each bin of JITTER_BINS
+        self.histogram = [0] * len(JITTER_BINS)
+        self._frames = 0
+        self._jitter_sum = 0
+        self._largest_jitter = 0
+        self._waited_time = 0
+        self._cpu_time_waiting = 0
+
+    def tick(self):
+        """
+        Wait until the next frame is due.
+        :return: milliseconds since the previous frame, averaged over the latest frames if dt smoothing is on
+        """
+
+        wait_start = time.perf_counter()
+        wait_start_cpu = time.process_time()
+        if self.mode == "tick":
+            dt = self._clock.tick(self.fps)
+        elif self.mode == "busy_loop":
+            # The measured interval is more exact than the whole milliseconds returned by the clock
+            self._clock.tick_busy_loop(self.fps)
+            dt = None
+        else:
+            self._wait_hybrid()
+            dt = None
+        return self._finish_tick(wait_start, wait_start_cpu, dt)
+
+    async def tick_async(self):
+        """
+        Like tick, but sleeps with asyncio, so other tasks run while the game loop waits for the next frame. Nothing
+        is busy-waited in any mode, because a busy-wait would block the other tasks of the event loop.
+        :return: milliseconds since the previous frame, averaged over the latest frames if dt smoothing is on
+        """
+
+        wait_start = time.perf_counter()
+        wait_start_cpu = time.process_time()
+
+        self._next_deadline()
+        # The sleep may wake up early, so it is repeated until the deadline
+        sleep_time = self._deadline - time.perf_counter()
+        while sleep_time > 0:
+            await asyncio.sleep(sleep_time)
+            sleep_time = self._deadline - time.perf_counter()
+        return self._finish_tick(wait_start, wait_start_cpu, None)
+
+    def _finish_tick(self, wait_start, wait_start_cpu, dt):
+        """
+        Measure the frame interval and the waiting and return the dt of the frame.
+        :param dt: dt given by the pygame clock, or None for the measured interval
+        """
+
+        now = time.perf_counter()
+        self._waited_time += now - wait_start
+        self._cpu_time_waiting += time.process_time() - wait_start_cpu
+
+        interval = (now - self._last_time) * 1000
+        self._last_time = now
+        self._measure(interval)
+        if dt is None:
+            dt = interval
+
+        self._dts.append(dt)
+        if len(self._dts) == 1:
+            return dt
+        return sum(self._dts) / len(self._dts)
+
+    def _wait_hybrid(self):
+        """
+        Sleep until a moment before the frame is due and busy-wait the rest of the time.
+        """
+
+        self._next_deadline()
+        # The sleep may wake up early, so it is repeated until the busy-wait is at most FRAME_PACING_SPIN_MS
+        sleep_time = self._deadline - time.perf_counter() - self._spin_time
+        while sleep_time > 0:
+            time.sleep(sleep_time)
+            sleep_time = self._deadline - time.perf_counter() - self._spin_time
+        while time.perf_counter() < self._deadline:
+            pass
+
+    def _next_deadline(self):
+        frame_time = 1 / self.fps
+        self._deadline += frame_time
+        # Behind by more than a frame: start counting the frames from now instead of hurrying to catch up
+        now = time.perf_counter()
+        if self._deadline < now - frame_time:
+            self._deadline = now
+
+    def restart(self):
+        """
+        Start measuring the time again without waiting, for example after the game loop has slept waiting for events.
+        The time since the previous frame is not measured or smoothed.
+        :return: -
+        """
+
+        self._clock.tick()
+        self._last_time = time.perf_counter()
+        self._deadline = self._last_time
+        self._dts.clear()
+
+    def _measure(self, interval):
+        jitter = abs(interval - 1000 / self.fps)
+        self._frames += 1
+        self._jitter_sum += jitter
+        self._largest_jitter = max(self._largest_jitter, jitter)
+        for i, limit in enumerate(JITTER_BINS):
+            if jitter <= limit:
+                self.histogram[i] += 1
+                break
+
+    def print_statistics(self):
+        """
+        Print the histogram of the frame interval jitter and how much CPU time was spent waiting.
+        :return: -
+        """
+
+        frames = max(1, self._frames)
+        print("Frame pacing:", self.mode, "at", self.fps, "FPS,", self._frames, "frames")
+        print("jitter (ms)   frames       %")
+        lower = 0
+        for limit, count in zip(JITTER_BINS, self.histogram):
+            label = "{:g}-{:g}".format(lower, limit) if limit != float("inf") else "> {:g}".format(lower)
+            print("{:<11} {:>8} {:>7.1f}".format(label, count, 100 * count / frames))
+            lower = limit
+        print("average jitter {:.2f} ms, largest {:.2f} ms".format(self._jitter_sum / frames, self._largest_jitter))
+        if self._waited_time > 0:
+            print("CPU use while waiting {:.0f}%".format(100 * self._cpu_time_waiting / self._waited_time))
+
+
+def main(seconds=2.0):
+    """
+    Run each pacing mode without drawing anything and print the statistics.
+    """
+
+    pygame.init()
+    for mode in MODES:
+        pacer = FramePacer(settings.FPS, mode)
+        pacer.restart()
+        for frame in range(int(seconds * settings.FPS)):
+            pacer.tick()
+        pacer.print_statistics()
+        print()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 2.0)
@@ -0,0 +1,354 @@
+"""
+Environments for bots playing the game levels without a window, in the style of Gym. reset() starts a new game and
+step(action) simulates one frame:
+
+    env = GameEnv(["dog", "cat"])
+    observation, info = env.reset(seed=1)
+    observation, reward, terminated, truncated, info = env.step((1, 0, "dog"))
+
+An action is (x direction, y direction, called species). The directions are -1, 0 or 1 and the called species is
+None when the player does not call. The observation is the dict returned by GameLevel.observe, in which the species
+are the ids of the species manifest (species.species_id gives the id of a name).
+
+The reward is 1 for each animal given to its owner and -1 for each lost life. An episode ends (terminated) when the
+level is won or lost, and is cut (truncated) after max_steps steps.
+
+snapshot() and restore(snapshot) save and restore the state of an episode, so a bot can try several actions from
+the same state without replaying the episode from reset.
+
+VectorGameEnv steps several environments at once, in this process or each in a process of its own. Each
+environment has a game state manager of its own, so the levels do not affect each other or the game.
+
+Usage: python game_env.py [number of environments] measures the steps per second.
+"""
+
+import os
+import sys
+import time
+import random
+import multiprocessing
+
+# Run without a window unless a video driver has been chosen
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+import pygame
+import settings
+from sound_interfaces import SilentSoundInterface
+from game_state import GameStateManager
+
+# Name of the level in the game state manager of an environment
+LEVEL = "level"
+LEVELS = [["dog", "cat"], ["dog", "cat", "pig"], ["dog", "cat", "pig", "sheep"], ["dog", "cat", "pig", "sheep", "cow"]]
+
+# Game used for loading the images, one for each process
+_game = None
+
+
+def _load_game():
+    """
+    Load the images of the game once in a process. Nothing is added to the game state manager of the game.
+    :return: Game
+    """
+
+    global _game
+    if _game is None:
+        from main import Game
+
+        pygame.init()
+        if pygame.display.get_surface() is None:
+            pygame.display.set_mode((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT))
+        _game = Game(pygame.display.get_surface(), SilentSoundInterface(), add_levels=False)
+    return _game
+
+
+class BotSoundInterface(SilentSoundInterface):
+    """
+    Sound event interface for bots. The call of the action is heard like a call from the microphone.
+    """
+
+    def __init__(self):
+        super(BotSoundInterface, self).__init__()
+        self.next_call = None
+
+    def get_animal_call(self):
+        call = self.next_call
+        self.next_call = None
+        return call
+
+
+class GameEnd():
+    """
+    Takes the place of the menus shown when a game ends. Nothing is drawn.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.previous_state_name = None
+
+    def set_text(self, text):
+        self.text = text
+
+    def start_new(self):
+        pass
+
+    def leave(self):
+        pass
+
+
+class GameEnv():
+
+    def __init__(self, animals, max_steps=None, dt=None):
+        """
+        A game level for a bot.
+        :param animals: list of the names of the species of the animals on the level, one item for each animal
+        :param max_steps: Number of steps after which an episode is cut. None for no limit.
+        :param dt: Simulated milliseconds per step. By default one frame at FPS.
+        """
+
+        self.max_steps = max_steps
+        self.dt = 1000 / settings.FPS if dt is None else dt
+        self._steps = 0
+
+        self._sound_event_interface = BotSoundInterface()
+        self._keys = {pygame.K_LEFT: False, pygame.K_RIGHT: False, pygame.K_UP: False, pygame.K_DOWN: False}
+
+        self.level = _load_game().create_level(animals, self._sound_event_interface)
+        # The level is drawn only by render, on a surface of its own
+        self.level.screen = pygame.Surface((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT))
+        self.level.pressed_keys = self._pressed_keys
+
+        self._state_manager = GameStateManager()
+        self._state_manager.add_state(self.level, LEVEL)
+        self._state_manager.add_state(GameEnd(), "game_ended_menu")
+        self._state_manager.add_state(GameEnd(), "next_level_menu")
+        self.level.game_state_manager = self._state_manager
+
+    def _pressed_keys(self):
+        return self._keys
+
+    def reset(self, seed=None):
+        """
+        Start a new game.
+        :param seed: Seed for the random number generator. The levels use the random module, so the seed affects
+                     all environments in the process.
+        :return: observation, info
+        """
+
+        if seed is not None:
+            random.seed(seed)
+
+        for key in self._keys:
+            self._keys[key] = False
+        self._sound_event_interface.next_call = None
+        self._steps = 0
+        self._state_manager.set_state(LEVEL)
+
+        return self.level.observe(), {}
+
+    def step(self, action):
+        """
+        Simulate one frame.
+        :param action: (x direction, y direction, called species or None)
+        :return: observation, reward, terminated, truncated, info
+        """
+
+        x_direction, y_direction, call = action
+        self._keys[pygame.K_LEFT] = x_direction < 0
+        self._keys[pygame.K_RIGHT] = x_direction > 0
+        self._keys[pygame.K_UP] = y_direction < 0
+        self._keys[pygame.K_DOWN] = y_direction > 0
+        self._sound_event_interface.next_call = call
+
+        level = self.level
+        lives = level.lives_left()
+        delivered = level.delivered_animals
+
+        level.update(self.dt)
+        self._steps += 1
+
+        state_name = self._state_manager.get_current_state_name()
+        terminated = state_name != LEVEL
+        truncated = not terminated and self.max_steps is not None and self._steps >= self.max_steps
+        reward = (level.delivered_animals - delivered) - (lives - level.lives_left())
+        info = {"won": state_name == "next_level_menu"} if terminated else {}
+
+        return level.observe(), reward, terminated, truncated, info
+
+    def snapshot(self):
+        """
+        Save the state of the episode.
+        :return: (LevelSnapshot, number of steps)
+        """
+        return self.level.snapshot(), self._steps
+
+    def restore(self, snapshot):
+        """
+        Return to a state saved with snapshot, also after the episode has ended. Only states of the current episode
+        can be restored.
+        :param snapshot: value returned by snapshot
+        :return: observation
+        """
+
+        level_snapshot, self._steps = snapshot
+        self.level.restore(level_snapshot)
+        self._sound_event_interface.next_call = None
+        if self._state_manager.get_current_state_name() != LEVEL:
+            self._state_manager.return_to_state(LEVEL)
+        return self.level.observe()
+
+    def render(self):
+        """
+        Draw the level.
+        :return: Surface the level was drawn on
+        """
+
+        self.level.redraw_whole_screen()
+        self.level.draw()
+        return self.level.screen
+
+    def close(self):
+        self.level.sound_effect_interface.stop_audio()
+
+
+def _step_and_reset(env, action):
+    """
+    Step an environment and start a new game if the episode ended. The last observation of the ended episode is
+    given in the info as "final_observation".
+    """
+
+    observation, reward, terminated, truncated, info = env.step(action)
+    if terminated or truncated:
+        info = dict(info, final_observation=observation)
+        observation, reset_info = env.reset()
+    return observation, reward, terminated, truncated, info
+
+
+def _run_worker(connection, animals, max_steps, dt):
+    """
+    Run an environment in a process of its own. Commands are received as (command, data).
+    """
+
+    env = GameEnv(animals, max_steps, dt)
+    while True:
+        command, data = connection.recv()
+        if command == "reset":
+            connection.send(env.reset(data))
+        elif command == "step":
+            connection.send(_step_and_reset(env, data))
+        elif command == "close":
+            env.close()
+            break
+    connection.close()
+
+
+class VectorGameEnv():
+
+    def __init__(self, levels, max_steps=None, dt=None, processes=False):
+        """
+        Several game levels stepped together. A level whose episode ends is started again automatically.
+        :param levels: list of animal lists (see GameEnv), one environment for each
+        :param max_steps: Number of steps after which an episode is cut. None for no limit.
+        :param dt: Simulated milliseconds per step. By default one frame at FPS.
+        :param processes: Run each environment in a process of its own. The processes are started with "spawn",
+                          so the main module of the program must be importable without side effects.
+        """
+
+        self.num_envs = len(levels)
+        self._envs = []
+        self._connections = []
+        self._processes = []
+
+        if processes:
+            context = multiprocessing.get_context("spawn")
+            for animals in levels:
+                connection, worker_connection = context.Pipe()
+                process = context.Process(target=_run_worker, args=(worker_connection, animals, max_steps, dt),
+                                          daemon=True)
+                process.start()
+                worker_connection.close()
+                self._connections.append(connection)
+                self._processes.append(process)
+        else:
+            self._envs = [GameEnv(animals, max_steps, dt) for animals in levels]
+
+    def reset(self, seed=None):
+        """
+        Start new games in all environments.
+        :param seed: Seed for the random number generators. In processes environment i gets seed + i, in this process
+                     the environments share the random number generator seeded with the seed.
+        :return: list of observations, list of infos
+        """
+
+        if self._connections:
+            for i, connection in enumerate(self._connections):
+                connection.send(("reset", None if seed is None else seed + i))
+            results = [connection.recv() for connection in self._connections]
+        else:
+            if seed is not None:
+                random.seed(seed)
+            results = [env.reset() for env in self._envs]
+
+        return [result[0] for result in results], [result[1] for result in results]
+
+    def step(self, actions):
+        """
+        Simulate one frame in all environments.
+        :param actions: list of actions, one for each environment
+        :return: lists of observations, rewards, terminated, truncated and infos
+        """
+
+        if self._connections:
+            for connection, action in zip(self._connections, actions):
+                connection.send(("step", action))
+            results = [connection.recv() for connection in self._connections]
+        else:
+            results = [_step_and_reset(env, action) for env, action in zip(self._envs, actions)]
+
+        return tuple(list(values) for values in zip(*results))
+
+    def close(self):
+        for connection in self._connections:
+            connection.send(("close", None))
+        for process in self._processes:
+            process.join()
+        for env in self._envs:
+            env.close()
+        self._connections = []
+        self._processes = []
+        self._envs = []
+
+
+def random_actions(number_of_actions, species):
+    """
+    Return random actions: the player walks around and sometimes calls an animal.
+    :param number_of_actions: Number of actions
+    :param species: list of the species that can be called
+    :return: list of actions
+    """
+
+    return [(random.randint(-1, 1), random.randint(-1, 1), random.choice(species) if random.random() < 0.02 else None)
+            for i in range(number_of_actions)]
+
+
+def main(number_of_envs, steps=3000):
+    random.seed(0)
+    levels = [LEVELS[i % len(LEVELS)] for i in range(number_of_envs)]
+
+    print("environments  processes  steps/s")
+    for processes in (False, True):
+        vector_env = VectorGameEnv(levels, processes=processes)
+        vector_env.reset(seed=0)
+        actions = [random_actions(number_of_envs, LEVELS[-1]) for i in range(steps // number_of_envs)]
+
+        start = time.perf_counter()
+        for step_actions in actions:
+            vector_env.step(step_actions)
+        elapsed = time.perf_counter() - start
+        vector_env.close()
+
+        print("{:>12} {:>10} {:>8.0f}".format(number_of_envs, "yes" if processes else "no",
+                                             len(actions) * number_of_envs / elapsed))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
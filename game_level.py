@@ -1,11 +1,38 @@
+from array import array
+from collections import namedtuple
 import pygame
 from pygame.locals import *
 from help_functions import *
-from game_sprites import Animal, Player, Circle, Bubble, Owner, Shadow
+from game_sprites import Animal, Player, Circle, Bubble, Owner, Shadow, prepare_bubble_images, clear_bubble_images
+from game_sprites import MOVE_IN_PLAY_AREA, MOVE_WITH_OWNER, WAIT_FOR_ANIMAL, GATE_CLOSED, GATE_OPEN, STATE_NAMES
 from ui_sprites import Paw, Fence, Exclamation, Gate, Heard
 from game_state import GameState
+from render_thread import RenderList
+from sprite_pool import SpritePool
+from decorations import DecorationBatch
+from timers import TimerScheduler, AnimationClock
+from spatial import SpatialGrid
+from species import all_species, species_id
+from quality import SHADOWS, ANIMATION_RATE, CALL_CIRCLE
 import settings
 
+# State of a game level returned by GameLevel.snapshot. The numbers are kept in arrays, so a snapshot is small and
+# quick to take. Only the game that was running when the snapshot was taken can be restored.
+#   game: number of the game (start_new) of the level
+#   level: lives, delivered animals, timer time, timer sequence number, animation time, animation tick
+#   animals: for each animal: is on the level, has marks, are its exclamation mark, question mark and shadow on the
+#            level, does it follow the owner, followed by the values of Animal.snapshot
+#   player: values of Player.snapshot
+#   owner: image index, bubble style, wanted species, index of the animal it got (-1 for none), are its bubble,
+#          exclamation mark and shadow on the level, followed by the values of Owner.snapshot
+#   gate: values of Gate.snapshot
+#   paws: is each paw active
+#   sprites: drawing and update order of the sprites, as indexes of the sprites created by start_new (-1 is the owner)
+#   grid: tuple of (cell, tuple of animal indexes) of the broadphase grid, in the order of the animals in each cell
+#   random_state: state of the random module
+LevelSnapshot = namedtuple("LevelSnapshot", ["game", "level", "animals", "player", "owner", "gate", "paws", "sprites",
+                                             "grid", "random_state"])
+
 
 class GameLevel(GameState):
     def __init__(self, animals, background, player_images, animal_images, bubble_images, owner_images, paw_images,
@@ -13,10 +40,10 @@ class GameLevel(GameState):
         """
         A single level on the game.
 
-        :param animals:
+        :param animals: list of the species ids of the animals on the level, one item for each animal
         :param background: The background image for the game level
         :param player_image: list of images for player animation
-        :param animal_images: dict containing a list of animal images for each animal
+        :param animal_images: dict containing a list of animal images for each loaded species, key: species id
         :param bubble_images: list of different speech bubble images
         :param owner_images: list of different owner images
         :param paw_images: list containing images for active and deactive paw
@@ -47,16 +74,40 @@ class GameLevel(GameState):
         self._gate_image = gate_image
         self._shadow_image = shadow_image
 
-        # Containers for the sprites
+        # Containers for the sprites. All sprites are drawn, but only the active ones are updated.
         self._all_sprites = None
+        self._active_sprites = None
+        # Shadows, marks and speech bubbles of the characters
+        self._decorations = DecorationBatch()
+        # Timers for hiding the marks and speech bubbles, run in simulation time
+        self.timers = TimerScheduler()
+        # Frames of the walking animations, run in simulation time
+        self.animation_clock = AnimationClock()
         self._animal_sprites = None
+        # All animals of the current game in the order they were created, also the ones that have left the level
+        self._animals = []
+        # Sprites created by start_new, in the order they were added
+        self._level_sprites = []
+        # Number of games started, for checking that a snapshot belongs to the current game
+        self._games_started = 0
+        # Broadphase index of the animals moving in the play area, for gate, border and call checks
+        self._animal_grid = SpatialGrid(settings.SPATIAL_GRID_CELL_SIZE)
         self._paw_sprites = None
 
         self._animals_on_level = animals
+        self._species_on_level = sorted(set(animals))
+        # Function loading the images of a list of species ids. The images of the species are loaded when the level
+        # is started, not when the level is created.
+        self.species_loader = None
+        # Species id called by each cheat key
+        self._cheat_keys = {pygame.key.key_code(species.cheat_key): species.id for species in all_species()
+                            if species.cheat_key}
 
         # Sprites
         self._life_symbols = []
         self._animal_sprites_grouped_dict = {}
+        # The animation images of each species facing right, shared by the animals of the species
+        self._flipped_animal_images = {}
         self._player = None
         self._call_circle = None
         self._owner_sprite = None
@@ -66,6 +117,19 @@ class GameLevel(GameState):
         self.pause = False
         self.remaining_lives = 0
         self.sound_effect_interface = sound_event_interface
+        # Poll the sound event interface for calls every frame. The asyncio game loop pushes the calls to hear_call
+        # instead.
+        self.poll_calls = True
+        # Function returning the state of the keys that move the player. Bots replace it to move the player.
+        self.pressed_keys = pygame.key.get_pressed
+        # Number of animals given to their owners in the current game
+        self.delivered_animals = 0
+
+        # Owners, bubbles and the marks around the characters are reused between customers and restarts
+        self.sprite_pool = SpritePool()
+
+        # [times left, total time in ms] for each state of the animals, owners and the gate
+        self.state_statistics = {}
 
     def give_scaled_graphics(self, background, player_images, animal_images, bubble_images, owner_images, paw_images,
                              fence_images, gate_image):
@@ -73,7 +137,7 @@ class GameLevel(GameState):
         Give the level new images which are resized to the new window size. Also repositions the elements on the screen.
         :param background: Background image of the game level
         :param player_image: Image for the player
-        :param animal_images: dict containing a list of animal images for each animal
+        :param animal_images: dict containing a list of animal images for each loaded species, key: species id
         :param bubble_images: list of images for speech bubbles
         :param owner_images: list of owner images
         :param paw_images: list of paw images [active paw, deactive paw]
@@ -96,20 +160,28 @@ class GameLevel(GameState):
         self._gate_image = gate_image
         self._owner_images = owner_images
 
+        self._decorations.set_background(self.background)
+
+        self._flipped_animal_images = {}
+
+        # Bubble images of the old size are not used anymore
+        clear_bubble_images(self._bubble_images)
+        prepare_bubble_images(self._bubble_images, self._animal_images)
+
         # If level has not been started, these do not exist and there is no reason to relocate
         try:
 
             for animal in self._animal_sprites_grouped_dict:
                 for sprite in self._animal_sprites_grouped_dict[animal]:
-                    sprite.scale(self._animal_images[animal])
+                    sprite.scale(self._animal_images[animal], self._flipped_images(animal))
 
-            self._player.scale(self._player_images, self._bubble_images[0], self._animal_images)
-            self._owner_sprite.scale(self._owner_images[self._owner_sprite.image_id], self._bubble_images[0],
+            self._player.scale(self._player_images, self._bubble_images, self._animal_images)
+            self._owner_sprite.scale(self._owner_images[self._owner_sprite.image_id], self._bubble_images,
                                      self._animal_images)
 
             for animal in self._animal_sprites_grouped_dict:
                 for sprite in self._animal_sprites_grouped_dict[animal]:
-                    sprite.scale(self._animal_images[animal])
+                    sprite.scale(self._animal_images[animal], self._flipped_images(animal))
 
             for paw in self._paw_sprites:
                 paw.scale(self._UI_paw_active, self._UI_paw_deactive)
@@ -120,6 +192,10 @@ class GameLevel(GameState):
             self._fences["front"].scale(self._fence_front_image)
 
             self._gate_sprite.scale(self._gate_image)
+
+            # Only the screen has changed, the game world stays the same
+            for sprite in self._all_sprites:
+                sprite.place_on_screen()
         except AttributeError:
             pass
 
@@ -129,70 +205,90 @@ class GameLevel(GameState):
         :return: -
         """
 
+        self._load_species(self._species_on_level)
+        self.wait_for_render_thread()
+
         # Reset background
         self.screen.blit(self.background, (0, 0))
-        pygame.display.update()
+        self._decorations.set_background(self.background)
+        self.redraw_background = True
+        self.update_display([])
 
         self.remaining_lives = NUMBER_OF_LIVES - 1
+        self.delivered_animals = 0
+        self._games_started += 1
+
+        # Sprites of the previous game are reused
+        if self._all_sprites is not None:
+            self._release_sprites()
+
+        # Timers of the previous game are dropped
+        self.timers = TimerScheduler()
+        self.animation_clock = AnimationClock()
 
         # Group containers for sprites
         # https://www.pygame.org/docs/ref/sprite.html#pygame.sprite.RenderUpdates
         self._animal_sprites = pygame.sprite.LayeredDirty()
         self._all_sprites = pygame.sprite.LayeredDirty()
+        self._active_sprites = pygame.sprite.Group()
         self._paw_sprites = pygame.sprite.LayeredDirty()
-        self._animal_sprites_grouped_dict = {animal: pygame.sprite.LayeredDirty() for animal in self._animal_images.keys()}
+        self._animal_sprites_grouped_dict = {species: pygame.sprite.LayeredDirty() for species in self._species_on_level}
+        self._animals = []
 
         # Play area fences
         fence_back = Fence(self._fence_back_image, settings.FENCE_BACK)
-        self._all_sprites.add(fence_back)
+        self._add_sprite(fence_back)
         fence_left = Fence(self._fence_left_image, settings.FENCE_LEFT)
-        self._all_sprites.add(fence_left)
+        self._add_sprite(fence_left)
         fence_right = Fence(self._fence_right_image, settings.FENCE_RIGHT)
-        self._all_sprites.add(fence_right)
+        self._add_sprite(fence_right)
 
         # Create animals
         for species in self._animals_on_level:
-            size = self._animal_images[species][0].get_size()  # return tuple (width,height)
+            size = world_size(self._animal_images[species][0])  # return tuple (width,height)
 
             x = random.randint(size[0], play_area.right - size[0])
             y = random.randint(size[1], play_area.bottom - size[1])
             velocity = get_random_velocity()
 
-            # Local copies so that if there would ever be several animals of the same species
-            # the flips would go correctly
-            images = self._animal_images[species].copy()
-            if velocity[0] > 0:
-                images = [pygame.transform.flip(img, True, False) for img in images]
-
-            animal_exclamation = Exclamation(self._exclamation_image)
-            heard = Heard(self._heard_image)
-            shadow = Shadow(self._shadow_image)
-            new_animal = Animal(velocity, species, animal_exclamation, heard, shadow, Vector2(x, y),images)
-
+            animal_exclamation = self.sprite_pool.acquire(Exclamation, self._exclamation_image)
+            heard = self.sprite_pool.acquire(Heard, self._heard_image)
+            shadow = self.sprite_pool.acquire(Shadow, self._shadow_image)
+            # Animals of the same species walk with different frames
+            phase = len(self._animal_sprites_grouped_dict[species])
+            new_animal = Animal(velocity, species, animal_exclamation, heard, shadow, Vector2(x, y),
+                                self._animal_images[species], self.timers, self.animation_clock, phase,
+                                self._flipped_images(species))
+
+            new_animal.add_listener(self._on_animal_state_change)
+            new_animal.gate_listener = self._on_animal_hit_gate
+            new_animal.grid = self._animal_grid
             self._animal_sprites.add(new_animal)
-            self._all_sprites.add(shadow)
-            self._all_sprites.add(new_animal)
-            self._all_sprites.add(animal_exclamation)
-            self._all_sprites.add(heard)
+            self._animals.append(new_animal)
+            self._decorations.add(shadow)
+            self._add_sprite(new_animal)
+            self._decorations.add(animal_exclamation)
+            self._decorations.add(heard)
             self._animal_sprites_grouped_dict[species].add(new_animal)
 
         # Player starting position (in the middle of the play area)
         starting_position = Vector2(play_area.centerx, play_area.centery)
 
         # Create circle indicating call radius
-        self._call_circle = Circle(self._player_images[0].get_rect())
-        self._all_sprites.add(self._call_circle)
+        self._call_circle = Circle(pygame.Rect((0, 0), world_size(self._player_images[0])))
+        self._add_sprite(self._call_circle)
 
         # Create speech bubble for player
-        player_speech_bubble = Bubble(self._bubble_images[0], self._animal_images)
-        self._all_sprites.add(player_speech_bubble)
+        player_speech_bubble = self.sprite_pool.acquire(Bubble, self._bubble_images, 0, self._animal_images)
+        self._decorations.add(player_speech_bubble)
         
-        player_shadow = Shadow(self._shadow_image)
-        self._all_sprites.add(player_shadow)
+        player_shadow = self.sprite_pool.acquire(Shadow, self._shadow_image)
+        self._decorations.add(player_shadow)
 
         # Create player
-        self._player = Player(self._player_images, starting_position, PLAYER_SPEED, self._call_circle, player_speech_bubble, player_shadow)
-        self._all_sprites.add(self._player)
+        self._player = Player(self._player_images, starting_position, PLAYER_SPEED, self._call_circle, player_speech_bubble,
+                              player_shadow, self.timers, self.animation_clock, self.pressed_keys)
+        self._add_sprite(self._player)
 
         # Create owner
         self._create_owner()
@@ -203,94 +299,474 @@ class GameLevel(GameState):
         # Create UI paws
         for i in range(NUMBER_OF_LIVES):
             UI_paws = Paw(self._UI_paw_active, self._UI_paw_deactive, paw_position)
-            self._all_sprites.add(UI_paws)
+            self._add_sprite(UI_paws)
             self._paw_sprites.add(UI_paws)
             self._life_symbols.append(UI_paws)
-            paw_position[0] = paw_position[0] + int(1.05 * self._UI_paw_active.get_width())
+            paw_position[0] = paw_position[0] + int(1.05 * world_size(self._UI_paw_active)[0])
 
         # Front fence
         fence_front = Fence(self._fence_front_image, settings.FENCE_FRONT)
-        self._all_sprites.add(fence_front)
+        self._add_sprite(fence_front)
         self._fences = {"left": fence_left, "right": fence_right, "back": fence_back, "front": fence_front}
 
         # Gate for the play area
         self._gate_sprite = Gate(self._gate_image, (settings.SCREEN_WIDTH * 0.81, settings.SCREEN_HEIGHT * 0.35),
                                  self._owner_sprite)
-        self._all_sprites.add(self._gate_sprite)
+        self._gate_sprite.add_listener(self._on_gate_state_change)
+        self._add_sprite(self._gate_sprite)
+        self._level_sprites = self._all_sprites.sprites()
+
+        self._set_quality()
+        self._index_animals()
 
         # Start audio threads
         self.sound_effect_interface.start_threads()
 
+    def apply_quality(self):
+        """
+        Use the features of the current quality. The whole screen is drawn again.
+        :return: -
+        """
+
+        self._set_quality()
+        if self._all_sprites is not None:
+            # Removes the shadows from the ground or draws them again
+            self._decorations.set_background(self.background)
+            self.redraw_whole_screen()
+
+    def _set_quality(self):
+        self._decorations.draw_shadows = self.quality_enabled(SHADOWS)
+        if self.quality_enabled(ANIMATION_RATE):
+            self.animation_clock.frame_time = settings.ANIMATION_FRAME_TIME_MS
+        else:
+            self.animation_clock.frame_time = 2 * settings.ANIMATION_FRAME_TIME_MS
+        if self._call_circle is not None:
+            self._call_circle.visible = int(self.quality_enabled(CALL_CIRCLE))
+            self._call_circle.dirty = 1
+
+    def _flipped_images(self, species):
+        """
+        Return the animation images of a species facing right. They are flipped once and shared by all animals of the
+        species.
+        :param species: species id
+        :return: list of images
+        """
+
+        if species not in self._flipped_animal_images:
+            self._flipped_animal_images[species] = [flip_image(image) for image in self._animal_images[species]]
+        return self._flipped_animal_images[species]
+
+    def _add_sprite(self, sprite):
+        """
+        Add a sprite to the level. Sprites whose class sets ticks to False are only drawn and never updated.
+        :param sprite: sprite to add
+        :return: -
+        """
+
+        self._all_sprites.add(sprite)
+        if getattr(sprite, "ticks", True):
+            self._active_sprites.add(sprite)
+
+    def _index_animals(self):
+        """
+        Put the animals moving in the play area to the broadphase grid.
+        :return: -
+        """
+
+        self._animal_grid.clear()
+        self._animal_grid.set_interior(settings.play_area, [settings.gate])
+        for animal in self._animal_sprites:
+            if animal.get_state() == MOVE_IN_PLAY_AREA:
+                self._animal_grid.insert(animal, animal.world_rect)
+
+    def _load_species(self, species_ids):
+        """
+        Load the images of the species that have not been loaded yet and create their bubble images.
+        :param species_ids: list of species ids
+        :return: -
+        """
+
+        missing = [species for species in species_ids if species not in self._animal_images]
+        if missing and self.species_loader is not None:
+            self.species_loader(missing)
+        prepare_bubble_images(self._bubble_images, self._animal_images)
+
+    def call_animals(self, species):
+        """
+        Make the player call the animals of a species. Only the animals in the grid cells under the call circle are
+        checked for collision with the circle.
+        :param species: The called species id
+        :return: -
+        """
+
+        if species is None:
+            return
+        # A species that is not on the level can be called, and its picture is shown in the speech bubble
+        if species not in self._animal_images:
+            self._load_species([species])
+            if species not in self._animal_images:
+                return
+
+        candidates = [animal for animal in self._animal_grid.query(self._call_circle.world_rect)
+                      if animal.species == species]
+        self._player.call_animal(species, candidates)
+
+    def hear_call(self, call):
+        """
+        Handle a call pushed by the audio input. The call is ignored if the player is already calling.
+        :param call: Name of the species whose call was heard
+        :return: -
+        """
+
+        if self._player is not None and not self._player.is_calling():
+            self.call_animals(species_id(call))
+
+    def lives_left(self):
+        """
+        Return the number of lives the player has left in the current game.
+        :return: int
+        """
+        return len([paw for paw in self._paw_sprites if paw.is_active()])
+
+    def observe(self):
+        """
+        Return the state of the level in world coordinates, for bots playing the game.
+        :return: dict with
+                 "player": center of the player (x, y),
+                 "animals": list of (species id, x, y, velocity x, velocity y, state) of the animals on the level,
+                 "owner": (x, y, wanted species id, state) of the owner, or None if there is no owner,
+                 "gate": state of the gate,
+                 "lives": number of lives left,
+                 "delivered": number of animals given to their owners
+        """
+
+        owner = self._owner_sprite
+        if owner is not None and owner.alive():
+            owner_state = (owner.world_rect.centerx, owner.world_rect.centery, owner.animal, owner.get_state())
+        else:
+            owner_state = None
+
+        return {"player": self._player.world_rect.center,
+                "animals": [(animal.species, animal.world_rect.centerx, animal.world_rect.centery,
+                             animal.velocity[0], animal.velocity[1], animal.get_state())
+                            for animal in self._animal_sprites],
+                "owner": owner_state,
+                "gate": self._gate_sprite.get_state(),
+                "lives": self.lives_left(),
+                "delivered": self.delivered_animals}
+
+    def snapshot(self):
+        """
+        Take a snapshot of the state of the current game: the animals, the player, the owner, the gate, the lives,
+        the timers, the animations and the random number generator. Restoring it with restore continues the game
+        exactly as it continued after the snapshot was taken, if the player does the same things. Statistics are not
+        included.
+        :return: LevelSnapshot
+        """
+
+        owner = self._owner_sprite
+        animal_indexes = {animal: i for i, animal in enumerate(self._animals)}
+
+        animals = array("d")
+        for animal in self._animals:
+            if animal.exclamation is not None:
+                animals.extend((animal.alive(), True, animal.exclamation.alive(), animal.heard_call.alive(),
+                                animal.shadow.alive()))
+            else:
+                animals.extend((animal.alive(), False, False, False, False))
+            animals.append(animal.owner_position is owner.world_rect)
+            animal.snapshot(animals)
+
+        player = array("d")
+        self._player.snapshot(player)
+
+        owner_values = array("d", (owner.image_id, owner._speech_bubble.style, owner.animal,
+                                   animal_indexes.get(owner.animal_sprite, -1), owner._speech_bubble.alive(),
+                                   owner._exclamation.alive(), owner._shadow.alive()))
+        owner.snapshot(owner_values)
+
+        gate = array("d")
+        self._gate_sprite.snapshot(gate)
+
+        sprite_indexes = {sprite: i for i, sprite in enumerate(self._level_sprites)}
+        sprites = array("h", (-1 if sprite is owner else sprite_indexes[sprite] for sprite in self._all_sprites))
+        grid = tuple((cell, tuple(animal_indexes[animal] for animal in animals_in_cell))
+                     for cell, animals_in_cell in self._animal_grid.get_cells().items())
+
+        return LevelSnapshot(self._games_started,
+                             array("d", (self.remaining_lives, self.delivered_animals, self.timers.time,
+                                         self.timers.get_counter(), self.animation_clock.time,
+                                         self.animation_clock.get_tick())),
+                             animals, player, owner_values, gate,
+                             array("b", (paw.is_active() for paw in self._paw_sprites)),
+                             sprites, grid, random.getstate())
+
+    def restore(self, snapshot):
+        """
+        Return the current game to the state of a snapshot. The sprites of the game are kept, only the owner and the
+        marks are taken from the sprite pool again. Nothing is drawn: call redraw_whole_screen before drawing the
+        level.
+        :param snapshot: LevelSnapshot taken from the current game of this level
+        :return: -
+        """
+
+        if snapshot.game != self._games_started:
+            raise ValueError("The snapshot is not from the current game of the level")
+
+        self.wait_for_render_thread()
+
+        level = snapshot.level
+        self.remaining_lives = int(level[0])
+        self.delivered_animals = int(level[1])
+        # The timers are scheduled again by the sprites
+        self.timers.restore(level[2], int(level[3]))
+        self.animation_clock.restore(level[4], int(level[5]))
+
+        # The owner of the snapshot may have been released already, so the owner is always taken again
+        owner = self._owner_sprite
+        for sprite in (owner, owner._speech_bubble, owner._exclamation, owner._shadow):
+            self.sprite_pool.release(sprite)
+
+        values = iter(snapshot.owner)
+        image_index, bubble_style, species, animal_index = (int(next(values)) for i in range(4))
+        owner = self._acquire_owner(image_index, bubble_style, species)
+        for decoration in (owner._speech_bubble, owner._exclamation, owner._shadow):
+            self._set_decoration_alive(decoration, next(values))
+        owner.restore(values)
+        owner.animal_sprite = self._animals[animal_index] if animal_index >= 0 else None
+        self._owner_sprite = owner
+
+        values = iter(snapshot.animals)
+        animals_on_level = []
+        for animal in self._animals:
+            on_level, has_marks, exclamation_alive, heard_alive, shadow_alive, follows_owner = \
+                (next(values) for i in range(6))
+            self._restore_animal_marks(animal, has_marks)
+            if has_marks:
+                self._set_decoration_alive(animal.exclamation, exclamation_alive)
+                self._set_decoration_alive(animal.heard_call, heard_alive)
+                self._set_decoration_alive(animal.shadow, shadow_alive)
+            animal.restore(values)
+
+            in_play_area = on_level and animal.get_state() == MOVE_IN_PLAY_AREA
+            animal.grid = self._animal_grid if in_play_area else None
+            if follows_owner:
+                animal.owner_position = owner.world_rect
+            if on_level:
+                animals_on_level.append(animal)
+
+        self._player.restore(iter(snapshot.player))
+        self._gate_sprite.restore(iter(snapshot.gate))
+        for paw, active in zip(self._paw_sprites.sprites(), snapshot.paws):
+            if paw.is_active() != active:
+                paw.set_active(bool(active))
+
+        # The sprites are updated in the order of the group, so the order is restored too
+        self._all_sprites.empty()
+        self._active_sprites.empty()
+        for index in snapshot.sprites:
+            self._add_sprite(owner if index < 0 else self._level_sprites[index])
+
+        self._animal_sprites.empty()
+        for group in self._animal_sprites_grouped_dict.values():
+            group.empty()
+        for animal in animals_on_level:
+            self._animal_sprites.add(animal)
+            self._animal_sprites_grouped_dict[animal.species].add(animal)
+
+        self._animal_grid.set_cells({cell: tuple(self._animals[i] for i in indexes) for cell, indexes in snapshot.grid},
+                                    {animal: animal.world_rect for animal in animals_on_level
+                                     if animal.grid is not None})
+
+        random.setstate(snapshot.random_state)
+
+    def _restore_animal_marks(self, animal, has_marks):
+        """
+        Give an animal new marks from the sprite pool if it had marks in a snapshot but they have been released, or
+        release its marks if it did not have them.
+        :param animal: Animal
+        :param has_marks: Did the animal have marks in the snapshot
+        :return: -
+        """
+
+        if has_marks and animal.exclamation is None:
+            animal.exclamation = self.sprite_pool.acquire(Exclamation, self._exclamation_image)
+            animal.heard_call = self.sprite_pool.acquire(Heard, self._heard_image)
+            animal.shadow = self.sprite_pool.acquire(Shadow, self._shadow_image)
+        elif not has_marks and animal.exclamation is not None:
+            for mark in (animal.exclamation, animal.heard_call, animal.shadow):
+                self.sprite_pool.release(mark)
+            animal.exclamation = animal.heard_call = animal.shadow = None
+
+    def _set_decoration_alive(self, decoration, alive):
+        """
+        Add a decoration to the level or remove it.
+        :param decoration: Decoration
+        :param alive: Should the decoration be on the level
+        :return: -
+        """
+
+        if alive and not decoration.alive():
+            self._decorations.add(decoration)
+        elif not alive and decoration.alive():
+            decoration.kill()
+
     def _create_owner(self):
         """
         Creates an owner sprite.
         :return: -
         """
-        owner_speech_bubble = Bubble(random.choice(self._bubble_images), self._animal_images)
-        owner_exclamation = Exclamation(self._exclamation_image)
+        bubble_style = random.randint(0, len(self._bubble_images) - 1)
         wanted_animal = random.randint(0, len(self._animal_sprites) - 1)
         image_index = random.randint(0, len(self._owner_images) - 1)
-        owner_shadow = Shadow(self._shadow_image)
 
-        pos_x = (self.screen.get_width() - play_area.right) // 2 + play_area.right
-        self._owner_sprite = Owner(self._owner_images[image_index], image_index, owner_speech_bubble, owner_exclamation,
-                                   (pos_x, self.screen.get_height() + self._owner_images[0].get_height()),
-                                   self._animal_sprites.get_sprite(wanted_animal).species, owner_shadow)
-        self._all_sprites.add(owner_shadow)
-        self._all_sprites.add(self._owner_sprite)
-        self._all_sprites.add(owner_speech_bubble)
-        self._all_sprites.add(owner_exclamation)
+        self._owner_sprite = self._acquire_owner(image_index, bubble_style,
+                                                 self._animal_sprites.get_sprite(wanted_animal).species)
+        self._decorations.add(self._owner_sprite._shadow)
+        self._add_sprite(self._owner_sprite)
+        self._decorations.add(self._owner_sprite._speech_bubble)
+        self._decorations.add(self._owner_sprite._exclamation)
+
+    def _acquire_owner(self, image_index, bubble_style, species):
+        """
+        Take an owner, its speech bubble, exclamation mark and shadow from the sprite pool. They are not added to the
+        level.
+        :param image_index: Index of the owner image
+        :param bubble_style: Index of the speech bubble image
+        :param species: Species id of the animal the owner wants
+        :return: Owner
+        """
+
+        owner_speech_bubble = self.sprite_pool.acquire(Bubble, self._bubble_images, bubble_style, self._animal_images)
+        owner_exclamation = self.sprite_pool.acquire(Exclamation, self._exclamation_image)
+        owner_shadow = self.sprite_pool.acquire(Shadow, self._shadow_image)
 
-    def _check_gate_collision(self):
+        pos_x = (settings.SCREEN_WIDTH - play_area.right) // 2 + play_area.right
+        pos_y = settings.SCREEN_HEIGHT + world_size(self._owner_images[0])[1]
+        owner = self.sprite_pool.acquire(Owner, self._owner_images[image_index], image_index, owner_speech_bubble,
+                                         owner_exclamation, (pos_x, pos_y), species, owner_shadow, self.timers)
+        owner.add_listener(self._on_owner_state_change)
+        return owner
+
+    def _release_owner(self):
+        """
+        Release the owner who has walked away, its speech bubble, exclamation mark and shadow, and the marks of the
+        animal it took, to the sprite pool.
+        :return: -
         """
-        Checks and handles animal collisions with the gate. If a wanted animal collides with the gate it gets destroyed
-        and the owner leaves. If an unwanted animal hits the gate, the player loses one life. If all lives are lost,
+
+        owner = self._owner_sprite
+        owner.cancel_timers()
+        sprites = [owner, owner._speech_bubble, owner._exclamation, owner._shadow]
+        animal = owner.animal_sprite
+        if animal is not None:
+            animal.cancel_timers()
+            sprites += [animal.exclamation, animal.heard_call, animal.shadow]
+            # The marks may be given to other characters, so the animal that has left does not keep them
+            animal.exclamation = animal.heard_call = animal.shadow = None
+
+        for sprite in sprites:
+            self.sprite_pool.release(sprite)
+
+        self._owner_sprite = None
+
+    def _release_sprites(self):
+        """
+        Release all reusable sprites of the level to the sprite pool.
+        :return: -
+        """
+
+        # An owner who has walked away is not in the sprite groups anymore
+        if self._owner_sprite is not None and not self._owner_sprite.alive():
+            self._release_owner()
+
+        for sprite in self._all_sprites.sprites() + self._decorations.decorations():
+            if self.sprite_pool.is_pooled(sprite):
+                self.sprite_pool.release(sprite)
+
+        self._owner_sprite = None
+
+    def _record_state_time(self, state, time_in_state):
+        statistics = self.state_statistics.setdefault(state, [0, 0])
+        statistics[0] += 1
+        statistics[1] += time_in_state
+
+    def print_state_statistics(self):
+        """
+        Print how many times the animals, owners and the gate have left each state and how long they stayed there.
+        :return: -
+        """
+        for state, (count, total_time) in sorted(self.state_statistics.items()):
+            print("{:<18} {:>6} times {:>9.0f} ms in total {:>8.0f} ms on average".format(STATE_NAMES[state], count,
+                                                                                       total_time, total_time / count))
+
+    def _on_owner_state_change(self, old_state, new_state, time_in_state):
+        self._record_state_time(old_state, time_in_state)
+
+        # The owner has come to the gate. If the gate is still closing, it is opened when it has closed.
+        if new_state == WAIT_FOR_ANIMAL and self._gate_sprite.get_state() == GATE_CLOSED:
+            self._gate_sprite.open_gate()
+
+    def _on_gate_state_change(self, old_state, new_state, time_in_state):
+        self._record_state_time(old_state, time_in_state)
+
+        if new_state == GATE_CLOSED and self._owner_sprite.get_state() == WAIT_FOR_ANIMAL:
+            self._gate_sprite.open_gate()
+
+    def _on_animal_state_change(self, old_state, new_state, time_in_state):
+        self._record_state_time(old_state, time_in_state)
+
+        # The animal has walked to the owner
+        if new_state == MOVE_WITH_OWNER and self._owner_sprite.get_state() == WAIT_FOR_ANIMAL:
+            self._gate_sprite.close_gate()
+            self._owner_sprite.get_animal()
+
+    def _on_animal_hit_gate(self, animal_sprite):
+        """
+        Handles an animal hitting the gate. If the gate is open and a wanted animal hits it, the animal goes to the
+        owner, who then leaves. If an unwanted animal hits the gate, the player loses one life. If all lives are lost,
         the game ends.
+        :param animal_sprite: the animal that hit the gate
         :return: -
         """
 
-        # Check collision with the gate
-        for animal_sprite in self._animal_sprites:
-
-            # The animal has walked to the owner
-            if animal_sprite.get_state() == "move_with_owner" and self._owner_sprite.get_state() == "wait_for_animal":
-                self._gate_sprite.close_gate()
-                self._owner_sprite.get_animal()
-
-            if animal_sprite.hit_gate and animal_sprite.get_state() == "move_in_play_area" and \
-                    self._owner_sprite.get_state() == "wait_for_animal":
-
-                # Wanted animal hit gate
-                if animal_sprite.species == self._owner_sprite.animal:
-                    self._owner_sprite.animal_sprite = animal_sprite
-                    animal_sprite.go_to_owner(self._owner_sprite.rect)
-
-                    animal_sprite.exclamation.kill()
-                    animal_sprite.heard_call.kill()
-
-                    # fixes bug with transparency when animal is removed when it's touching the call circle
-                    self._player.redraw_circle()
-
-                else:
-                    # Unwanted animal hit gate -> take a life point
-                    animal_sprite.exclamation.show_exclamation(animal_sprite.rect.topright)
-                    animal_sprite._shout_start_time = pygame.time.get_ticks()
-                    
-                    self._owner_sprite._exclamation.show_exclamation(self._owner_sprite.rect.topleft)
-                    self._owner_sprite._shout_start_time = pygame.time.get_ticks()
-                    
-                    used = 0
-                    for paw in reversed(self._life_symbols):
-                        used += 1
-                        if paw.is_active():
-                            paw.deactivate()
-                            break
-
-                    if used == NUMBER_OF_LIVES:
-                        self.draw()  # deactivates the last paw on the screen
-                        self.sound_effect_interface.stop_audio()
-                        GameState.game_state_manager.get_state("game_ended_menu").set_text("Game over!")
-                        GameState.game_state_manager.set_state("game_ended_menu")
+        if self._gate_sprite.get_state() != GATE_OPEN or animal_sprite.get_state() != MOVE_IN_PLAY_AREA or \
+                self._owner_sprite.get_state() != WAIT_FOR_ANIMAL:
+            return
+
+        # Wanted animal hit gate
+        if animal_sprite.species == self._owner_sprite.animal:
+            self._owner_sprite.animal_sprite = animal_sprite
+            animal_sprite.go_to_owner(self._owner_sprite.world_rect)
+            self.delivered_animals += 1
+
+            # The animal leaves the play area
+            self._animal_grid.remove(animal_sprite)
+            animal_sprite.grid = None
+
+            animal_sprite.exclamation.kill()
+            animal_sprite.heard_call.kill()
+
+            # fixes bug with transparency when animal is removed when it's touching the call circle
+            self._player.redraw_circle()
+
+        else:
+            # Unwanted animal hit gate -> take a life point
+            animal_sprite.shout()
+            self._owner_sprite.shout()
+
+            used = 0
+            for paw in reversed(self._life_symbols):
+                used += 1
+                if paw.is_active():
+                    paw.deactivate()
+                    break
+
+            if used == NUMBER_OF_LIVES:
+                self.draw()  # deactivates the last paw on the screen
+                self.sound_effect_interface.stop_audio()
+                self.game_state_manager.get_state("game_ended_menu").set_text("Game over!")
+                self.game_state_manager.set_state("game_ended_menu")
 
     def update(self, dt):
 
@@ -300,27 +776,23 @@ class GameLevel(GameState):
             self.sound_effect_interface.stop_audio()
 
             # The whole game has been won
-            if GameState.game_state_manager.get_current_state_name() == "level_4":
-                GameState.game_state_manager.get_state("game_ended_menu").set_text("Game won!")
-                GameState.game_state_manager.set_state("game_ended_menu")
+            if self.game_state_manager.get_current_state_name() == "level_4":
+                self.game_state_manager.get_state("game_ended_menu").set_text("Game won!")
+                self.game_state_manager.set_state("game_ended_menu")
             else:
                 # single level has been won
-                name = GameState.game_state_manager.get_current_state_name()
-                GameState.game_state_manager.set_state("next_level_menu")
-                GameState.game_state_manager.get_current_state().previous_state_name = name
+                name = self.game_state_manager.get_current_state_name()
+                self.game_state_manager.set_state("next_level_menu")
+                self.game_state_manager.get_current_state().previous_state_name = name
 
             return
 
         # If an owner does not exist -> create one
         if not self._owner_sprite.alive():
+            self._release_owner()
             self._create_owner()
 
-        if self._gate_sprite.get_state() == "closed" and self._owner_sprite.get_state() == "wait_for_animal":
-            self._gate_sprite.open_gate()
-
-        # Check and handle animals hitting the gate if the gate is open
-        if self._gate_sprite.get_state() == "open":
-            self._check_gate_collision()
+        # The gate, the owner and animals hitting the gate are handled by the state change and gate listeners
 
         # Check and handle an animal call
         # Update player status to sound event interface
@@ -328,13 +800,17 @@ class GameLevel(GameState):
             self.sound_effect_interface.calling = self._player.is_calling()
 
         # if the player is not calling, check for a call
-        if self._player.is_calling() == False:
+        if self.poll_calls and self._player.is_calling() == False:
             call = self.sound_effect_interface.get_animal_call()
             if call != None:
-                self._player.call_animal(call, self._animal_sprites_grouped_dict[call])
+                self.call_animals(species_id(call))
 
-        # call update function for all sprites
-        self._all_sprites.update(dt)
+        # call update function for the sprites that have something to update
+        self.animation_clock.advance(dt)
+        self._active_sprites.update(dt)
+
+        # Hide marks and speech bubbles whose time is up
+        self.timers.advance(dt)
 
     def get_event(self, event):
         """
@@ -352,34 +828,90 @@ class GameLevel(GameState):
             # Pause the game and open menu
             if event.key == K_SPACE or event.key == K_RETURN or event.key == K_ESCAPE:
                 self.sound_effect_interface.stop_audio()
-                state_name = GameState.game_state_manager.get_current_state_name()
-                GameState.game_state_manager.push_state("pause_menu")
-                GameState.game_state_manager.get_current_state().previous_state_name = state_name
-
-            # Cheat buttons for animal calls
-            elif event.key == K_a:
-                self._player.call_animal("cat", self._animal_sprites_grouped_dict["cat"])
-            elif event.key == K_s:
-                self._player.call_animal("cow", self._animal_sprites_grouped_dict["cow"])
-            elif event.key == K_d:
-                self._player.call_animal("dog", self._animal_sprites_grouped_dict["dog"])
-            elif event.key == K_f:
-                self._player.call_animal("pig", self._animal_sprites_grouped_dict["pig"])
-            elif event.key == K_g:
-                self._player.call_animal("sheep", self._animal_sprites_grouped_dict["sheep"])
+                state_name = self.game_state_manager.get_current_state_name()
+                self.game_state_manager.push_state("pause_menu")
+                self.game_state_manager.get_current_state().previous_state_name = state_name
+
+            # Cheat buttons for animal calls, listed in the species manifest
+            elif event.key in self._cheat_keys:
+                self.call_animals(self._cheat_keys[event.key])
 
     def draw(self):
 
         #self.draw_bounding_boxes()
+        # Place the sprites that have changed on the screen
+        for sprite in self._all_sprites:
+            if sprite.dirty:
+                sprite.place_on_screen()
+
+        # With an SDL renderer the whole level is drawn with textures every frame. The whole screen is still drawn on
+        # the canvas when it is shown in the background of a menu.
+        if GameState.renderer is not None and not self.redraw_background:
+            self._draw_textures()
+            return
+
+        if GameState.renderer is None and GameState.render_thread is not None:
+            self._submit_render_list()
+            return
+
+        # Draw the shadows on the ground and find the areas where decorations have changed
+        self._decorations.prepare(self._all_sprites)
         # Remove old sprites from the background by redrawing those sections
-        self._all_sprites.clear(self.screen, self.background)
+        self._all_sprites.clear(self.screen, self._decorations.ground)
         # Get the areas that are changed
         rectlist = self._all_sprites.draw(self.screen)
+        # Marks and speech bubbles are drawn on top of the sprites
+        rectlist += self._decorations.draw(self.screen)
         # add bounding boxes (temp)
         #rectlist += [play_area, gate]
         #rectlist += [animal.rect.inflate(2, 2) for animal in self._animal_sprites]
         # Draw the changed parts of the screen
-        pygame.display.update(rectlist)
+        self.update_display(rectlist)
+
+    def leave(self):
+
+        # The menus are drawn on top of the last frame of the level
+        self.wait_for_render_thread()
+
+        # The menus are drawn on the canvas on top of the level, so the level is drawn there too
+        if GameState.renderer is not None and self._all_sprites is not None:
+            self.redraw_whole_screen()
+            self.draw()
+
+    def _draw_textures(self):
+        """
+        Draw the level through the SDL renderer.
+        :return: -
+        """
+
+        GameState.renderer.draw_level(self.background, *self._visible_items())
+        self._decorations.forget_removed()
+
+    def _submit_render_list(self):
+        """
+        Give the frame to the render thread, which draws it while the next frame is simulated.
+        :return: -
+        """
+
+        items = tuple((item.image, item.rect.copy()) for group in self._visible_items() for item in group)
+        GameState.render_thread.submit(RenderList(self.screen, self.background, items, self.redraw_background))
+        self.redraw_background = False
+        self._decorations.forget_removed()
+
+    def _visible_items(self):
+        """
+        Place the visible sprites and decorations on the screen. Used when the sprites are not drawn by the sprite
+        group.
+        :return: list of shadows, list of sprites in the drawing order, list of decorations on top of the sprites
+        """
+
+        sprites = [sprite for sprite in self._all_sprites.sprites() if sprite.visible]
+        for sprite in sprites:
+            if sprite.dirty == 1:
+                sprite.dirty = 0
+
+        self._decorations.place_on_screen()
+        return self._decorations.visible(False), sprites, self._decorations.visible(True)
 
     def redraw_whole_screen(self, start_sound=False):
         """
@@ -392,14 +924,20 @@ class GameLevel(GameState):
         if start_sound:
             self.sound_effect_interface.start_threads()
 
-        self.screen.blit(self.background, (0, 0))
+        self.wait_for_render_thread()
+        # The shadows are not kept up to date on the ground while the level is drawn with textures or in the render
+        # thread
+        if GameState.renderer is not None or GameState.render_thread is not None:
+            self._decorations.set_background(self.background)
+        self.screen.blit(self._decorations.ground, (0, 0))
+        self.redraw_background = True
         for sprite in self._all_sprites:
             if type(sprite) != Animal:
                 sprite.dirty = 1
 
     def draw_bounding_boxes(self):
-        pygame.draw.rect(self.screen, (255, 0, 0), play_area, 2)
-        pygame.draw.rect(self.screen, (0, 255, 0), gate, 2)
+        pygame.draw.rect(self.screen, (255, 0, 0), world_to_screen_rect(play_area), 2)
+        pygame.draw.rect(self.screen, (0, 255, 0), world_to_screen_rect(gate), 2)
 
         for animal in self._animal_sprites:
             pygame.draw.rect(self.screen, (255,0,0), animal.rect.inflate(2,2), 2)
@@ -1,40 +1,149 @@
+import math
 import pygame
 import settings
-from help_functions import relocate_rect, scale_rect
+from help_functions import segment_entry_time, world_size, world_to_screen, flip_image
+from decorations import Decoration
+
+
+# State ids of the finite state machines
+# Animals
+MOVE_IN_PLAY_AREA, MOVE_TO_OWNER, MOVE_WITH_OWNER = range(3)
+# Owners
+WALK_TO_GATE, WAIT_FOR_ANIMAL, WALK_AWAY = range(3, 6)
+# The gate
+GATE_CLOSED, GATE_MOVE_DOWN, GATE_OPEN, GATE_MOVE_UP = range(6, 10)
+
+STATE_NAMES = {MOVE_IN_PLAY_AREA: "move_in_play_area", MOVE_TO_OWNER: "move_to_owner",
+               MOVE_WITH_OWNER: "move_with_owner", WALK_TO_GATE: "walk_to_gate", WAIT_FOR_ANIMAL: "wait_for_animal",
+               WALK_AWAY: "walk_away", GATE_CLOSED: "closed", GATE_MOVE_DOWN: "move_down", GATE_OPEN: "open",
+               GATE_MOVE_UP: "move_up"}
+
+# How many times an animal can bounce from the borders and the gate during one update
+MAX_BOUNCES_PER_MOVE = 4
 
 
 class FiniteStateMachine():
-    def __init__(self, state=None, state_str=""):
-        self.__active_state = state
-        self.__state_str = state_str
+    def __init__(self, states, state, transitions=None):
+        """
+        A finite state machine whose states are integer ids. The function of the active state is called on update.
+        Listeners are told about every state change, and the machine keeps timing statistics for each state.
+        :param states: dict, key: state id, value: function called with dt when the state is active
+        :param state: id of the first state
+        :param transitions: dict, key: state id, value: tuple of the states that can follow it.
+                            None allows all transitions.
+        """
+        self._states = states
+        self._transitions = transitions
+        self._listeners = []
+
+        self.__state = state
+        self.__active_state = states[state]
+        self._time_in_state = 0
 
-    def set_state(self, new_state_function, new_state_str=""):
-        self.__active_state = new_state_function
-        self.__state_str = new_state_str
+        # [times entered, total time in ms] for each state id
+        self.statistics = {state: [1, 0]}
+
+    def add_listener(self, listener):
+        """
+        Add a function that is called after every state change with parameters
+        (old state id, new state id, time spent in the old state in ms).
+        :param listener: function
+        :return: -
+        """
+        self._listeners.append(listener)
+
+    def set_state(self, new_state):
+        """
+        Change the active state.
+        :param new_state: id of the new state
+        :return: -
+        """
+
+        old_state = self.__state
+        if self._transitions is not None and new_state not in self._transitions.get(old_state, ()):
+            raise ValueError("Transition from " + STATE_NAMES.get(old_state, str(old_state)) + " to " +
+                             STATE_NAMES.get(new_state, str(new_state)) + " is not allowed")
+
+        time_in_state = self._time_in_state
+        self.statistics[old_state][1] += time_in_state
+        self.statistics.setdefault(new_state, [0, 0])[0] += 1
+
+        self.__state = new_state
+        self.__active_state = self._states[new_state]
+        self._time_in_state = 0
+
+        for listener in self._listeners:
+            listener(old_state, new_state, time_in_state)
 
     def get_state(self):
-        return self.__state_str
+        return self.__state
 
     def update(self, dt):
-        if self.__active_state is not None:
-            self.__active_state(dt)
+        self._time_in_state += dt
+        self.__active_state(dt)
+
+    def snapshot(self, values):
+        """
+        Append the active state and the time spent in it to the values of a level snapshot.
+        :param values: array of numbers
+        :return: -
+        """
+        values.extend((self.__state, self._time_in_state))
+
+    def restore(self, values):
+        """
+        Take the active state and the time spent in it from the values of a level snapshot. The listeners are not
+        told and the statistics are not changed.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.__state = int(next(values))
+        self.__active_state = self._states[self.__state]
+        self._time_in_state = next(values)
+        self.statistics.setdefault(self.__state, [0, 0])
+
+
+class WorldSprite(pygame.sprite.DirtySprite):
+    """
+    A sprite of a game level. The game logic moves world_rect, which is in the coordinates of the game world. rect, the
+    place of the sprite on the screen, is set from world_rect by place_on_screen before the sprite is drawn.
+    """
 
+    def place_on_screen(self):
+        self.rect.topleft = world_to_screen(self.world_rect.topleft)
+        self.rect.size = self.image.get_size()
 
-class Animal(pygame.sprite.DirtySprite):
-    def __init__(self, velocity, species, exclamation, heard_call, shadow, position, animation_images):
+
+class Animal(WorldSprite):
+    def __init__(self, velocity, species, exclamation, heard_call, shadow, position, animation_images, timers,
+                 animation_clock, phase=0, flipped_images=None):
         """
         An animal. They move in a straight and bounce from the borders. Can be called by the player.
         :param velocity: The velocity of the animal (direction and speed)
         :param species: The species of the animal
         :param position: The topleft position as tuple (x, y)
         :param image: The image for the animal
+        :param timers: TimerScheduler of the level, used for hiding the marks
+        :param animation_clock: AnimationClock of the level
+        :param phase: Frame offset of the walking animation from the other animals of the species
+        :param flipped_images: The animation images facing right. Flipped from animation_images if not given.
         """
         pygame.sprite.DirtySprite.__init__(self)  # Call Sprite initializer
 
+        # The images face left, like the animals moving left
+        self._left_images = animation_images
+        if flipped_images is None:
+            flipped_images = [flip_image(img) for img in animation_images]
+        self._right_images = flipped_images
+        if velocity[0] > 0:
+            animation_images = flipped_images
+
         self.image = animation_images[0]
         self.rect = self.image.get_rect()
-        self.collision_rect = self.rect.inflate(-1, -1)
-        self.rect.topleft = position
+        self.world_rect = pygame.Rect(position, world_size(self.image))
+        self.collision_rect = self.world_rect.inflate(-1, -1)
+        self.place_on_screen()
         self.velocity = velocity
         self.species = species
         self.exclamation = exclamation
@@ -44,18 +153,31 @@ class Animal(pygame.sprite.DirtySprite):
         self.speed = settings.ANIMAL_SPEED
         self.dirty = 2
         self.hit_gate = False
-        # for checking collision with call radius circle
-        self.mask = pygame.mask.from_surface(self.image)
-        self._shout_start_time = 0
-        self._heard_start_time = 0
+        # for checking collision with call radius circle, in world coordinates
+        self.mask = pygame.mask.from_surface(self.image).scale(self.world_rect.size)
+        self._timers = timers
+        self._shout_timer = None
+        self._heard_timer = None
         self._animation_images = animation_images
 
         # variables for animation
-        self.counter = 0
+        self._animation_clock = animation_clock
+        self._animation_bucket = animation_clock.bucket(species, phase, len(animation_images))
         self.animation_index = 0
 
         self.owner_position = None
-        self._brain = FiniteStateMachine(self.move_in_play_area, "move_in_play_area")
+        # Called with the animal when it hits the gate
+        self.gate_listener = None
+        # SpatialGrid of the level, the animal keeps its place in it up to date while moving in the play area
+        self.grid = None
+        self._near_edge = True
+        # Reused for the push of _separate
+        self._push = pygame.math.Vector2()
+        self._brain = FiniteStateMachine({MOVE_IN_PLAY_AREA: self.move_in_play_area,
+                                          MOVE_TO_OWNER: self.move_to_owner,
+                                          MOVE_WITH_OWNER: self.move_with_owner},
+                                         MOVE_IN_PLAY_AREA,
+                                         {MOVE_IN_PLAY_AREA: (MOVE_TO_OWNER,), MOVE_TO_OWNER: (MOVE_WITH_OWNER,)})
 
     def update(self, dt):
 
@@ -63,19 +185,37 @@ class Animal(pygame.sprite.DirtySprite):
         #self.move_in_play_area(dt)
         # Borders around animals, for debugging
         #pygame.draw.rect(self.image, (0, 0, 255), self.collision_rect, 1)
-        if self.exclamation.visible and pygame.time.get_ticks() - self._shout_start_time > settings.EXCLAMATION_MARK_VISIBLE_TIME_MS:
-            self._shout_start_time = 0
-            self.exclamation.hide_exclamation()
-        
-        if self.heard_call.visible and pygame.time.get_ticks() - self._heard_start_time > settings.HEARD_CALL_VISIBLE_TIME_MS:
-            self._heard_start_time = 0
-            self.heard_call.hide_heard()
+
+    def shout(self):
+        """
+        Show the exclamation mark for EXCLAMATION_MARK_VISIBLE_TIME_MS.
+        :return: -
+        """
+
+        self.exclamation.show_exclamation(self.world_rect.topright)
+        self._timers.cancel(self._shout_timer)
+        self._shout_timer = self._timers.schedule(settings.EXCLAMATION_MARK_VISIBLE_TIME_MS,
+                                                  self.exclamation.hide_exclamation)
+
+    def hear_call(self):
+        """
+        Show the question mark for HEARD_CALL_VISIBLE_TIME_MS.
+        :return: -
+        """
+
+        self.heard_call.show_heard(self.world_rect.midtop)
+        self._timers.cancel(self._heard_timer)
+        self._heard_timer = self._timers.schedule(settings.HEARD_CALL_VISIBLE_TIME_MS, self.heard_call.hide_heard)
+
+    def cancel_timers(self):
+        self._timers.cancel(self._shout_timer)
+        self._timers.cancel(self._heard_timer)
 
     def move_with_owner(self, dt):
 
         self.move_animation(dt)
-        self.rect.x = self.owner_position.centerx
-        self.rect.bottom = self.owner_position.bottom
+        self.world_rect.x = self.owner_position.centerx
+        self.world_rect.bottom = self.owner_position.bottom
 
     def move_to_owner(self, dt):
         self.move_animation(dt)
@@ -83,64 +223,174 @@ class Animal(pygame.sprite.DirtySprite):
         if self.position[0] < self.owner_position.centerx:
             self._move(dt)
         else:
-            self._brain.set_state(self.move_with_owner, "move_with_owner")
+            self._brain.set_state(MOVE_WITH_OWNER)
 
     def go_to_owner(self, owner_position):
         self.owner_position = owner_position
         self.turn_towards_point(pygame.math.Vector2(owner_position.center))
-        self._brain.set_state(self.move_to_owner, "move_to_owner")
+        self._brain.set_state(MOVE_TO_OWNER)
 
     def move_animation(self, dt):
 
         # Animation for the movement
-        self.counter += dt
-        if self.counter > 90:
-            self.image = self._animation_images[self.animation_index]
-            self.animation_index = (self.animation_index + 1) % len(self._animation_images)
-            self.counter = 0
+        index = self._animation_clock.frame(self._animation_bucket)
+        if index != self.animation_index:
+            self.animation_index = index
+            self.image = self._animation_images[index]
 
-        self.shadow.move(self.rect.midbottom)
+        self.shadow.move(self.world_rect.midbottom)
 
     def _move(self, dt):
 
         self.move_animation(dt)
 
         # Actual movement
-        self.position += (self.velocity[0] * settings.scale_factor[0] * (dt / 100),
-                          self.velocity[1] * settings.scale_factor[1] * (dt / 100))
-        self.rect.x = round(self.position.x)
-        self.rect.y = round(self.position.y)
+        self.position += self._displacement(dt)
+        self._place()
+
+    def _displacement(self, dt):
+        return pygame.math.Vector2(self.velocity[0] * (dt / 100), self.velocity[1] * (dt / 100))
+
+    def _place(self):
+        """
+        Move the rect to the position and update the place of the animal in the grid.
+        :return: -
+        """
+
+        self.world_rect.x = round(self.position.x)
+        self.world_rect.y = round(self.position.y)
+
+        if self.grid is not None:
+            self._near_edge = self.grid.move(self, self.world_rect)
 
     def move_in_play_area(self, dt):
 
         self.hit_gate = False
-        old_position = self.position
+        self.move_animation(dt)
 
         # Actual movement
-        self._move(dt)
+        displacement = self._displacement(dt)
+        start = pygame.math.Vector2(self.position)
+        self.position += displacement
+        self._place()
 
-        # Collision detection with gate
-        if settings.gate.collidepoint(self.rect.topright) and settings.gate.collidepoint(self.rect.bottomright):
-            self.hit_gate = True
-            self.position = old_position
-            self.velocity.x *= -1
-            self._animation_images = [pygame.transform.flip(img, True, False) for img in self._animation_images]
+        # Animals that stay in the grid cells inside the play area cannot touch the borders or the gate
+        if self.grid is None or self._near_edge:
+            self.position = start
+            self._sweep(displacement)
+            self._place()
 
-        # Collision detection with borders
-        if self.rect.x < settings.play_area.left or self.rect.x > settings.play_area.right - self.rect.width:
-            self.velocity.x *= -1
-            self._animation_images = [pygame.transform.flip(img, True, False) for img in self._animation_images]
-            self.position = old_position
-
-        if self.rect.y < settings.play_area.top or self.rect.y > settings.play_area.bottom - self.rect.height:
-            self.velocity.y *= -1
-            self.position = old_position
+        if self.grid is not None and settings.ANIMAL_SEPARATION_SPEED > 0:
+            self._separate(dt)
 
         if self.heard_call.visible == 1:
-            self.heard_call.move(self.rect.midtop)
+            self.heard_call.move(self.world_rect.midtop)
 
         if self.exclamation.visible == 1:
-            self.exclamation.move(self.rect.topright)
+            self.exclamation.move(self.world_rect.topright)
+
+        if self.hit_gate and self.gate_listener is not None:
+            self.gate_listener(self)
+
+    def _sweep(self, displacement):
+        """
+        Move the animal and bounce from the gate and the borders of the play area at the point where it touches them.
+        The rest of the movement continues in the reflected direction, so a long step cannot pass through the gate or
+        a border.
+        :param displacement: Movement of the position as pygame.math.Vector2
+        :return: -
+        """
+
+        width, height = self.world_rect.size
+        area = settings.play_area
+        gate = settings.gate
+        # The animal hits the gate when both of its right corners are in the gate. This is the area of the topright
+        # corner where that is true.
+        gate_area = pygame.Rect(gate.left, gate.top, gate.width, gate.height - height)
+        rest = pygame.math.Vector2(displacement)
+
+        for bounce in range(MAX_BOUNCES_PER_MOVE):
+            # Fractions of the remaining movement after which the animal touches a border or the gate
+            # (greater than 1 if it does not)
+            x_time = y_time = gate_time = 2
+            if rest.x < 0:
+                x_time = max(0, (area.left - self.position.x) / rest.x)
+            elif rest.x > 0:
+                x_time = max(0, (area.right - width - self.position.x) / rest.x)
+                if gate_area.height > 0:
+                    entry_time = segment_entry_time((self.position.x + width, self.position.y), rest, gate_area)
+                    if entry_time is not None:
+                        gate_time = entry_time
+            if rest.y < 0:
+                y_time = max(0, (area.top - self.position.y) / rest.y)
+            elif rest.y > 0:
+                y_time = max(0, (area.bottom - height - self.position.y) / rest.y)
+
+            hit_time = min(x_time, y_time, gate_time)
+            if hit_time > 1:
+                self.position += rest
+                return
+
+            self.position += rest * hit_time
+            rest *= 1 - hit_time
+
+            if gate_time == hit_time:
+                self.hit_gate = True
+            if x_time == hit_time or gate_time == hit_time:
+                self.velocity.x *= -1
+                rest.x *= -1
+                self._face_velocity()
+            if y_time == hit_time:
+                self.velocity.y *= -1
+                rest.y *= -1
+
+        # The rest of a very long movement is dropped if the animal bounces back and forth in a corner
+
+    def _separate(self, dt):
+        """
+        Push the animal away from the animals it overlaps with. The animals in the grid cells that the animal touches
+        are checked, so every overlapping animal is found, and at most ANIMAL_SEPARATION_NEIGHBOURS of them are
+        avoided. The push bounces from the borders and the gate like the animal's own movement.
+        :param dt: Time since the last update in ms
+        :return: -
+        """
+
+        rect = self.world_rect
+        center_x, center_y = rect.center
+        push_x = push_y = 0
+        found = 0
+        for other in self.grid.neighbours(self):
+            other_rect = other.world_rect
+            if not rect.colliderect(other_rect):
+                continue
+            away_x = center_x - other_rect.centerx
+            away_y = center_y - other_rect.centery
+            # Animals exactly on top of each other are separated by their own movement
+            if away_x != 0 or away_y != 0:
+                distance = math.hypot(away_x, away_y)
+                push_x += away_x / distance
+                push_y += away_y / distance
+            found += 1
+            # In a crowd only the first overlapping animals found are avoided
+            if found == settings.ANIMAL_SEPARATION_NEIGHBOURS:
+                break
+
+        # Pushes from opposite sides cancel each other
+        length = math.hypot(push_x, push_y)
+        if length < 0.01:
+            return
+
+        scale = settings.ANIMAL_SEPARATION_SPEED * (dt / 100) / length
+        push = self._push
+        push.update(push_x * scale, push_y * scale)
+        start_x, start_y = self.position
+        self.position += push
+        self._place()
+
+        if self._near_edge:
+            self.position.update(start_x, start_y)
+            self._sweep(push)
+            self._place()
 
     def turn_towards_point(self, point):
         """
@@ -148,32 +398,101 @@ class Animal(pygame.sprite.DirtySprite):
         :param player_position: The position to turn the animal towards (pygame.math.Vector2)
         :return: -
         """
-        new_dir = point - self.rect.center
+        new_dir = point - self.world_rect.center
         new_velocity = new_dir.normalize()
 
-        # Flip the animation images if the animal changes direction on x axis
-        if new_velocity[0] * self.velocity[0] < 0:
-            self._animation_images = [pygame.transform.flip(img, True, False) for img in self._animation_images]
-
         self.velocity = new_velocity * self.speed
+        self._face_velocity()
+
+    def _face_velocity(self):
+        """
+        Use the animation images facing the direction of the movement on x axis. The images are not flipped here, so
+        no surfaces are made or read while the animals move.
+        :return: -
+        """
+
+        if self.velocity[0] > 0:
+            self._animation_images = self._right_images
+        elif self.velocity[0] < 0:
+            self._animation_images = self._left_images
 
     def get_state(self):
         return self._brain.get_state()
 
-    def scale(self, images):
-        self.image = images[self.animation_index]
-        self._animation_images = images
+    def add_listener(self, listener):
+        self._brain.add_listener(listener)
 
-        # Calculate new position
-        relocate_rect(self.rect, settings.scale_factor)
-        self.rect.size = self.image.get_rect().size
+    def scale(self, images, flipped_images):
+        """
+        Use images of a new size.
+        :param images: The animation images facing left
+        :param flipped_images: The animation images facing right
+        :return: -
+        """
+
+        self._left_images = images
+        self._right_images = flipped_images
+        self._animation_images = flipped_images if self.velocity.x > 0 else images
+        self.image = self._animation_images[self.animation_index]
 
-        self.collision_rect = self.rect.inflate(-1, -1)
-        self.mask = pygame.mask.from_surface(self.image)
+    def snapshot(self, values):
+        """
+        Append the state of the animal and its marks to the values of a level snapshot. The marks are left out if
+        they have been released.
+        :param values: array of numbers
+        :return: -
+        """
+
+        values.extend((self.position.x, self.position.y, self.velocity.x, self.velocity.y, self.world_rect.x,
+                       self.world_rect.y, self.animation_index, self._animation_images is self._right_images,
+                       self.hit_gate, self._near_edge))
+        self._brain.snapshot(values)
+        values.extend(self._timers.timer_values(self._shout_timer))
+        values.extend(self._timers.timer_values(self._heard_timer))
+        values.append(self.owner_position is not None)
+        values.extend(self.owner_position or (0, 0, 0, 0))
+        if self.exclamation is not None:
+            self.exclamation.snapshot(values)
+            self.heard_call.snapshot(values)
+            self.shadow.snapshot(values)
+
+    def restore(self, values):
+        """
+        Take the state of the animal and its marks from the values of a level snapshot. The animal must have marks if
+        and only if it had them in the snapshot.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.position = pygame.math.Vector2(next(values), next(values))
+        self.velocity = pygame.math.Vector2(next(values), next(values))
+        self.world_rect.topleft = (int(next(values)), int(next(values)))
+        self.animation_index = int(next(values))
+        self._animation_images = self._right_images if next(values) else self._left_images
+        self.image = self._animation_images[self.animation_index]
+        self.hit_gate = bool(next(values))
+        self._near_edge = bool(next(values))
+        self._brain.restore(values)
+
+        shout_timer = (next(values), next(values))
+        heard_timer = (next(values), next(values))
+        # The level gives the rect of the owner instead of this copy if the animal follows the current owner
+        has_owner = next(values)
+        owner_position = pygame.Rect(*(int(next(values)) for i in range(4)))
+        self.owner_position = owner_position if has_owner else None
+        if self.exclamation is not None:
+            self.exclamation.restore(values)
+            self.heard_call.restore(values)
+            self.shadow.restore(values)
+            self._shout_timer = self._timers.restore_timer(*shout_timer, self.exclamation.hide_exclamation)
+            self._heard_timer = self._timers.restore_timer(*heard_timer, self.heard_call.hide_heard)
+        else:
+            self._shout_timer = self._heard_timer = None
 
 
-class Player(pygame.sprite.DirtySprite):
-    def __init__(self, animation_images, position, speed, circle, speech_bubble, shadow):
+class Player(WorldSprite):
+    def __init__(self, animation_images, position, speed, circle, speech_bubble, shadow, timers, animation_clock,
+                 pressed_keys=pygame.key.get_pressed):
         """
         The player sprite.
         :param image: image for the player
@@ -181,15 +500,22 @@ class Player(pygame.sprite.DirtySprite):
         :param speed: The speed of the player
         :param circle: The call circle sprite used to indicate the call radius around the player
         :param speech_bubble: The speech bubble sprite used to indicate the player is making a call
+        :param timers: TimerScheduler of the level, used for ending calls
+        :param animation_clock: AnimationClock of the level
+        :param pressed_keys: Function returning the state of the keys, like pygame.key.get_pressed
         """
         pygame.sprite.DirtySprite.__init__(self)
 
         # Variables image and rect are required by the Sprite super class
         self._animation_images = animation_images
         self._animation_index = 0
+        self._animation_clock = animation_clock
+        self._animation_bucket = animation_clock.bucket("player", 0, len(animation_images))
         self.image = animation_images[0]
-        self.rect = self._animation_images[0].get_rect()
-        self.rect.center = position
+        self.rect = self.image.get_rect()
+        self.world_rect = pygame.Rect((0, 0), world_size(self.image))
+        self.world_rect.center = position
+        self.place_on_screen()
 
         self.speed = speed
         self._position = position
@@ -197,18 +523,17 @@ class Player(pygame.sprite.DirtySprite):
         self._speech_bubble = speech_bubble
         self._shadow = shadow
         self._calling_animal = False    # Is player currently calling an animal
-        self._call_start_time = 0       # Start time of a call
-        self.counter = 0
+        self._timers = timers
+        self._end_call_timer = None
+        self._pressed_keys = pressed_keys
 
 
-    def scale(self, images, bubble_image, animal_images):
+    def scale(self, images, bubble_images, animal_images):
         self._animation_images = images
+        self.image = images[self._animation_index]
 
-        self.rect.size = self.image.get_rect().size
-        relocate_rect(self.rect, settings.scale_factor)
-
-        self._speech_bubble.scale(bubble_image, animal_images)
-        self._circle.scale_circle(self.rect)
+        self._speech_bubble.scale(bubble_images, animal_images)
+        self._circle.scale_circle()
 
     def redraw_circle(self):
         self._circle.dirty = 1
@@ -220,19 +545,17 @@ class Player(pygame.sprite.DirtySprite):
         #if self._calling_animal == False:
         self.move(dt)
 
-        if self._speech_bubble.visible and pygame.time.get_ticks() - self._call_start_time > settings.SPEECH_BUBBLE_VISIBLE_TIME_MS:
-                self._call_start_time = 0
-                self._speech_bubble.hide_bubble()
-                self._calling_animal = False
+    def _end_call(self):
+        self._speech_bubble.hide_bubble()
+        self._calling_animal = False
 
     def move_animation(self, dt):
 
-        # Animation for the movement
-        self.counter += dt
-        if self.counter > 0.90:
-            self.image = self._animation_images[self._animation_index]
-            self._animation_index = (self._animation_index + 1) % len(self._animation_images)
-            self.counter = 0
+        # Animation for the movement. The frame changes only while the player moves.
+        index = self._animation_clock.frame(self._animation_bucket)
+        if index != self._animation_index:
+            self._animation_index = index
+            self.image = self._animation_images[index]
 
     def move(self, dt):
 
@@ -241,44 +564,43 @@ class Player(pygame.sprite.DirtySprite):
         dt /= 100
 
         # Get the current state of keys
-        keys = pygame.key.get_pressed()
+        keys = self._pressed_keys()
 
         # Move the player
         if keys[pygame.K_LEFT]:
-            self.rect.x -= int(self.speed * settings.scale_factor[0] * dt)
+            self.world_rect.x -= int(self.speed * dt)
             self.dirty = 1
             self.move_animation(dt)
         if keys[pygame.K_RIGHT]:
-            self.rect.x += int(self.speed * settings.scale_factor[0] * dt)
+            self.world_rect.x += int(self.speed * dt)
             self.dirty = 1
             self.move_animation(dt)
         if keys[pygame.K_UP]:
-            self.rect.y -= int(self.speed * settings.scale_factor[1] * dt)
+            self.world_rect.y -= int(self.speed * dt)
             self.dirty = 1
             self.move_animation(dt)
         if keys[pygame.K_DOWN]:
-            self.rect.y += int(self.speed * settings.scale_factor[1] * dt)
+            self.world_rect.y += int(self.speed * dt)
             self.dirty = 1
             self.move_animation(dt)
-            #self.counter = (self.counter + 1) % len(self._animation_images)
 
 
         # prevent the player from going outside the play area
-        self.rect.clamp_ip(settings.play_area)
-        self._position = pygame.math.Vector2(self.rect.center)
+        self.world_rect.clamp_ip(settings.play_area)
+        self._position = pygame.math.Vector2(self.world_rect.center)
         
-        self._shadow.move(self.rect.midbottom)
+        self._shadow.move(self.world_rect.midbottom)
 
         # Move the call radius circle if the player was moved
         if self.dirty == 1:
             self._circle.move(self._position)
-            self._speech_bubble.move(self.rect)
+            self._speech_bubble.move(self.world_rect)
 
     def call_animal(self, animal_type, animal_list):
         """
         Make a call. Turn nearby animals of a type towards the player.
         :param animal_type: The type of animal called
-        :param animal_lists: List of containing lists of animals
+        :param animal_list: The animals of the called type that may be inside the call radius
         :return: -
         """
 
@@ -287,16 +609,15 @@ class Player(pygame.sprite.DirtySprite):
             return
 
         # Show speech bubble
-        self._speech_bubble.show_bubble(self.rect, animal_type)
+        self._speech_bubble.show_bubble(self.world_rect, animal_type)
         self._calling_animal  = True
-        self._call_start_time = pygame.time.get_ticks()
+        self._end_call_timer = self._timers.schedule(settings.SPEECH_BUBBLE_VISIBLE_TIME_MS, self._end_call)
 
-        collided = pygame.sprite.spritecollide(self._circle, animal_list, False, pygame.sprite.collide_mask)
+        collided = [animal for animal in animal_list if self._circle.overlaps(animal)]
 
         for animal in collided:
             animal.turn_towards_point(self._position)
-            animal.heard_call.show_heard(animal.rect.midtop)
-            animal._heard_start_time = pygame.time.get_ticks()
+            animal.hear_call()
 
     def is_calling(self):
         """
@@ -305,10 +626,43 @@ class Player(pygame.sprite.DirtySprite):
         """
         return self._calling_animal
 
+    def snapshot(self, values):
+        """
+        Append the state of the player, its speech bubble, shadow and call circle to the values of a level snapshot.
+        :param values: array of numbers
+        :return: -
+        """
+
+        values.extend((self.world_rect.x, self.world_rect.y, self._position[0], self._position[1],
+                       self._animation_index, self._calling_animal, self.dirty))
+        values.extend(self._timers.timer_values(self._end_call_timer))
+        self._speech_bubble.snapshot(values)
+        self._shadow.snapshot(values)
+        values.extend(self._circle.world_rect.topleft)
+
+    def restore(self, values):
+        """
+        Take the state of the player, its speech bubble, shadow and call circle from the values of a level snapshot.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.world_rect.topleft = (int(next(values)), int(next(values)))
+        self._position = pygame.math.Vector2(next(values), next(values))
+        self._animation_index = int(next(values))
+        self.image = self._animation_images[self._animation_index]
+        self._calling_animal = bool(next(values))
+        self.dirty = int(next(values))
+        self._end_call_timer = self._timers.restore_timer(next(values), next(values), self._end_call)
+        self._speech_bubble.restore(values)
+        self._shadow.restore(values)
+        self._circle.world_rect.topleft = (int(next(values)), int(next(values)))
+        self._circle.dirty = 1
+
 
-class Owner(pygame.sprite.DirtySprite):
+class Owner(WorldSprite):
 
-    def __init__(self, image, image_id, speech_bubble, exclamation, position, animal_type, shadow):
+    def __init__(self, image, image_id, speech_bubble, exclamation, position, animal_type, shadow, timers):
         """
         Owner sprite. It is the customer in the game who walks from the bottom of the screen to the gate and ask for
         an animal. Once he gets what he wants he walks away.
@@ -317,42 +671,63 @@ class Owner(pygame.sprite.DirtySprite):
         :param speech_bubble: Bubble sprite used to indicate the animal the owner wants
         :param position: The top left position of the sprite
         :param animal_type: The type of animal the owner wants
+        :param timers: TimerScheduler of the level, used for hiding the exclamation mark
         """
         pygame.sprite.DirtySprite.__init__(self)
+        self.reset(image, image_id, speech_bubble, exclamation, position, animal_type, shadow, timers)
+
+    def reset(self, image, image_id, speech_bubble, exclamation, position, animal_type, shadow, timers):
+        """
+        Initialize the owner. Used also when a released owner is taken back into use from a SpritePool.
+        Parameters are the same as for the constructor.
+        """
 
         self.image = image
         self.image_id = image_id
         self.rect = image.get_rect()
-        self.rect.center = position
+        self.world_rect = pygame.Rect((0, 0), world_size(image))
+        self.world_rect.center = position
+        # Exact y coordinate of the top. The steps of a frame are often fractions of a pixel, so the rect is
+        # rounded from this and the owner walks at the same speed with any dt.
+        self._position_y = float(self.world_rect.y)
+        self.place_on_screen()
         self._speech_bubble = speech_bubble
         self._exclamation = exclamation
         self._shadow = shadow
-        self._speed = 2
+        self._speed = settings.OWNER_SPEED
         self.animal = animal_type
 
-        self._start_time = 0
-        self._shout_start_time = 0
+        self._timers = timers
+        self._shout_timer = None
         self._speed_scale = (1, 1)
-        self._brain = FiniteStateMachine(self.walk_to_gate, "walk_to_gate")
+        self._brain = FiniteStateMachine({WALK_TO_GATE: self.walk_to_gate,
+                                          WAIT_FOR_ANIMAL: self.wait_for_animal,
+                                          WALK_AWAY: self.walk_away},
+                                         WALK_TO_GATE,
+                                         {WALK_TO_GATE: (WAIT_FOR_ANIMAL,), WAIT_FOR_ANIMAL: (WALK_AWAY,)})
 
         self.animal_sprite = None
 
     def walk_to_gate(self, dt):
         # Walk to the gate
-        if self.rect.centery > settings.play_area.centery:
-            self.move()
+        if self.world_rect.centery > settings.play_area.centery:
+            self.move(dt)
+            # Do not walk past the gate
+            if self.world_rect.centery < settings.play_area.centery:
+                self.world_rect.centery = settings.play_area.centery
+                self._position_y = float(self.world_rect.y)
         else:
             # The owner reached the gate, ask for an animal
-            self._speech_bubble.show_bubble(self.rect, self.animal)
-            self._brain.set_state(self.wait_for_animal, "wait_for_animal")
+            self._speech_bubble.show_bubble(self.world_rect, self.animal)
+            self._brain.set_state(WAIT_FOR_ANIMAL)
 
     def wait_for_animal(self, dt):
         pass
 
     def walk_away(self, dt):
-        self.move()
+        self.move(dt)
         # Customer walked out of the screen -> destroy it
-        if self.rect.y < - self.rect.height:
+        if self.world_rect.y < - self.world_rect.height:
             self.kill()
             self.animal_sprite.kill()
             self.animal_sprite.shadow.kill()
@@ -364,41 +739,107 @@ class Owner(pygame.sprite.DirtySprite):
         """
 
         self._speech_bubble.hide_bubble()
-        self._brain.set_state(self.walk_away, "walk_away")
+        self._brain.set_state(WALK_AWAY)
 
     def get_state(self):
         return self._brain.get_state()
 
-    def move(self):
-        self.rect.y -= (self._speed * settings.scale_factor[1])
+    def add_listener(self, listener):
+        self._brain.add_listener(listener)
+
+    def move(self, dt):
+        # The speed is given in pixels per frame
+        self._position_y -= self._speed * dt * settings.FPS / 1000
+        self.world_rect.y = round(self._position_y)
         self.dirty = 1
-        self._shadow.move(self.rect.midbottom)
+        self._shadow.move(self.world_rect.midbottom)
 
-    def scale(self, image, bubble_image, animal_images):
+    def scale(self, image, bubble_images, animal_images):
         self.image = image
-        scale_rect(self.rect, settings.scale_factor)
+        self._speech_bubble.scale(bubble_images, animal_images)
+
+    def shout(self):
+        """
+        Show the exclamation mark for EXCLAMATION_MARK_VISIBLE_TIME_MS.
+        :return: -
+        """
 
-        self._speech_bubble.scale(bubble_image, animal_images)
-        if self._speech_bubble.visible:
-            self._speech_bubble.show_bubble(self.rect, self.animal)
+        self._exclamation.show_exclamation(self.world_rect.topleft)
+        self._timers.cancel(self._shout_timer)
+        self._shout_timer = self._timers.schedule(settings.EXCLAMATION_MARK_VISIBLE_TIME_MS,
+                                                  self._exclamation.hide_exclamation)
+
+    def cancel_timers(self):
+        self._timers.cancel(self._shout_timer)
+
+    def snapshot(self, values):
+        """
+        Append the state of the owner, its speech bubble, exclamation mark and shadow to the values of a level
+        snapshot. The image, the bubble style and the wanted animal are given when the owner is created.
+        :param values: array of numbers
+        :return: -
+        """
+
+        values.extend((self.world_rect.x, self._position_y))
+        self._brain.snapshot(values)
+        values.extend(self._timers.timer_values(self._shout_timer))
+        self._speech_bubble.snapshot(values)
+        self._exclamation.snapshot(values)
+        self._shadow.snapshot(values)
+
+    def restore(self, values):
+        """
+        Take the state of the owner, its speech bubble, exclamation mark and shadow from the values of a level
+        snapshot.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.world_rect.x = int(next(values))
+        self._position_y = next(values)
+        self.world_rect.y = round(self._position_y)
+        self.dirty = 1
+        self._brain.restore(values)
+        shout_timer = (next(values), next(values))
+        self._speech_bubble.restore(values)
+        self._exclamation.restore(values)
+        self._shadow.restore(values)
+        self._shout_timer = self._timers.restore_timer(*shout_timer, self._exclamation.hide_exclamation)
 
     def update(self, dt):
 
         self._brain.update(dt)
-        if self._exclamation.visible and pygame.time.get_ticks() - self._shout_start_time > settings.EXCLAMATION_MARK_VISIBLE_TIME_MS:
-            self._shout_start_time = 0
-            self._exclamation.hide_exclamation()
 
 
-class Circle(pygame.sprite.DirtySprite):
-    def __init__(self, player_size):
+class Circle(WorldSprite):
+
+    # The circle is moved by the player, so the game level does not update it
+    ticks = False
+
+    def __init__(self, player_rect):
+        """
+        The circle showing the call radius around the player.
+        :param player_rect: Rect of the player in world coordinates. The radius depends on the width of the player.
+        """
         pygame.sprite.DirtySprite.__init__(self)
 
+        call_circle_radius = int(1.5 * player_rect.width)
+
+        # Create a transparent surface for the circle
+        self._world_image = pygame.Surface((2 * call_circle_radius, 2 * call_circle_radius), pygame.SRCALPHA, 32)
+        # Draw a transparent circle on the surface
+        pygame.draw.circle(self._world_image, settings.CALL_CIRCLE_COLOR, (call_circle_radius, call_circle_radius),
+                           call_circle_radius)
+        self.world_rect = self._world_image.get_rect()
+        # Create mask for collision detection with the animals
+        self.mask = pygame.mask.from_surface(self._world_image, settings.CALL_CIRCLE_COLOR[3] - 3)
+
         self.image = None
         self.rect = None
-        self.mask = None
+        self.scale_circle()
 
-        self.scale_circle(player_size)
+        # Move to new place
+        self.move(player_rect.center)
 
     def move(self, position):
         """
@@ -406,68 +847,78 @@ class Circle(pygame.sprite.DirtySprite):
         :param position: Point where the center of the circle is moved to. Tuple of type (x, y)
         :return: -
         """
-        self.rect.center = position
+        self.world_rect.center = position
         self.dirty = 1
 
+    def overlaps(self, animal):
+        """
+        Check if an animal is inside the circle. The masks of both are in world coordinates.
+        :param animal: Animal sprite
+        :return: boolean
+        """
+        offset = (animal.world_rect.x - self.world_rect.x, animal.world_rect.y - self.world_rect.y)
+        return self.mask.overlap(animal.mask, offset) is not None
+
     def update(self, dt):
         pass
 
-    def scale_circle(self, player_rect):
-
-
-        call_circle_radius = int(1.5 * player_rect.width)
+    def scale_circle(self):
+        """
+        Make the image of the circle for the current screen size.
+        :return: -
+        """
 
-        # Create a transparent surface for the circle
-        self.image = pygame.Surface((2 * call_circle_radius, 2 * call_circle_radius), pygame.SRCALPHA, 32)
-        # Draw a transparent circle on the surface
-        pygame.draw.circle(self.image, settings.CALL_CIRCLE_COLOR, (call_circle_radius, call_circle_radius), call_circle_radius)
+        size = world_to_screen(self.world_rect.size)
+        if size == self.world_rect.size:
+            self.image = self._world_image
+        else:
+            self.image = pygame.transform.smoothscale(self._world_image, size)
         self.rect = self.image.get_rect()
-        # Create mask for collision detection with the animals
-
-        self.mask = pygame.mask.from_surface(self.image, settings.CALL_CIRCLE_COLOR[3] - 3)
-
-
-        # Move to new place
-        self.move(player_rect.center)
+        self.place_on_screen()
+        self.dirty = 1
 
 
-class Bubble(pygame.sprite.DirtySprite):
+class Bubble(Decoration):
     """
-    A sprite class for the speech bubble indicating that player is calling an animal.
+    The speech bubble indicating that player is calling an animal or which animal an owner wants.
     """
-    def __init__(self, bubble_image, animal_images):
-        pygame.sprite.DirtySprite.__init__(self)
 
-        self.bubble_image = bubble_image.copy()
-        self.image = bubble_image
-        self.rect = self.image.get_rect()
+    __slots__ = ("style", "_bubble_images", "_animal_images", "_animal")
 
-        # Hide the bubble
-        self.visible = 0
+    def __init__(self, bubble_images, style, animal_images):
+        """
+        :param bubble_images: list of different speech bubble images
+        :param style: index of the bubble image used by this bubble
+        :param animal_images: dict containing a list of animal images for each animal
+        """
+        self._batch = None
+        self.reset(bubble_images, style, animal_images)
 
-        # Scale all animals to right size for the bubble
-        self._animal_images = {}
-        for animal in animal_images:
-            new_width = int(0.5*animal_images[animal][0].get_rect().width)
-            new_height = int(0.5*animal_images[animal][0].get_rect().height)
-            self._animal_images[animal] = pygame.transform.smoothscale(animal_images[animal][0], (new_width, new_height))
+    def reset(self, bubble_images, style, animal_images):
+        """
+        Initialize the bubble. Used also when a released bubble is taken back into use from a SpritePool.
+        Parameters are the same as for the constructor.
+        """
+
+        Decoration.reset(self, bubble_images[style])
+        self.style = style
+        self._bubble_images = bubble_images
+        self._animal_images = animal_images
+        self._animal = None
 
     def show_bubble(self, player_position, animal):
         """
         Show speech bubble indicating the animal player is calling
-        :param player_position: player sprite's rect
+        :param player_position: player sprite's world_rect
         :param animal: Called animal
         :return: -
         """
 
-        self.image = self.bubble_image.copy()
-        img_rect = self._animal_images[animal].get_rect()
-        img_rect.center = self.image.get_rect().center
-        self.image.blit(self._animal_images[animal], img_rect.topleft)
+        self.image = get_bubble_image(self._bubble_images, self.style, self._animal_images, animal)
+        self._animal = animal
 
-        self.rect.bottomleft = (player_position.right - self.rect.width // 2, player_position.top)
+        self.world_rect.bottomleft = (player_position.right - self.world_rect.width // 2, player_position.top)
         self.visible = 1
-        self.dirty = 1
 
     def hide_bubble(self):
         """
@@ -475,34 +926,99 @@ class Bubble(pygame.sprite.DirtySprite):
         :return: -
         """
         self.visible = 0
-        self.dirty = 1
-
-    def update(self, dt):
-        pass
 
     def move(self, player_position):
-        self.dirty = 1
-        self.rect.bottomleft = player_position.right - self.rect.width // 2, player_position.top
+        self.world_rect.bottomleft = player_position.right - self.world_rect.width // 2, player_position.top
+
+    def snapshot(self, values):
+        Decoration.snapshot(self, values)
+        values.append(-1 if self._animal is None else self._animal)
+
+    def restore(self, values):
+        Decoration.restore(self, values)
+        animal = int(next(values))
+        if animal < 0:
+            self._animal = None
+            self.image = self._bubble_images[self.style]
+        else:
+            self._animal = animal
+            self.image = get_bubble_image(self._bubble_images, self.style, self._animal_images, animal)
+
+    def scale(self, bubble_images, animal_images):
+        self._bubble_images = bubble_images
+        self._animal_images = animal_images
+        if self._animal is None:
+            self.image = bubble_images[self.style]
+        else:
+            self.image = get_bubble_image(bubble_images, self.style, animal_images, self._animal)
 
 
-    def scale(self, image, animal_images):
-        self.bubble_image = image.copy()
-        relocate_rect(self.rect, settings.scale_factor)
-        for animal in animal_images:
-            new_width = int(0.5 * animal_images[animal][0].get_rect().width)
-            new_height = int(0.5 * animal_images[animal][0].get_rect().height)
-            self._animal_images[animal] = pygame.transform.smoothscale(animal_images[animal][0], (new_width, new_height))
+# Speech bubbles with an animal drawn inside, shared by all bubbles. Key: (bubble style, species, bubble size)
+_bubble_cache = {}
 
-class Shadow(pygame.sprite.DirtySprite):
-    def __init__(self, image):
-        pygame.sprite.DirtySprite.__init__(self)
 
-        self.image = image
-        self.rect = self.image.get_rect()
+def get_bubble_image(bubble_images, style, animal_images, species):
+    """
+    Return the bubble image of the given style with a half size picture of the animal in the middle.
+    The images are created once and shared, so they must not be drawn on.
+    :param bubble_images: list of different speech bubble images
+    :param style: index of the bubble image
+    :param animal_images: dict containing a list of animal images for each animal
+    :param species: the animal drawn inside the bubble
+    :return: pygame.Surface
+    """
+
+    key = (style, species, bubble_images[style].get_size())
+    image = _bubble_cache.get(key)
+    if image is None:
+        animal_image = animal_images[species][0]
+        thumbnail = pygame.transform.smoothscale(animal_image, (int(0.5 * animal_image.get_width()),
+                                                                int(0.5 * animal_image.get_height())))
+        image = bubble_images[style].copy()
+        image.blit(thumbnail, thumbnail.get_rect(center=image.get_rect().center))
+        _bubble_cache[key] = image
+
+    return image
 
-    def update(self, dt):
-        pass
+
+def prepare_bubble_images(bubble_images, animal_images):
+    """
+    Create the bubble images for every bubble style and species, so showing a bubble does not create any surfaces.
+    :param bubble_images: list of different speech bubble images
+    :param animal_images: dict containing a list of animal images for each animal
+    :return: -
+    """
+
+    for style in range(len(bubble_images)):
+        for species in animal_images:
+            get_bubble_image(bubble_images, style, animal_images, species)
+
+
+def clear_bubble_images(bubble_images):
+    """
+    Forget the bubble images made for another screen size. Called when the images are rescaled.
+    :param bubble_images: list of speech bubble images of the current size
+    :return: -
+    """
+
+    for key in list(_bubble_cache):
+        style, species, size = key
+        if size != bubble_images[style].get_size():
+            del _bubble_cache[key]
+
+
+class Shadow(Decoration):
+    """
+    Shadow underneath a character.
+    """
+
+    __slots__ = ()
+
+    on_top = False
+
+    def reset(self, image):
+        Decoration.reset(self, image)
+        self.visible = 1
 
     def move(self, position):
-        self.dirty = 1
-        self.rect.midbottom = (position[0],position[1]+3)
\ No newline at end of file
+        self.world_rect.midbottom = (position[0], position[1] + 3)
@@ -1,4 +1,5 @@
 import pygame
+from label_cache import get_font
 
 
 class GameStateManager():
@@ -13,6 +14,9 @@ class GameStateManager():
         self._level_stack = []
         self._current_state = None
         self._current_level_name = ""
+        # Function called with the name of a state that has not been added yet. It blocks until the state is added
+        # (the levels are loaded in the background).
+        self.wait_for_state = None
 
     def add_state(self, level, level_name):
         """
@@ -36,6 +40,10 @@ class GameStateManager():
             print("Error: no level with key", level_name)
             return None
 
+    def _wait_until_added(self, level_name):
+        if level_name not in self._states and self.wait_for_state is not None:
+            self.wait_for_state(level_name)
+
     def set_state(self, level_name):
         """
         Go to another level
@@ -43,6 +51,9 @@ class GameStateManager():
         :return: -
         """
 
+        self._wait_until_added(level_name)
+        if self._current_state is not None:
+            self._current_state.leave()
         self._current_level_name = level_name
         self._current_state = self._states[level_name]
         self._current_state.start_new()
@@ -55,12 +66,27 @@ class GameStateManager():
         :return: -
         """
 
+        self._wait_until_added(level_name)
+        if self._current_state is not None:
+            self._current_state.leave()
         self._states[level_name].start_new()
         self._level_stack.append(self._current_level_name)
         self._current_state = self._states[level_name]
         self._current_level_name = level_name
         self._current_state.start_new()
 
+    def return_to_state(self, level_name):
+        """
+        Go back to a level without starting it again, for example after a snapshot of the level has been restored.
+        :param level_name: String level identifier for the level to go to
+        :return: -
+        """
+
+        if self._current_state is not None:
+            self._current_state.leave()
+        self._current_level_name = level_name
+        self._current_state = self._states[level_name]
+
     def pop_state(self):
         """
         Pop level from the level stack and go to the previous level
@@ -100,15 +126,25 @@ class GameState(object):
     Parent class for individual game states to inherit from.
     """
 
-    # static variable (takes care of state management)
+    # static variable (takes care of state management). A state can be given a manager of its own by setting
+    # game_state_manager on the instance, so that several levels can be run side by side.
     game_state_manager = GameStateManager()
+    # TextureRenderer if the game is drawn through an SDL renderer, None if it is drawn on the display surface
+    renderer = None
+    # QualityGovernor of the game, None for full quality
+    quality = None
+    # RenderThread if the game levels are drawn in a thread of their own, None if they are drawn in the main thread
+    render_thread = None
 
     def __init__(self):
         self.quit = False
-        self.screen_rect = pygame.display.get_surface().get_rect()
-        self.font = pygame.font.Font(None, 24)
+        if GameState.renderer is not None:
+            self.screen = GameState.renderer.canvas
+        else:
+            self.screen = pygame.display.get_surface()
+        self.screen_rect = self.screen.get_rect()
+        self.font = get_font(None, 24)
         self.redraw_background = False
-        self.screen = pygame.display.get_surface()
 
 
     def start_new(self):
@@ -117,6 +153,12 @@ class GameState(object):
         """
         pass
 
+    def leave(self):
+        """
+        Called when another state is set or pushed on top of this state. The screen still shows this state.
+        """
+        pass
+
     def get_event(self, event):
         """
         Handle a single event passed by the Game object.
@@ -142,5 +184,61 @@ class GameState(object):
     def redraw_whole_screen(self, start_thread=False):
         pass
 
+    def is_idle(self):
+        """
+        Tell the Game object whether the state has no animation and no pending timers, i.e. nothing changes on the
+        screen until the next event. The game loop sleeps while the current state is idle.
+        """
+        return False
+
+    @staticmethod
+    def wait_for_render_thread():
+        """
+        Wait until the render thread has drawn the submitted frames, so the screen can be drawn on. Does nothing if
+        there is no render thread.
+        :return: -
+        """
+        if GameState.render_thread is not None:
+            GameState.render_thread.wait()
+
+    def update_display(self, rectlist):
+        """
+        Push the changed areas of the screen to the display. If the whole screen has been redrawn
+        (redraw_background is set), the whole display is updated instead. With an SDL renderer the whole screen is
+        always uploaded.
+        :param rectlist: list of changed areas (Rect)
+        :return: -
+        """
+
+        # A state drawn on a surface of its own, like a level of a bot, is not shown
+        if self.screen is not pygame.display.get_surface() and \
+                (GameState.renderer is None or self.screen is not GameState.renderer.canvas):
+            self.redraw_background = False
+            return
+
+        if GameState.renderer is not None:
+            self.redraw_background = False
+            GameState.renderer.present_surface(self.screen)
+        elif self.redraw_background:
+            self.redraw_background = False
+            pygame.display.update()
+        else:
+            pygame.display.update(rectlist)
+
     def give_scaled_graphics(self):
         pass
+
+    def apply_quality(self):
+        """
+        Called when the quality governor has changed the quality.
+        """
+        pass
+
+    @staticmethod
+    def quality_enabled(feature):
+        """
+        Tell whether a feature is used at the current quality.
+        :param feature: Name of the feature, see quality.py
+        :return: boolean
+        """
+        return GameState.quality is None or GameState.quality.enabled(feature)
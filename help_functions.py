@@ -1,4 +1,7 @@
 import os
+import weakref
+import pygame
+import settings
 from settings import *
 import random
 from math import pi, sin, cos
@@ -14,7 +17,9 @@ def load_image(pygame, file_name, scale_factor=1):
         print("Cannot load image:", file_name)
         raise SystemExit(message)
 
-    image = image.convert_alpha()
+    # Without a display surface (SDL renderer) the image is used in the format it was loaded in
+    if pygame.display.get_surface() is not None:
+        image = image.convert_alpha()
     if scale_factor != 1:
         image = pygame.transform.smoothscale(image, (image.get_width() // scale_factor, image.get_height() // scale_factor))
 
@@ -70,3 +75,92 @@ def relocate_rect(rect, scale):
 
 def relocate_point(point, scale):
     return (int(scale[0] * point[0]), int(scale[1] * point[1]))
+
+
+def world_to_screen(point):
+    """
+    Return the place of a point of the game world on the screen.
+    :param point: Point in world coordinates as tuple (x, y)
+    :return: Point in screen coordinates as tuple (x, y)
+    """
+    return round(point[0] * settings.screen_scale[0]), round(point[1] * settings.screen_scale[1])
+
+
+def world_to_screen_rect(rect):
+    """
+    Return the area of the screen covered by an area of the game world.
+    :param rect: Rect in world coordinates
+    :return: Rect in screen coordinates
+    """
+
+    left, top = world_to_screen(rect.topleft)
+    right, bottom = world_to_screen(rect.bottomright)
+    return pygame.Rect(left, top, right - left, bottom - top)
+
+
+# Sizes in the game world of the images scaled for the screen. The scaled sizes are rounded, so the world size cannot
+# be computed back from them exactly. Key: scaled image
+_world_sizes = weakref.WeakKeyDictionary()
+
+
+def set_world_size(image, size):
+    """
+    Remember the size of an image, scaled for the screen, in the game world.
+    :param image: Image scaled to the current screen size
+    :param size: Size of the image in the game world as tuple (width, height)
+    :return: -
+    """
+    _world_sizes[image] = size
+
+
+def world_size(image):
+    """
+    Return the size of an image, scaled for the screen, in the game world.
+    :param image: Image scaled to the current screen size
+    :return: Size as tuple (width, height)
+    """
+
+    size = _world_sizes.get(image)
+    if size is not None:
+        return size
+    # Images in the world size, and images that have not been given a world size
+    return round(image.get_width() / settings.screen_scale[0]), round(image.get_height() / settings.screen_scale[1])
+
+
+def flip_image(image):
+    """
+    Return an image flipped horizontally, with the same size in the game world as the image.
+    :param image: Image scaled to the current screen size
+    :return: pygame.Surface
+    """
+
+    flipped = pygame.transform.flip(image, True, False)
+    set_world_size(flipped, world_size(image))
+    return flipped
+
+
+def segment_entry_time(start, motion, rect):
+    """
+    Return the fraction of a movement after which a moving point enters a rect.
+    :param start: Start point as tuple (x, y)
+    :param motion: Movement of the point as tuple (x, y)
+    :param rect: Rect
+    :return: Number between 0 and 1, 0 if the point starts inside the rect. None if the point does not enter the rect.
+    """
+
+    enter_time = 0
+    leave_time = 1
+    for position, step, low, high in ((start[0], motion[0], rect.left, rect.right),
+                                      (start[1], motion[1], rect.top, rect.bottom)):
+        if step == 0:
+            if position < low or position >= high:
+                return None
+        else:
+            low_time = (low - position) / step
+            high_time = (high - position) / step
+            enter_time = max(enter_time, min(low_time, high_time))
+            leave_time = min(leave_time, max(low_time, high_time))
+            if enter_time >= leave_time:
+                return None
+
+    return enter_time
@@ -0,0 +1,149 @@
+from collections import OrderedDict
+import pygame
+import settings
+
+# Shared font objects, the least recently used first. Key: (font name, size, system font)
+_fonts = OrderedDict()
+# Rendered text labels, the least recently used first. Key: (text, font name, size, bold, underline, color, system font)
+_labels = OrderedDict()
+# Buttons with their label blitted on top. Key: (text, font name, size, selected, color, size of the button image)
+_buttons = {}
+
+
+def _remember(cache, key, value, limit):
+    """
+    Add a value to a cache and forget the least recently used values if there are more than limit of them.
+    """
+
+    cache[key] = value
+    while len(cache) > limit:
+        cache.popitem(last=False)
+
+
+def get_font(name=None, size=24, system_font=False):
+    """
+    Return a shared font object. Creating fonts (especially system fonts) is slow, so each font is created only once.
+    :param name: Font file or system font name. None means the pygame default font.
+    :param size: Size of the font
+    :param system_font: True if the font is looked up with pygame.font.SysFont
+    :return: pygame.font.Font
+    """
+
+    key = (name, size, system_font)
+    font = _fonts.get(key)
+    if font is None:
+        if system_font:
+            font = pygame.font.SysFont(name, size)
+        else:
+            font = pygame.font.Font(name, size)
+        _remember(_fonts, key, font, settings.FONT_CACHE_SIZE)
+    else:
+        _fonts.move_to_end(key)
+
+    return font
+
+
+def render_label(text, name=None, size=24, color=(0, 0, 0), bold=False, underline=False, system_font=False):
+    """
+    Return the text rendered with the given font. The result is cached and shared, so it must not be drawn on.
+    :param text: Text to render
+    :param name: Font file or system font name
+    :param size: Size of the font
+    :param color: Color of the text as rgb tuple
+    :param bold: Render the text bold
+    :param underline: Render the text underlined
+    :param system_font: True if the font is a system font
+    :return: pygame.Surface
+    """
+
+    key = (text, name, size, bold, underline, tuple(color), system_font)
+    label = _labels.get(key)
+    if label is None:
+        font = get_font(name, size, system_font)
+
+        # The font object is shared, so its style is set only for the duration of the render call
+        font.set_bold(bold)
+        font.set_underline(underline)
+        label = font.render(text, True, color)
+        font.set_bold(False)
+        font.set_underline(False)
+
+        _remember(_labels, key, label, settings.LABEL_CACHE_SIZE)
+    else:
+        _labels.move_to_end(key)
+
+    return label
+
+
+def render_button(button_image, text, name=None, size=30, color=(255, 255, 255), selected=False):
+    """
+    Return a button image with the text centered on it. Selected buttons have bold and underlined text.
+    Buttons are cached by the text, font, color and the size of the button image.
+    :param button_image: Image of the empty button
+    :param text: Text on the button
+    :param name: Font file or system font name
+    :param size: Size of the font
+    :param color: Color of the text as rgb tuple
+    :param selected: Is the button selected
+    :return: pygame.Surface
+    """
+
+    key = (text, name, size, selected, tuple(color), button_image.get_size())
+    button = _buttons.get(key)
+    if button is None:
+        label = render_label(text, name, size, color, selected, selected)
+
+        button = button_image.copy()
+        label_rect = label.get_rect(center=button.get_rect().center)
+        button.blit(label, label_rect)
+
+        _buttons[key] = button
+
+    return button
+
+
+def clear_button_cache():
+    """
+    Forget the rendered buttons. Called when the button images are rescaled.
+    :return: -
+    """
+    _buttons.clear()
+
+
+def clear_label_cache():
+    """
+    Forget the fonts and the rendered labels. Called when the window is resized, because the text of the Instructions
+    page is then rendered in new font sizes and the old sizes are not used any more.
+    :return: -
+    """
+    _labels.clear()
+    _fonts.clear()
+
+
+def wrap_text(text, name=None, size=24, width=100, system_font=False):
+    """
+    Split text into rows that fit into the given width. Words are never split, so a single word longer than the width
+    gets a row of its own.
+    :param text: Text to wrap
+    :param name: Font file or system font name
+    :param size: Size of the font
+    :param width: Maximum width of a row in pixels
+    :param system_font: True if the font is a system font
+    :return: list of rows (strings)
+    """
+
+    font = get_font(name, size, system_font)
+    rows = []
+    row = ""
+    for word in text.split():
+        candidate = word if row == "" else row + " " + word
+        if row != "" and font.size(candidate)[0] > width:
+            rows.append(row)
+            row = word
+        else:
+            row = candidate
+
+    if row != "":
+        rows.append(row)
+
+    return rows
@@ -1,9 +1,43 @@
+import os
 import sys
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from game_level import *
 from menus import *
 from audio import SoundEventInterface
 from pygame.transform import smoothscale
 import settings
+from label_cache import clear_button_cache, clear_label_cache
+from help_functions import set_world_size
+from texture_renderer import TextureRenderer
+from asset_pack import AssetPack, resident_bytes
+from quality import QualityGovernor, SMOOTH_SCALING
+from frame_pacing import FramePacer
+from render_thread import RenderThread
+from call_events import CallEvents, forward_polled_calls
+from species import all_species, get_species, species_id
+
+# Image files of each asset key. The animations of the animals are listed in the species manifest.
+ASSET_FILES = {
+    "menu_background": "bg_main_menu.png",
+    "background": "bg_grass.png",
+    "player_images": ["caretaker_step" + str(i) + ".png" for i in range(0, 7)],
+    "bubble_images": ["speech_bubble_01.png", "speech_bubble_02.png", "thought_bubble.png"],
+    "owner_images": ["owner_1.png", "owner_2.png", "owner_3.png", "owner_4.png"],
+    "paw_images": ["paw_active.png", "paw_deactive.png"],
+    "fence_images": ["fence.png", "fence_back.png", "fence_left.png", "fence_right.png"],
+    "button": "button.png",
+    "gate_image": "gate.png",
+    "exclamation_image": "exclamation.png",
+    "heard_image": "question_mark.png",
+    "shadow_image": "shadow.png",
+    "instructions": "instructions_picture.png",
+}
+
+# Images of the menus. They are loaded first, the others are loaded in the background while the main menu is shown.
+MENU_ASSETS = ["menu_background", "button", "instructions"]
 
 
 class Game(object):
@@ -18,36 +52,129 @@ class Game(object):
     https://gist.github.com/iminurnamez/8d51f5b40032f106a847
     """
 
-    def __init__(self, screen):
+    def __init__(self, screen, sound_event_interface=None, add_levels=True):
         """
         Initialize the Game object.
-        screen: the pygame display surface
+        screen: the pygame display surface, or the canvas of the TextureRenderer
+        sound_event_interface: object taking care of the audio input and classification.
+                               By default SoundEventInterface, which listens to the microphone.
+        add_levels: add the menus and the game levels to the game state manager. Without them the Game only loads
+                    the images, for example for creating levels for bots with create_level.
+
+        With the levels, only the images of the menus are loaded before the main menu is shown. The rest are loaded
+        in the background, and the levels are added when they are ready.
         """
 
+        self._start_time = time.perf_counter()
+        # Seconds from the start to the first frame and to the moment all levels can be played, and how long Start
+        # had to wait for the levels
+        self.startup_times = {}
         self._screen = screen
         self.old_screen_size = None
-        self._clock = pygame.time.Clock()
-        self._fps = FPS
+        self._frame_pacer = FramePacer(FPS)
+        # Original images. With an asset pack only the ones that fit in ASSET_MEMORY_BUDGET_MB are kept here.
         self.original_files = {}
-        self.scaled_files = {'animal_images': {}}
+        self._asset_pack = None
+        # The animation images of the loaded species by species id, given to the levels. The species are loaded when
+        # a level that has them is started.
+        self.scaled_files = {"animal_animations": {}}
+        self.world_files = {}
         self._mouse_down = False
 
+        # Wall time, CPU time and number of frames spent in each state, for checking the idle mode
+        self._state_usage = {}
+
         self._level_manager = GameState.game_state_manager
 
         # Class for handling audio input and classifying data
-        self._sound_event_interface = SoundEventInterface()
+        if sound_event_interface is None:
+            sound_event_interface = SoundEventInterface()
+        self._sound_event_interface = sound_event_interface
+        # Calls pushed by the audio input in the asyncio game loop, None when the levels poll for calls
+        self.call_events = None
+
+        # Thread loading the images of the levels, and the result it gives when it is done
+        self._loader = None
+        self._loaded = threading.Event()
+        self._loader_result = None
+        self._levels = []
 
         self.load_graphics()
-        self.initialize_images()
-        self._add_game_levels()
+        if add_levels:
+            self.initialize_images(MENU_ASSETS)
+            self._add_menus()
+            self._loader = threading.Thread(target=self._load_in_background,
+                                            args=([key for key in ASSET_FILES if key not in MENU_ASSETS],), daemon=True)
+            self._loader.start()
+            # Start waits for the levels if they are not ready yet
+            self._level_manager.wait_for_state = self._wait_for_levels
+        else:
+            self.initialize_images(ASSET_FILES.keys())
 
-    def _add_game_levels(self):
+    def _load_in_background(self, keys):
+        """
+        Load and scale the images in the background thread. The results are taken into use in the main thread.
+        :param keys: asset keys to load
+        :return: -
+        """
+
+        try:
+            self._loader_result = self._scale_for_world(keys)
+        except Exception as error:
+            self._loader_result = error
+        self._loaded.set()
+
+    def poll_loading(self):
+        """
+        Add the levels if the background loading has finished. Called by the game loop.
+        :return: -
+        """
+
+        if self._loader is not None and self._loaded.is_set():
+            self._finish_loading()
+
+    def _wait_for_levels(self, state_name):
+        """
+        Block until the background loading has finished and the levels have been added.
+        :param state_name: name of the state that was not ready
+        :return: -
+        """
+
+        if self._loader is not None:
+            start = time.perf_counter()
+            self._loaded.wait()
+            self._finish_loading()
+            self.startup_times["waited for the levels"] = time.perf_counter() - start
+
+    def _finish_loading(self):
+        """
+        Take the images loaded in the background into use and add the game levels.
+        :return: -
+        """
+
+        self._loader.join()
+        self._loader = None
+        if isinstance(self._loader_result, Exception):
+            raise self._loader_result
+
+        world_images, originals = self._loader_result
+        self._loader_result = None
+        self.world_files.update(world_images)
+        self.scaled_files.update(world_images)
+        self._drop_originals(originals)
 
-        # Menus
+        # The window may have been resized while the images were loaded
+        if settings.screen_scale != (1, 1):
+            self._scale_images(world_images.keys())
+
+        self._add_game_levels()
+        self.startup_times["time to interactive"] = time.perf_counter() - self._start_time
+
+    def _add_menus(self):
         self._level_manager.add_state(
             GameMenu(('Start', 'Instructions', 'Quit'), self.scaled_files["button"],
                      background=self.scaled_files["menu_background"]), "main_menu")
-        self._level_manager.add_state(Instructions(self.scaled_files["instructions"]), "instructions")
+        self._level_manager.add_state(Instructions(self.scaled_files["instructions"], self.scaled_files["button"]), "instructions")
         self._level_manager.add_state(
             GameMenu(("Continue", "Instructions", "Main menu"), self.scaled_files["button"],
                      background=(0, 0, 130, 50)), "pause_menu")
@@ -58,74 +185,97 @@ class Game(object):
             GameMenu(("Next level", "Main menu"), self.scaled_files["button"], "Level completed!",
                      background=(0, 0, 130, 50)), "next_level_menu")
 
+        self._levels = ["main_menu", "instructions", "pause_menu", "game_ended_menu", "next_level_menu"]
+        self.set_screens_for_levels()
+
+        # start game from main menu
+        self._level_manager.set_state("main_menu")
+
+    def _add_game_levels(self):
+
         # Game levels
-        self._level_manager.add_state(
-            GameLevel(["dog", "cat"], self.scaled_files["background"],
-                      self.scaled_files["player_images"],
-                      self.scaled_files["animal_animations"],
-                      self.scaled_files["bubble_images"],
-                      self.scaled_files["owner_images"],
-                      self.scaled_files["paw_images"],
-                      self.scaled_files["fence_images"],
-                      self.scaled_files["exclamation_image"],
-                      self.scaled_files["gate_image"],
-                      self.scaled_files["heard_image"],
-                      self.scaled_files["shadow_image"],
-                      self._sound_event_interface), "level_1")
+        self._level_manager.add_state(self.create_level(["dog", "cat"]), "level_1")
+        self._level_manager.add_state(self.create_level(["dog", "cat", "pig"]), "level_2")
+        self._level_manager.add_state(self.create_level(["dog", "cat", "pig", "sheep"]), "level_3")
+        self._level_manager.add_state(self.create_level(["dog", "cat", "pig", "sheep", "cow"]), "level_4")
 
-        self._level_manager.add_state(
-            GameLevel(["dog", "cat", "pig"], self.scaled_files["background"],
-                      self.scaled_files["player_images"],
-                      self.scaled_files["animal_animations"],
-                      self.scaled_files["bubble_images"],
-                      self.scaled_files["owner_images"],
-                      self.scaled_files["paw_images"],
-                      self.scaled_files["fence_images"],
-                      self.scaled_files["exclamation_image"],
-                      self.scaled_files["gate_image"],
-                      self.scaled_files["heard_image"],
-                      self.scaled_files["shadow_image"],
-                      self._sound_event_interface), "level_2")
+        self._levels += ["level_1", "level_2", "level_3", "level_4"]
+        for level in ["level_1", "level_2", "level_3", "level_4"]:
+            self._level_manager.get_state(level).screen = self._screen
 
-        self._level_manager.add_state(
-            GameLevel(["dog", "cat", "pig", "sheep"], self.scaled_files["background"],
-                      self.scaled_files["player_images"],
-                      self.scaled_files["animal_animations"],
-                      self.scaled_files["bubble_images"],
-                      self.scaled_files["owner_images"],
-                      self.scaled_files["paw_images"],
-                      self.scaled_files["fence_images"],
-                      self.scaled_files["exclamation_image"],
-                      self.scaled_files["gate_image"],
-                      self.scaled_files["heard_image"],
-                      self.scaled_files["shadow_image"],
-                      self._sound_event_interface), "level_3")
+    def create_level(self, animals, sound_event_interface=None):
+        """
+        Create a game level using the scaled images of the game.
+        :param animals: list of the names of the species of the animals on the level, one item for each animal
+        :param sound_event_interface: audio input of the level. By default the audio input of the game.
+        :return: GameLevel
+        """
 
-        self._level_manager.add_state(
-            GameLevel(["dog", "cat", "pig", "sheep", "cow"], self.scaled_files["background"],
-                      self.scaled_files["player_images"],
-                      self.scaled_files["animal_animations"],
-                      self.scaled_files["bubble_images"],
-                      self.scaled_files["owner_images"],
-                      self.scaled_files["paw_images"],
-                      self.scaled_files["fence_images"],
-                      self.scaled_files["exclamation_image"],
-                      self.scaled_files["gate_image"],
-                      self.scaled_files["heard_image"],
-                      self.scaled_files["shadow_image"],
-                      self._sound_event_interface), "level_4")
+        self.wait_until_loaded()
+
+        if sound_event_interface is None:
+            sound_event_interface = self._sound_event_interface
+
+        level = GameLevel([species_id(animal) for animal in animals], self.scaled_files["background"],
+                          self.scaled_files["player_images"],
+                          self.scaled_files["animal_animations"],
+                          self.scaled_files["bubble_images"],
+                          self.scaled_files["owner_images"],
+                          self.scaled_files["paw_images"],
+                          self.scaled_files["fence_images"],
+                          self.scaled_files["exclamation_image"],
+                          self.scaled_files["gate_image"],
+                          self.scaled_files["heard_image"],
+                          self.scaled_files["shadow_image"],
+                          sound_event_interface)
+        # The animations of the animals are loaded when the level is started
+        level.species_loader = self.load_species
+        level.poll_calls = self.call_events is None
+        return level
+
+    def load_species(self, species_ids):
+        """
+        Load the animation images of species that have not been loaded yet.
+        :param species_ids: list of species ids
+        :return: -
+        """
 
-        self.set_screens_for_levels()
+        keys = [get_species(species).asset_key for species in species_ids
+                if get_species(species).asset_key not in self.world_files]
+        if not keys:
+            return
+
+        world_images, originals = self._scale_for_world(keys)
+        self._drop_originals(originals)
+        self.world_files.update(world_images)
+        self.scaled_files.update(world_images)
+        if settings.screen_scale != (1, 1):
+            self._scale_images(keys)
+        else:
+            self._update_animal_animations()
 
-        # start game from main menu
-        self._level_manager.set_state("main_menu")
+    def _update_animal_animations(self):
+        """
+        Put the scaled animations of the loaded species to the dict given to the levels. The dict stays the same, so
+        the levels see the species loaded by other levels.
+        :return: -
+        """
+
+        animations = self.scaled_files["animal_animations"]
+        for species in all_species():
+            if species.asset_key in self.scaled_files:
+                animations[species.id] = self.scaled_files[species.asset_key]
+
+    def wait_until_loaded(self):
+        """
+        Block until all images have been loaded and the levels have been added.
+        :return: -
+        """
+        self._wait_for_levels(None)
 
     def set_screens_for_levels(self):
         # PURKKAA KOKO SYSTEEMI...
 
-        self._levels = ["main_menu", "instructions", "pause_menu", "game_ended_menu", "next_level_menu", "level_1",
-                        "level_2",
-                        "level_3", "level_4"]
         for level in self._levels:
             self._level_manager.get_state(level).screen = self._screen
 
@@ -133,176 +283,274 @@ class Game(object):
             GameState.game_state_manager.get_current_state().redraw_whole_screen()
 
     def load_graphics(self):
-        # Load background
-        self.original_files["menu_background"] = load_image(pygame, "bg_main_menu.png")
-        self.original_files["background"] = load_image(pygame, "bg_grass.png")
+        """
+        Open the asset pack if there is one. The images themselves are loaded when they are scaled.
+        :return: -
+        """
+
+        # The originals are copied out of the asset pack only when they are scaled
+        pack_file = os.path.join("graphics", settings.ASSET_PACK)
+        if settings.ASSET_PACK and os.path.exists(pack_file):
+            try:
+                self._asset_pack = AssetPack(pack_file)
+            except ValueError as message:
+                print("Cannot use the asset pack:", message)
+
+    def _load_files(self, files):
+        """
+        Load an image file, or a list or a dict of them.
+        """
+
+        if type(files) == dict:
+            return {name: self._load_files(files[name]) for name in files}
+        elif type(files) == list:
+            return [self._load_files(file_name) for file_name in files]
+        else:
+            return load_image(pygame, files)
+
+    def initialize_images(self, keys):
+        """
+        Load the images of asset keys and scale them to the size of the game world.
+        :param keys: asset keys
+        :return: -
+        """
 
-        # Load animal images
-        animals = ["cat", "cow", "dog", "pig", "sheep"]
-        self.original_files["animal_images"] = {animal: load_image(pygame, animal + "_step0.png") for animal in animals}
+        world_images, originals = self._scale_for_world(keys)
+        self._drop_originals(originals)
+        self.scaled_files.update(world_images)
 
-        # Load animal animations
-        self.original_files["animal_animations"] = {}
-        for animal in animals:
-            file_name = animal + "_step"
-            self.original_files["animal_animations"][animal] = [load_image(pygame, file_name + str(i) + ".png") for i in
-                                                                range(0, 8)]
+        # The images in the size of the game world, used for scaling the images when the window is resized
+        self.world_files.update(world_images)
 
-        # Load player image
-        self.original_files["player_images"] = [load_image(pygame, "caretaker_step" + str(i) + ".png") for i in range(0,7)]
-
-        # Load bubble images
-        bubble_files = ["speech_bubble_01.png", "speech_bubble_02.png", "thought_bubble.png"]
-        self.original_files["bubble_images"] = [load_image(pygame, bubble_file) for bubble_file in bubble_files]
-
-        # Load owner images
-        owner_files = ["owner_1.png", "owner_2.png", "owner_3.png", "owner_4.png"]
-        self.original_files["owner_images"] = [load_image(pygame, owner_file) for owner_file in owner_files]
-
-        # Load UI images
-        UI_paw_active = load_image(pygame, "paw_active.png")
-        UI_paw_deactive = load_image(pygame, "paw_deactive.png")
-        self.original_files["paw_images"] = [UI_paw_active, UI_paw_deactive]
-
-        fence_image = load_image(pygame, "fence.png")
-        fence_back_image = load_image(pygame, "fence_back.png")
-        fence_left_image = load_image(pygame, "fence_left.png")
-        fence_right_image = load_image(pygame, "fence_right.png")
-        self.original_files["fence_images"] = [fence_image, fence_back_image, fence_left_image, fence_right_image]
-
-        self.original_files["button"] = load_image(pygame, "button.png")
-        self.original_files["gate_image"] = load_image(pygame, "gate.png")
-        self.original_files["exclamation_image"] = load_image(pygame, "exclamation.png")
-        self.original_files["heard_image"] = load_image(pygame, "question_mark.png")
-        self.original_files["shadow_image"] = load_image(pygame, "shadow.png")
-
-        self.original_files["instructions"] = load_image(pygame, "instructions_picture.png")
-
-    def initialize_images(self):
-
-        self.scaled_files = self.original_files.copy()
-
-        # Animals
-        self.scaled_files["animal_images"] = self.original_files["animal_images"].copy()
-        for animal in self.original_files["animal_images"]:
-            img = self.original_files["animal_images"][animal]
-            self.scaled_files["animal_images"][animal] = smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-
-        # Animal animations
-        self.scaled_files["animal_animations"] = self.original_files["animal_animations"].copy()
-        for animal in self.original_files["animal_animations"]:
-            self.scaled_files["animal_animations"][animal] = [
-                smoothscale(img, (img.get_width() // 3, img.get_height() // 3)) for img in
-                self.scaled_files["animal_animations"][animal]]
-
-        # Player
-        self.scaled_files["player_images"] = [smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-                                              for img in self.scaled_files["player_images"]]
-
-        # bubbles
-        self.scaled_files["bubble_images"] = [smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-                                              for img in self.scaled_files["bubble_images"]]
-
-        # Owners
-        self.scaled_files["owner_images"] = [smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-                                             for img in self.scaled_files["owner_images"]]
-
-        self.scaled_files["paw_images"] = [smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-                                           for img in self.scaled_files["paw_images"]]
-
-        self.scaled_files["fence_images"] = [smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-                                             for img in self.scaled_files["fence_images"]]
-
-        img = self.scaled_files["instructions"]
-        self.scaled_files["instructions"] = smoothscale(img, (img.get_width() // 2, img.get_height() // 2))
-
-        img = self.scaled_files["button"]
-        self.scaled_files["button"] = smoothscale(img, (img.get_width() // 2, img.get_height() // 2))
-
-        img = self.scaled_files["exclamation_image"]
-        self.scaled_files["exclamation_image"] = smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-
-        img = self.scaled_files["gate_image"]
-        self.scaled_files["gate_image"] = smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-
-        img = self.scaled_files["heard_image"]
-        self.scaled_files["heard_image"] = smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-        
-        img = self.scaled_files["shadow_image"]
-        self.scaled_files["shadow_image"] = smoothscale(img, (img.get_width() // 3, img.get_height() // 3))
-
-        img = self.scaled_files["background"]
-        self.scaled_files["background"] = smoothscale(img, (img.get_width() // 2, img.get_height() // 2))
-
-        img = self.scaled_files["menu_background"]
-        self.scaled_files["menu_background"] = smoothscale(img, (img.get_width() // 2, img.get_height() // 2))
-
-    def _scale_images(self, screen_size):
-
-        for key in self.scaled_files:
-
-            if type(self.scaled_files[key]) == dict:
-                for animal in self.scaled_files[key]:
-                    if type(self.scaled_files[key][animal]) == list:
-                        self.scaled_files[key][animal] = [
-                            smoothscale(self.original_files[key][animal][i], self._scaled_size(
-                                self.scaled_files[key][animal][i].get_size(), screen_size)) for i in
-                            range(len(self.scaled_files[key][animal]))]
-                    else:
-                        self.scaled_files[key][animal] = smoothscale(self.original_files[key][animal],
-                                                                     self._scaled_size(
-                                                                         self.scaled_files[key][animal].get_size(),
-                                                                         screen_size))
-
-            elif type(self.scaled_files[key]) == list:
-                for i in range(len(self.scaled_files[key])):
-                    self.scaled_files[key][i] = smoothscale(self.original_files[key][i],
-                                                            self._scaled_size(self.scaled_files[key][i].get_size(),
-                                                                              screen_size))
+    def _scale_for_world(self, keys):
+        """
+        Load the original images of asset keys and shrink them to the size of the game world: the backgrounds, the
+        instructions and the button to half and everything else to a third.
+        :param keys: asset keys
+        :return: dict of the images in the world size, dict of the original images
+        """
+
+        halved = ["menu_background", "background", "instructions", "button"]
+        originals = self._load_originals(keys)
+        jobs = {}
+        for key, original in originals.items():
+            jobs[key] = (self._shrink, original, 2 if key in halved else 3)
+
+        world_images = self._run_scaling_jobs(jobs)
+        # The world images are also used on the screen until the window is resized
+        for key in world_images:
+            self._set_world_sizes(world_images[key], world_images[key])
+        return world_images, originals
+
+    def _shrink(self, original, divisor):
+        """
+        Shrink an original image, or a list or a dict of them, to a fraction of its size.
+        """
+
+        if type(original) == dict:
+            return {name: self._shrink(original[name], divisor) for name in original}
+        elif type(original) == list:
+            return [self._shrink(image, divisor) for image in original]
+        else:
+            return smoothscale(original, (original.get_width() // divisor, original.get_height() // divisor))
+
+    def _scale_images(self, keys=None):
+        """
+        Scale the original images for the screen. The sizes are calculated from the sizes of the images in the game
+        world, so they do not change little by little when the window is resized many times.
+        :param keys: asset keys to scale. By default all loaded images.
+        :return: -
+        """
+
+        if keys is None:
+            keys = list(self.world_files.keys())
+        originals = self._load_originals(keys)
+        jobs = {key: (self._scale_like, originals[key], self.world_files[key]) for key in keys}
+        scaled_images = self._run_scaling_jobs(jobs)
+        for key in keys:
+            self._set_world_sizes(scaled_images[key], self.world_files[key])
+        self.scaled_files.update(scaled_images)
+        self._drop_originals(originals)
+        self._update_animal_animations()
+
+    def _load_originals(self, keys):
+        """
+        Return the original images of asset keys. The ones that are not kept in memory are copied out of the asset
+        pack, or loaded from the image files if there is no pack or the pack is older than the files.
+        :param keys: asset keys
+        :return: dict, key: asset key, value: original images
+        """
+
+        originals = {}
+        for key in keys:
+            if key in self.original_files:
+                originals[key] = self.original_files[key]
+            elif self._asset_pack is not None and key in self._asset_pack and \
+                    self._asset_pack.is_current(key, self.asset_files(key)):
+                originals[key] = self._asset_pack.load(key)
             else:
-                self.scaled_files[key] = smoothscale(self.original_files[key],
-                                                     self._scaled_size(self.scaled_files[key].get_size(), screen_size))
+                originals[key] = self._load_files(self.asset_files(key))
+        return originals
+
+    def asset_files(self, key):
+        """
+        Return the image files of an asset key.
+        """
 
-    def _scaled_size(self, image_size, screen_size):
+        if key in ASSET_FILES:
+            return ASSET_FILES[key]
+        return [species.frame_files for species in all_species() if species.asset_key == key][0]
 
-        width = int((image_size[0] * screen_size[0]) / self.old_screen_size[0])
-        height = int((image_size[1] * screen_size[1]) / self.old_screen_size[1])
+    def _drop_originals(self, originals):
+        """
+        After scaling keep only the original images that fit in ASSET_MEMORY_BUDGET_MB with the ones already kept, the
+        others are loaded from the asset pack again for the next scaling. Without an asset pack all originals are
+        kept.
+        :param originals: dict of the original images used for the scaling
+        :return: -
+        """
+
+        if self._asset_pack is None:
+            self.original_files.update(originals)
+            return
+
+        budget = settings.ASSET_MEMORY_BUDGET_MB * 1024 * 1024
+        used = resident_bytes({key: images for key, images in self.original_files.items() if key not in originals})
+        for key in originals:
+            self.original_files.pop(key, None)
+        for key, images in originals.items():
+            size = resident_bytes(images)
+            if used + size <= budget:
+                self.original_files[key] = images
+                used += size
+
+    def print_memory_report(self):
+        """
+        Print the memory used by the pixels of the images of each asset key. Images shared by the world and the screen
+        sizes are counted once.
+        :return: -
+        """
+
+        seen = set()
+        print("asset key           originals (KB)  scaled (KB)")
+        total_originals = 0
+        total_scaled = 0
+        for key in self.world_files:
+            originals = resident_bytes(self.original_files[key], seen) if key in self.original_files else 0
+            scaled = resident_bytes(self.world_files[key], seen) + resident_bytes(self.scaled_files[key], seen)
+            total_originals += originals
+            total_scaled += scaled
+            print("{:<18} {:>15} {:>12}".format(key, originals // 1024, scaled // 1024))
+        print("{:<18} {:>15} {:>12}".format("total", total_originals // 1024, total_scaled // 1024))
+
+        if self._asset_pack is not None:
+            print("Asset pack mapped:", self._asset_pack.mapped_bytes() // 1024, "KB")
+
+    def _run_scaling_jobs(self, jobs):
+        """
+        Scale the images of each asset key in a thread pool. smoothscale releases the GIL, so the keys are scaled on
+        all cores. The animals of dict keys (animal images and animations) are scaled as separate jobs.
+        :param jobs: dict, key: asset key, value: (function, original images, argument)
+        :return: dict of the scaled images, complete only when all jobs have finished
+        """
+
+        threads = settings.ASSET_SCALING_THREADS or os.cpu_count() or 1
+        if threads == 1:
+            return {key: function(original, argument) for key, (function, original, argument) in jobs.items()}
+
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            futures = {}
+            for key, (function, original, argument) in jobs.items():
+                if type(original) == dict:
+                    futures[key] = {name: executor.submit(function, original[name],
+                                                          argument[name] if type(argument) == dict else argument)
+                                    for name in original}
+                else:
+                    futures[key] = executor.submit(function, original, argument)
+
+            scaled = {}
+            for key, future in futures.items():
+                if type(future) == dict:
+                    scaled[key] = {name: future[name].result() for name in future}
+                else:
+                    scaled[key] = future.result()
+
+        return scaled
+
+    def _scale_like(self, original, world_image):
+        """
+        Scale an original image, or a list or a dict of them, to the size of the matching world image on the screen.
+        """
+
+        if type(world_image) == dict:
+            return {name: self._scale_like(original[name], world_image[name]) for name in world_image}
+        elif type(world_image) == list:
+            return [self._scale_like(original[i], world_image[i]) for i in range(len(world_image))]
+        else:
+            # At lower quality the faster scaling without smoothing is used
+            if not GameState.quality_enabled(SMOOTH_SCALING):
+                return pygame.transform.scale(original, self._scaled_size(world_image.get_size()))
+            return smoothscale(original, self._scaled_size(world_image.get_size()))
+
+    def _set_world_sizes(self, scaled_image, world_image):
+        """
+        Give scaled images, or a list or a dict of them, the sizes of the matching world images, so the sprites get
+        the same size in the game world with any window size.
+        """
+
+        if type(world_image) == dict:
+            for name in world_image:
+                self._set_world_sizes(scaled_image[name], world_image[name])
+        elif type(world_image) == list:
+            for i in range(len(world_image)):
+                self._set_world_sizes(scaled_image[i], world_image[i])
+        else:
+            set_world_size(scaled_image, world_image.get_size())
+
+    def _scaled_size(self, image_size):
+
+        width = max(1, round(image_size[0] * settings.screen_scale[0]))
+        height = max(1, round(image_size[1] * settings.screen_scale[1]))
 
         return width, height
 
-    def event_loop(self):
-        """Events are passed for handling to the current state."""
+    def event_loop(self, events=None):
+        """
+        Events are passed for handling to the current state.
+        :param events: list of events to handle. If not given, the events are taken from the event queue.
+        """
+
+        if events is None:
+            events = pygame.event.get()
 
-        for event in pygame.event.get():
+        for event in events:
 
             # If the window is resized
             if event.type == VIDEORESIZE:
 
-                print(event.dict["size"])
+                # The SDL renderer scales the canvas to the window, so the screen, the scale and the images stay the
+                # same. The window has been cleared, so the current state is drawn again.
+                if GameState.renderer is not None:
+                    GameState.game_state_manager.get_current_state().redraw_whole_screen()
+                    continue
+
+                GameState.wait_for_render_thread()
                 self.old_screen_size = self._screen.get_size()
                 self._screen = pygame.display.set_mode(event.dict['size'], HWSURFACE | DOUBLEBUF | RESIZABLE)
                 self.set_screens_for_levels()
-                self._scale_images(event.dict['size'])
 
-                # Calculate factor used to scale graphics
+                # Calculate factor used to relocate the menu buttons
                 position_scale_factor_x = event.dict['size'][0] / self.old_screen_size[0]
                 position_scale_factor_y = event.dict['size'][1] / self.old_screen_size[1]
                 settings.scale_factor = (position_scale_factor_x, position_scale_factor_y)
 
-                # Update play area and screen size
-                scale_rect(settings.gate, settings.scale_factor)
-                scale_rect(settings.play_area, settings.scale_factor)
-                settings.SCREEN_HEIGHT = event.dict["size"][1]
-                settings.SCREEN_WIDTH = event.dict["size"][0]
-
-                # Update fence positions
-                settings.FENCE_RIGHT = relocate_point(settings.FENCE_RIGHT, settings.scale_factor)
-                settings.FENCE_LEFT = relocate_point(settings.FENCE_LEFT, settings.scale_factor)
-                settings.FENCE_FRONT = relocate_point(settings.FENCE_FRONT, settings.scale_factor)
-                settings.FENCE_BACK = relocate_point(settings.FENCE_BACK, settings.scale_factor)
+                # The game world stays the same, only the scale used for drawing it changes
+                settings.screen_scale = (event.dict['size'][0] / settings.SCREEN_WIDTH,
+                                         event.dict['size'][1] / settings.SCREEN_HEIGHT)
 
-                # Update paw positions
-                settings.PAW_POS = relocate_point(settings.PAW_POS, settings.scale_factor)
+                self._scale_images()
+                clear_button_cache()
+                clear_label_cache()
 
                 # Update graphics for the game levels
                 for level_name in self._levels:
@@ -322,6 +570,9 @@ class Game(object):
                     elif level_name == "main_menu":
                         state.scale(self.scaled_files["button"], self.scaled_files["menu_background"])
 
+                    elif level_name == "instructions":
+                        state.scale(self.scaled_files["instructions"], self.scaled_files["button"])
+
                 GameState.game_state_manager.get_current_state().redraw_whole_screen()
 
             else:
@@ -333,10 +584,12 @@ class Game(object):
         dt: milliseconds since last frame
         """
 
+        # A frame that took longer than three frames, e.g. while the window was dragged, is not simulated
         if dt > 1000 / settings.FPS * 3:
-            print("Warning: dt was", str(dt), ". Screen not updated.")
+            if settings.PRINT_FRAME_PACING:
+                print("Warning: dt was", str(dt), ". Screen not updated.")
         else:
-            self._level_manager.get_current_state().update(dt)
+            self._level_manager.get_current_state().update(dt * settings.TIME_SCALE)
 
     def draw(self):
         self._level_manager.get_current_state().draw()
@@ -347,21 +600,243 @@ class Game(object):
         spent inside this while loop.
         """
         while not self._level_manager.get_current_state().quit:
-            dt = self._clock.tick(self._fps)
-            self.event_loop()
-            self.update(dt)
-            self.draw()
-            pygame.display.update()
+            state_name = self._level_manager.get_current_state_name()
+            start_times = self._frame_start_times()
+
+            if self._level_manager.get_current_state().is_idle():
+                # Nothing changes on the screen, so sleep until something happens
+                events = self._wait_for_events()
+                # The time spent sleeping is not simulated
+                self._frame_pacer.restart()
+                dt = 0
+            else:
+                dt = self._frame_pacer.tick()
+                events = pygame.event.get()
+
+            self._run_frame(state_name, dt, events, start_times)
+
+        self._print_statistics()
+
+    async def run_async(self, background_tasks=()):
+        """
+        The game loop as a coroutine. The loop waits for the frames with asyncio, so other tasks run between the
+        frames: the calls of the audio input are given to the levels as events (CallEvents), the levels are added as
+        soon as the background loading has finished, and background work such as writing files can be added as tasks.
+
+        An audio input with set_call_listener pushes its calls: it is given CallEvents.push, which its classification
+        thread calls with each heard call. An audio input that can only be polled (get_animal_call) is polled by a
+        task while the loop waits between the frames.
+
+            asyncio.run(game.run_async([write_telemetry(queue)]))
+
+        :param background_tasks: coroutines run as tasks while the game runs. They are cancelled when the game ends.
+        :return: -
+        """
+
+        self.call_events = CallEvents()
+        for level_name in self._levels:
+            if level_name.startswith("level_"):
+                self._level_manager.get_state(level_name).poll_calls = False
+
+        tasks = [asyncio.create_task(self._dispatch_calls())]
+        pushes_calls = hasattr(self._sound_event_interface, "set_call_listener")
+        if pushes_calls:
+            self._sound_event_interface.set_call_listener(self.call_events.push)
+        else:
+            tasks.append(asyncio.create_task(forward_polled_calls(self._sound_event_interface, self.call_events,
+                                                                  settings.CALL_POLL_INTERVAL_MS, self._hears_calls)))
+        if self._loader is not None:
+            tasks.append(asyncio.create_task(self._finish_loading_async()))
+        tasks += [asyncio.create_task(coroutine) for coroutine in background_tasks]
+
+        try:
+            while not self._level_manager.get_current_state().quit:
+                state_name = self._level_manager.get_current_state_name()
+                start_times = self._frame_start_times()
+
+                if self._level_manager.get_current_state().is_idle():
+                    events = await self._wait_for_events_async()
+                    self._frame_pacer.restart()
+                    dt = 0
+                else:
+                    dt = await self._frame_pacer.tick_async()
+                    events = pygame.event.get()
+
+                self._run_frame(state_name, dt, events, start_times)
+        finally:
+            # The event loop closes after the game, so the audio input must not push calls to it any more
+            if pushes_calls:
+                self._sound_event_interface.set_call_listener(None)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        self._print_statistics()
+
+    @staticmethod
+    def _frame_start_times():
+        """
+        :return: perf_counter and process_time when the frame starts, or None if the CPU use of the states is not
+        printed
+        """
+
+        if not settings.PRINT_STATE_CPU_USAGE:
+            return None
+        return time.perf_counter(), time.process_time()
+
+    def _run_frame(self, state_name, dt, events, start_times):
+        """
+        Handle the events, update and draw one frame and measure it.
+        :param state_name: name of the current state when the frame started
+        :param dt: milliseconds since the previous frame
+        :param events: list of events
+        :param start_times: perf_counter and process_time when the frame started, before waiting for it, or None
+        :return: -
+        """
+
+        self.event_loop(events)
+        self.poll_loading()
+        frame_start_time = time.perf_counter()
+        self.update(dt)
+        self.draw()
+        # Only the frames of the levels are measured, the menus wait for events
+        if dt > 0 and state_name.startswith("level_") and GameState.quality is not None:
+            if GameState.quality.add_frame(time.perf_counter() - frame_start_time):
+                self._level_manager.get_current_state().apply_quality()
+
+        if "time to first frame" not in self.startup_times:
+            self.startup_times["time to first frame"] = time.perf_counter() - self._start_time
+
+        if start_times is not None:
+            usage = self._state_usage.setdefault(state_name, [0, 0, 0])
+            usage[0] += time.perf_counter() - start_times[0]
+            usage[1] += time.process_time() - start_times[1]
+            usage[2] += 1
+
+    def _hears_calls(self):
+        """
+        :return: True if the current state is a game level, which handles the calls of the audio input
+        """
+        return isinstance(self._level_manager.get_current_state(), GameLevel)
+
+    async def _dispatch_calls(self):
+        """
+        Give the pushed calls to the current game level. Calls heard while a menu is shown are ignored.
+        :return: -
+        """
+
+        async for call in self.call_events:
+            if self._hears_calls():
+                self._level_manager.get_current_state().hear_call(call)
+
+    async def _finish_loading_async(self):
+        """
+        Add the levels as soon as the background loading has finished.
+        :return: -
+        """
+
+        await asyncio.get_running_loop().run_in_executor(None, self._loaded.wait)
+        self.poll_loading()
+
+    def _print_statistics(self):
+        """
+        Print the statistics chosen in settings when the game is closed.
+        :return: -
+        """
+
+        if settings.PRINT_STATE_CPU_USAGE:
+            self.print_state_usage()
+
+        if settings.PRINT_SPRITE_POOL_HIT_RATES:
+            for level_name in self._levels:
+                if level_name.startswith("level_"):
+                    print(level_name)
+                    self._level_manager.get_state(level_name).sprite_pool.print_hit_rates()
+
+        if settings.PRINT_SPRITE_STATE_TIMES:
+            for level_name in self._levels:
+                if level_name.startswith("level_"):
+                    print(level_name)
+                    self._level_manager.get_state(level_name).print_state_statistics()
+
+        if settings.PRINT_ASSET_MEMORY:
+            self.print_memory_report()
+
+        if settings.PRINT_STARTUP_TIMES:
+            for name, seconds in self.startup_times.items():
+                print("{}: {:.3f} s".format(name, seconds))
+
+        if settings.PRINT_QUALITY_LEVELS and GameState.quality is not None:
+            GameState.quality.print_levels()
+
+        if settings.PRINT_FRAME_PACING:
+            self._frame_pacer.print_statistics()
+
+    def _wait_for_events(self):
+        """
+        Block until there is at least one event or the idle timeout has passed.
+        :return: list of events
+        """
+
+        event = pygame.event.wait(settings.IDLE_WAIT_TIMEOUT_MS)
+        if event.type == NOEVENT:
+            return pygame.event.get()
+
+        return [event] + pygame.event.get()
+
+    async def _wait_for_events_async(self):
+        """
+        Wait until there is at least one event or the idle timeout has passed. Like _wait_for_events this blocks on
+        the event queue, but for at most ASYNC_EVENT_POLL_MS at a time, so the other tasks run while waiting. The wait
+        stays in the main thread, because SDL expects the events to be pumped there.
+        :return: list of events
+        """
+
+        deadline = time.perf_counter() + settings.IDLE_WAIT_TIMEOUT_MS / 1000
+        while True:
+            timeout = min(settings.ASYNC_EVENT_POLL_MS, int(1000 * (deadline - time.perf_counter())))
+            event = pygame.event.wait(max(timeout, 1))
+            if event.type != NOEVENT:
+                return [event] + pygame.event.get()
+            if time.perf_counter() >= deadline:
+                return []
+            await asyncio.sleep(0)
+
+    def print_state_usage(self):
+        """
+        Print the time, CPU time and frame count for each state the game has been in.
+        :return: -
+        """
+
+        print("state               time (s)  CPU time (s)  CPU use  frames")
+        for state_name, (wall_time, cpu_time, frames) in self._state_usage.items():
+            cpu_use = 100 * cpu_time / wall_time if wall_time > 0 else 0
+            print("{:<18} {:>9.1f} {:>13.2f} {:>7.1f}% {:>7}".format(state_name, wall_time, cpu_time, cpu_use, frames))
 
 
 if __name__ == "__main__":
     pygame.init()
-    pygame.display.set_caption("Animal daycare")
-    # pygame.mouse.set_visible(0)  # hide mouse cursor
-    # pygame.display.set_icon(kuva) # TODO: jos haluaa ikkunan ikonin vaihtaa niin näin
-    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), HWSURFACE | DOUBLEBUF | RESIZABLE)
+    if settings.RENDER_BACKEND == "sdl2":
+        GameState.renderer = TextureRenderer.create("Animal daycare", (SCREEN_WIDTH, SCREEN_HEIGHT))
+
+    if GameState.renderer is not None:
+        screen = GameState.renderer.canvas
+    else:
+        pygame.display.set_caption("Animal daycare")
+        # pygame.mouse.set_visible(0)  # hide mouse cursor
+        # pygame.display.set_icon(kuva) # TODO: jos haluaa ikkunan ikonin vaihtaa niin näin
+        screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT), HWSURFACE | DOUBLEBUF | RESIZABLE)
+
+    if settings.PIPELINED_DRAWING and GameState.renderer is None:
+        GameState.render_thread = RenderThread()
 
+    GameState.quality = QualityGovernor()
     game = Game(screen)
-    game.run()
+    if settings.ASYNC_GAME_LOOP:
+        asyncio.run(game.run_async())
+    else:
+        game.run()
+    if GameState.render_thread is not None:
+        GameState.render_thread.stop()
     pygame.quit()
     sys.exit()
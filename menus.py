@@ -1,20 +1,21 @@
 import pygame
 from game_state import GameState
 from help_functions import *
+from label_cache import get_font, render_button, render_label, wrap_text
 import settings
 
 
-class MenuItem(pygame.font.Font, pygame.sprite.DirtySprite):
+class MenuItem(pygame.sprite.DirtySprite):
     def __init__(self, text, button_img, font=None, font_size=30, font_color=(255, 255, 255), pos_x=0, pos_y=0):
 
         pygame.sprite.DirtySprite.__init__(self)
-        pygame.font.Font.__init__(self, font, font_size)
 
         self._button_image = button_img
         self.image = self._button_image
         self.rect = self.image.get_rect()
         self.text = text
 
+        self.font_name = font
         self.font_size = font_size
         self._text_color = font_color
 
@@ -32,20 +33,8 @@ class MenuItem(pygame.font.Font, pygame.sprite.DirtySprite):
         :return: -
         """
 
-        if selected:
-            self.set_bold(True)
-            self.set_underline(True)
-        else:
-            self.set_bold(False)
-            self.set_underline(False)
-
-        self.image = self._button_image.copy()
-        label = self.render(self.text, True, font_color)
-
-        pos_text_x = self.rect.width // 2 - label.get_rect().width // 2
-        pos_text_y= self.rect.height // 2 - label.get_rect().height // 2
-        self.image.blit(label, (pos_text_x, pos_text_y))
-
+        # The rendered buttons are shared between all menus
+        self.image = render_button(self._button_image, self.text, self.font_name, self.font_size, font_color, selected)
         self.dirty = 1
 
     def change_button_image(self, image):
@@ -149,6 +138,7 @@ class GameMenu(GameState):
 
         # redraw background
         self.screen.blit(self._bg_rect, (0,0))
+        self.redraw_background = True
 
         # Draw text if given
         if self.text != "":
@@ -169,7 +159,7 @@ class GameMenu(GameState):
 
         # background can be an image or a color
         if background_image == None:
-            self._bg_rect = pygame.Surface((settings.SCREEN_WIDTH, settings.SCREEN_HEIGHT), pygame.SRCALPHA, 32)
+            self._bg_rect = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA, 32)
             self._bg_rect.fill(self.background)
         else:
             self._bg_rect = background_image
@@ -190,8 +180,7 @@ class GameMenu(GameState):
 
     def set_text(self, text):
         self.text = text
-        myfont = pygame.font.SysFont(None, 50)
-        self.label = myfont.render(text, 1, (255, 255, 255))
+        self.label = render_label(text, None, 50, (255, 255, 255), system_font=True)
         self.text_pos_y = (self.screen.get_rect().height / 2) - (self.t_h / 2) - self._menu_items[0].rect.height
         self.text_pos_x = self._menu_items[0].rect.center[0] - self.label.get_rect().width // 2
 
@@ -199,88 +188,112 @@ class GameMenu(GameState):
 
         # Get the changed areas and draw them on the screen
         rectlist = self._buttons.draw(self.screen)
-        pygame.display.update(rectlist)
+        self.update_display(rectlist)
+
+    def is_idle(self):
+        # The menu changes only when a key is pressed
+        return not self.redraw_background and all(button.dirty == 0 for button in self._menu_items)
 
 # ---------------------------------------------------------------------------------------------------------------------
 
-class Instructions(GameState, pygame.font.Font):
-    def __init__(self, image):
+class Instructions(GameState):
+    def __init__(self, image, button_image):
         super(Instructions, self).__init__()
         self.font_size = 30
-
-        pygame.font.Font.__init__(self, None, self.font_size)
-        self.font = pygame.font.SysFont("Tahoma", 20)
-        black = (0, 0, 0)
-
-        # TODO: PITKÄN TEKSTIN ESITTÄMINEN, pygame ei osaa renderöidä tekstin rivinvaihtoa...
         self.instructions_text = "Instructions"
-        goal_text = ["Guide the animal the owner asks to the gate", "but be careful not to let wrong animals go there."]
-        call_text = ["Animals can be controlled by calling them.", "Calling is done by 'imitating' the animal.",  "If an animal inside the call radius is called,",
-                       "it turns towards the player."]
-        call = "Calls:"
-
-        controls_text = "Move the caretaker using arrow keys."
-        calls = ['Cat: "MAU" or "MEOW"', 'Cow: "AMMUU" or "MOO', 'Dog: "HAU" or "WOOF"', 'Pig: "RÖH or "OINK"', 'Sheep: "BÄÄ" or "BAA"']
-        pause_text = "Pause the game and open a menu by pressing Esc, Enter, or Space"
-        self.texts = {"goal": self._create_texts(goal_text), "controls": self.font.render(controls_text, True, black),
-                      "calls": self._create_texts(calls), "call_text": self._create_texts(call_text),
-                      "call": self.render(call, True, black), "pause": self.render(pause_text, True, black) }
-
-        self.button = MenuItem("Back", load_image(pygame, "button.png", 2))
 
+        calls = ['Cat: "MAU" or "MEOW"', 'Cow: "AMMUU" or "MOO"', 'Dog: "HAU" or "WOOF"', 'Pig: "RÖH" or "OINK"',
+                 'Sheep: "BÄÄ" or "BAA"']
+
+        # Text blocks of the page as (paragraphs, font name, font size, system font, space before the block).
+        # Font sizes and spaces are given for the original screen size and each paragraph is word wrapped.
+        self._blocks = [
+            (["Guide the animal the owner asks to the gate but be careful not to let wrong animals go there."],
+             "Tahoma", 20, True, 0),
+            (["Move the caretaker using arrow keys."], "Tahoma", 20, True, 18),
+            (["Animals can be controlled by calling them. Calling is done by 'imitating' the animal. "
+              "If an animal inside the call radius is called, it turns towards the player."], "Tahoma", 20, True, 36),
+            (["Calls:"], None, self.font_size, False, 18),
+            (calls, "Tahoma", 20, True, 0),
+            (["Pause the game and open a menu by pressing Esc, Enter, or Space"], None, self.font_size, False, 18)
+        ]
+
+        self.button = MenuItem("Back", button_image)
         self.image = image
 
-    def _create_texts(self, texts):
-        return [self.font.render(text, True, (0,0,0)) for text in texts]
-
-    def draw(self):
-
-        self.screen.fill((204, 204, 255))
+        # The whole page is laid out once into this surface and reused until the screen size changes
+        self._base_size = self.screen.get_size()
+        self._page = None
+        self._page_on_screen = False
 
-        self.text_y = 20
+    def scale(self, image, button_image):
+        """
+        Give the page images scaled to the new screen size. The page is laid out again when it is drawn next time.
+        :param image: Picture of the caretaker
+        :param button_image: Image for the back button
+        :return: -
+        """
 
-        # Text explaining the goal of the game
-        for row in self.texts["goal"]:
-            self.screen.blit(row, (20, self.text_y))
-            self._line_break()
+        self.image = image
+        self.button.change_button_image(button_image)
+        self.button.change_button_state((255, 255, 255))
+        self._page = None
 
-        # Player movement text
-        self._blank_row()
-        self.screen.blit(self.texts["controls"], (20, self.text_y))
-        self._blank_row(2)
+    def _layout(self):
+        """
+        Render the whole page into a surface of the current screen size.
+        :return: -
+        """
 
-        # How to call animals text
-        for row in self.texts["call_text"]:
-            self.screen.blit(row, (20, self.text_y))
-            self._line_break()
+        size = self.screen.get_size()
+        scale_x = size[0] / self._base_size[0]
+        scale_y = size[1] / self._base_size[1]
+        margin = int(20 * scale_x)
+        picture_pos = (int(500 * scale_x), int(100 * scale_y))
+        text_width = picture_pos[0] - 2 * margin
 
-        # the word "Call:"
-        self._blank_row()
-        self.screen.blit(self.texts["call"], (20, self.text_y))
-        self._line_break()
+        self._page = pygame.Surface(size)
+        self._page.fill((204, 204, 255))
 
-        # Onomatopoetic calls for the animals that can be used
-        for call in self.texts["calls"]:
-            self.screen.blit(call, (20, self.text_y))
-            self._line_break()
+        text_y = int(20 * scale_y)
+        for paragraphs, font_name, font_size, system_font, space_before in self._blocks:
+            font_size = max(1, int(font_size * scale_y))
+            text_y += int(space_before * scale_y)
+            line_height = get_font(font_name, font_size, system_font).get_linesize()
 
-        # Pause menu text
-        self._blank_row()
-        self.screen.blit(self.texts["pause"], (20, self.text_y))
-        self._line_break()
+            for paragraph in paragraphs:
+                for row in wrap_text(paragraph, font_name, font_size, text_width, system_font):
+                    self._page.blit(render_label(row, font_name, font_size, (0, 0, 0), system_font=system_font),
+                                    (margin, text_y))
+                    text_y += line_height
 
         # Button for exiting the instructions screen
-        self.screen.blit(self.button.image, (self.screen_rect.width // 2  - (self.button.rect.width / 2),
-                                             (self.screen_rect.height - self.button.rect.height * 1.3)))
+        self._page.blit(self.button.image, (size[0] // 2 - self.button.rect.width // 2,
+                                            size[1] - int(self.button.rect.height * 1.3)))
         # Add a picture of caretaker
-        self.screen.blit(self.image, (500, 100))
+        self._page.blit(self.image, picture_pos)
+
+    def start_new(self):
+        self._page_on_screen = False
+
+    def redraw_whole_screen(self, start_thread=False):
+        self._page_on_screen = False
+
+    def draw(self):
 
+        # Nothing changes on the page, so it is drawn only when it is shown or the screen size has changed
+        if self._page is None or self._page.get_size() != self.screen.get_size():
+            self._layout()
+            self._page_on_screen = False
 
-    def _line_break(self, n=1):
-        self.text_y += (25*n)
+        if not self._page_on_screen:
+            self.screen.blit(self._page, (0, 0))
+            self.redraw_background = True
+            self.update_display([])
+            self._page_on_screen = True
 
-    def _blank_row(self, n=1):
-        self.text_y += (18 * n)
+    def is_idle(self):
+        return self._page_on_screen and self._page is not None and self._page.get_size() == self.screen.get_size()
 
     def get_event(self, event):
 
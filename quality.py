@@ -0,0 +1,82 @@
+from collections import deque
+import settings
+
+# Features the governor can turn off, in the names used in the steps of QUALITY_PRESETS
+SHADOWS = "shadows"
+ANIMATION_RATE = "animation_rate"
+SMOOTH_SCALING = "smooth_scaling"
+CALL_CIRCLE = "call_circle"
+
+
+class QualityGovernor():
+    """
+    Lowers the drawing quality when updating and drawing a frame takes too much of the frame time (1 / FPS) and raises
+    it again when there is time to spare. The quality is lowered one step at a time in the order of the steps of the
+    preset. The quality is lowered after a short window of slow frames, but raised only after a longer window of fast
+    frames, and the measurements start again after each change, so the quality does not jump back and forth.
+    """
+
+    def __init__(self, preset=None):
+        """
+        :param preset: Name of a preset in settings.QUALITY_PRESETS. By default settings.QUALITY_PRESET.
+        """
+
+        preset = settings.QUALITY_PRESETS[preset or settings.QUALITY_PRESET]
+        self.steps = preset["steps"]
+        self._degrade_above = preset["degrade_above"]
+        self._restore_below = preset["restore_below"]
+        self._window = preset["window"]
+        self._restore_window = preset["restore_window"]
+
+        # Number of steps taken, 0 is the full quality
+        self.level = 0
+        # Update and draw times of the latest frames in seconds
+        self._frame_times = deque(maxlen=max(self._window, self._restore_window))
+        # Number of frames measured at each level
+        self.frames_at_level = [0] * (len(self.steps) + 1)
+
+    def enabled(self, feature):
+        """
+        Tell whether a feature is used at the current quality.
+        :param feature: Name of the feature, for example SHADOWS
+        :return: boolean
+        """
+        return feature not in self.steps[:self.level]
+
+    def add_frame(self, seconds):
+        """
+        Measure a frame and change the quality if needed.
+        :param seconds: Time spent updating and drawing the frame
+        :return: True if the quality was changed
+        """
+
+        self.frames_at_level[self.level] += 1
+        frame_times = self._frame_times
+        frame_times.append(seconds)
+        budget = 1 / settings.FPS
+
+        if self.level < len(self.steps) and len(frame_times) >= self._window:
+            recent = sum(frame_times[i] for i in range(-self._window, 0)) / self._window
+            if recent > self._degrade_above * budget:
+                return self._set_level(self.level + 1)
+
+        if self.level > 0 and len(frame_times) >= self._restore_window:
+            if sum(frame_times) / len(frame_times) < self._restore_below * budget:
+                return self._set_level(self.level - 1)
+
+        return False
+
+    def _set_level(self, level):
+        self.level = level
+        self._frame_times.clear()
+        return True
+
+    def print_levels(self):
+        """
+        Print how many frames were measured at each quality level.
+        :return: -
+        """
+
+        print("quality level   frames  features off")
+        for level, frames in enumerate(self.frames_at_level):
+            print("{:>13} {:>8}  {}".format(level, frames, ", ".join(self.steps[:level]) or "-"))
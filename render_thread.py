@@ -0,0 +1,131 @@
+import time
+import queue
+import threading
+from collections import namedtuple
+import pygame
+
+# Everything needed for drawing one frame of a game level. Made by the main thread and only read by the render thread.
+#   surface: the screen to draw on
+#   background: background image of the level
+#   items: tuple of (image, screen rect) in the drawing order: shadows, sprites, decorations on top
+#   full_redraw: draw the whole background and update the whole display instead of the changed areas
+RenderList = namedtuple("RenderList", ["surface", "background", "items", "full_redraw"])
+
+
+class RenderThread():
+    """
+    Draws the frames of the game levels in a thread of its own, so that the main thread can simulate the next frame
+    while the previous one is drawn. The blits release the GIL, so this helps when there is more than one core.
+
+    Ownership of the surfaces while the level is drawn in the thread:
+    - The screen belongs to the render thread from submit until wait returns. The main thread must call wait before it
+      draws on the screen itself, changes the display mode or shows another game state.
+    - The images in a render list are only read. They must not be drawn on after they have been put in a render list,
+      so a sprite that gets a new look gets a new image instead (this is already how the game changes images).
+    - The rects in a render list are copies, so the main thread can move the sprites right away.
+
+    SDL expects the display to be updated from the main thread, so the render thread only draws on the screen and
+    remembers the areas it has changed. The main thread pushes them to the display in submit and wait, after the
+    render thread has finished the frame. So the main thread runs at most one frame ahead: submit waits until the
+    previous frame has been drawn.
+    """
+
+    def __init__(self):
+        self._frames = queue.Queue(maxsize=1)
+        # Screen rects of the previous frame, owned by the render thread
+        self._previous_rects = []
+        # Draw the next frame fully because drawing the previous one failed
+        self._redraw_next = False
+        # Areas drawn by the render thread that are not on the display yet, None if the whole display has to be updated.
+        # Written by the render thread and read by the main thread after the frame is done.
+        self._changed_rects = []
+        self._show = False
+        # Time spent drawing in the render thread, in seconds
+        self.render_time = 0
+        self._thread = threading.Thread(target=self._run, name="render", daemon=True)
+        self._thread.start()
+
+    def submit(self, render_list):
+        """
+        Give a frame to the render thread.
+        The previous frame is shown first, so this waits until the render thread has drawn it.
+        :param render_list: RenderList of the frame
+        :return: -
+        """
+        self.wait()
+        self._frames.put(render_list)
+
+    def wait(self):
+        """
+        Wait until the render thread has drawn all submitted frames and show them on the display. After this the main
+        thread may use the screen.
+        :return: -
+        """
+        self._frames.join()
+        self._update_display()
+
+    def _update_display(self):
+        """
+        Push the areas drawn by the render thread to the display. Called in the main thread while the render thread is
+        idle.
+        :return: -
+        """
+
+        if not self._show:
+            return
+        if self._changed_rects is None:
+            pygame.display.update()
+        else:
+            pygame.display.update(self._changed_rects)
+        self._changed_rects = []
+        self._show = False
+
+    def stop(self):
+        self.wait()
+        self._frames.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            render_list = self._frames.get()
+            if render_list is None:
+                self._frames.task_done()
+                break
+
+            start = time.perf_counter()
+            try:
+                self._render(render_list)
+            except pygame.error as message:
+                # Blits fail if the main thread has locked an image, for example to read its pixels
+                print("Error: the render thread could not draw a frame:", message)
+                self._redraw_next = True
+            finally:
+                self.render_time += time.perf_counter() - start
+                self._frames.task_done()
+
+    def _render(self, render_list):
+        """
+        Draw a frame. The areas of the previous frame are cleared with the background and all items are drawn again,
+        so only the areas where something is or was have to be updated on the display.
+        """
+
+        surface = render_list.surface
+        background = render_list.background
+        rects = [rect for image, rect in render_list.items]
+        full_redraw = render_list.full_redraw or self._redraw_next
+
+        if full_redraw:
+            surface.blit(background, (0, 0))
+        else:
+            surface.blits([(background, rect, rect) for rect in self._previous_rects], False)
+        surface.blits(render_list.items, False)
+
+        self._redraw_next = False
+        # Only a frame drawn on the display is shown, a level of a bot is drawn on a surface of its own
+        if surface is pygame.display.get_surface():
+            self._show = True
+            if full_redraw:
+                self._changed_rects = None
+            else:
+                self._changed_rects = self._previous_rects + rects
+        self._previous_rects = rects
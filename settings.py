@@ -3,26 +3,35 @@ from pygame import Rect
 
 FPS = 60
 
-global SCREEN_WIDTH, SCREEN_HEIGHT
+# Size of the game world. The game levels are simulated in these coordinates whatever the size of the window is,
+# and the window starts with this size.
 SCREEN_WIDTH = 960
 SCREEN_HEIGHT = 540
 
-global play_area, gate
+# Places in the game world
 play_area = Rect((40, 27), (730, 490))  # Rect(pos, size)
 gate = Rect((765, 180), (10, 200))
 
-global PAW_POS
 PAW_POS = (810, 50)
 
 global ANIMAL_SPEED, PLAYER_SPEED, GATE_SPEED
 ANIMAL_SPEED = 8
 PLAYER_SPEED = 19
+# Pixels per frame at FPS
 GATE_SPEED = 5
+OWNER_SPEED = 2
 
+# How many times faster than real time the game levels are simulated. Used for testing and benchmarking.
+TIME_SCALE = 1
+
+# Change of the window size in the last resize, used for relocating the menu buttons
 global scale_factor
 scale_factor = (1, 1)
 
-global FENCE_BACK, FENCE_RIGHT, FENCE_LEFT, FENCE_FRONT
+# Screen pixels per world pixel. Used for drawing the game levels.
+global screen_scale
+screen_scale = (1, 1)
+
 FENCE_BACK = (10, 10)
 FENCE_LEFT = (20 ,10)
 FENCE_RIGHT = (760, 25)
@@ -39,6 +48,92 @@ CALL_CIRCLE_COLOR = (0, 50, 150, 30)
 SPEECH_BUBBLE_VISIBLE_TIME_MS = 800
 EXCLAMATION_MARK_VISIBLE_TIME_MS = 600
 HEARD_CALL_VISIBLE_TIME_MS = 400
+# How long each frame of the walking animations is shown, in milliseconds of simulation time
+ANIMATION_FRAME_TIME_MS = 100
+
+# How fast overlapping animals are pushed apart, in the same units as ANIMAL_SPEED. 0 lets animals walk through each other
+ANIMAL_SEPARATION_SPEED = 4
+# How many overlapping animals an animal avoids at most. Keeps the cost down when the play area is crowded
+ANIMAL_SEPARATION_NEIGHBOURS = 4
+
+# How the game is drawn: "software" blits the images on the display surface, "sdl2" draws them as textures through an
+# SDL renderer (GPU or SDL's software renderer), which also scales the game to the window. Falls back to "software"
+# if the SDL renderer is not available.
+RENDER_BACKEND = "software"
+# Draw the game levels in a thread of their own while the main thread simulates the next frame. Saves frame time with
+# more than one core. Only used with the "software" backend.
+PIPELINED_DRAWING = False
+
+# Number of threads used for scaling the images at startup and when the window is resized. 0 uses one thread for each
+# core, 1 scales the images one by one.
+ASSET_SCALING_THREADS = 0
+
+# Pack file in the graphics folder with the original images, made with asset_pack.py. The originals are copied out of
+# it only when the images are scaled. The PNG files are loaded if the pack does not exist or this is empty.
+ASSET_PACK = "assets.pack"
+# How much memory the original images may use between scalings when they come from the asset pack. 0 drops them all,
+# so they are loaded from the pack again when the window is resized.
+ASSET_MEMORY_BUDGET_MB = 0
+
+# How many fonts and rendered text labels of the menus are kept for reuse. The least recently used ones are dropped.
+FONT_CACHE_SIZE = 16
+LABEL_CACHE_SIZE = 256
+
+# Size of the cells in pixels of the grid used for finding the animals near the borders, the gate or the call circle
+SPATIAL_GRID_CELL_SIZE = 64
+
+# Presets of the quality governor, which lowers the drawing quality step by step when updating and drawing the frames
+# of a level takes too long, and raises it again when there is time to spare.
+#   steps: features turned off one at a time, in this order: "shadows" (no shadows under the characters),
+#          "animation_rate" (walking animations at half the frame rate), "smooth_scaling" (the images are scaled with
+#          transform.scale instead of smoothscale when the window is resized) and "call_circle" (the call circle is hidden)
+#   degrade_above: lower the quality when the average frame takes more than this part of the frame time (1 / FPS)
+#   restore_below: raise the quality when the average frame takes less than this part of the frame time
+#   window: number of frames averaged before lowering the quality
+#   restore_window: number of frames averaged before raising the quality
+QUALITY_PRESETS = {
+    # Always full quality
+    "full": {"steps": [], "degrade_above": 1, "restore_below": 0, "window": 1, "restore_window": 1},
+    "default": {"steps": ["shadows", "animation_rate", "smooth_scaling", "call_circle"],
+                "degrade_above": 0.8, "restore_below": 0.4, "window": 30, "restore_window": 300},
+    # Slow machines: the quality is lowered sooner and raised later
+    "kiosk": {"steps": ["shadows", "call_circle", "animation_rate", "smooth_scaling"],
+              "degrade_above": 0.6, "restore_below": 0.25, "window": 15, "restore_window": 600},
+}
+QUALITY_PRESET = "default"
 
+# How the game loop waits for the next frame: "tick" sleeps (little CPU, uneven frames), "busy_loop" busy-waits (even
+# frames, keeps a core busy) and "hybrid" sleeps and busy-waits only the last FRAME_PACING_SPIN_MS before the frame.
+# Compare them on a machine with: python frame_pacing.py
+FRAME_PACING = "tick"
+# The most CPU time the hybrid pacing spends busy-waiting in each frame, in milliseconds
+FRAME_PACING_SPIN_MS = 2
+# Number of frames whose dt is averaged before it is given to the game states. 1 gives the measured dt of each frame.
+DT_SMOOTHING_FRAMES = 1
 
+# How long the game loop sleeps at most while waiting for events when nothing changes on the screen (menus)
+IDLE_WAIT_TIMEOUT_MS = 500
 
+# Run the game loop as an asyncio coroutine (Game.run_async). The calls of the audio input are pushed to the levels
+# as events, and background work runs as tasks between the frames.
+ASYNC_GAME_LOOP = False
+# How long the asyncio game loop blocks on the event queue at a time while nothing changes on the screen, before it
+# lets the other tasks run. Events are handled as soon as they arrive.
+ASYNC_EVENT_POLL_MS = 100
+# How often the audio input is polled for calls in the asyncio game loop while a game level is shown
+CALL_POLL_INTERVAL_MS = 10
+# Print the time and CPU time spent in each game state when the game is closed
+PRINT_STATE_CPU_USAGE = False
+# Print how often the sprites of each game level were reused from the sprite pool when the game is closed
+PRINT_SPRITE_POOL_HIT_RATES = False
+# Print how long the animals, owners and the gate of each game level spent in each state when the game is closed
+PRINT_SPRITE_STATE_TIMES = False
+# Print the memory used by the images of each asset key when the game is closed
+PRINT_ASSET_MEMORY = False
+# Print the time to the first frame and the time until the levels could be played when the game is closed
+PRINT_STARTUP_TIMES = False
+# Print how many frames were drawn at each quality level of the quality governor when the game is closed
+PRINT_QUALITY_LEVELS = False
+# Print the histogram of the frame interval jitter of the frame pacing when the game is closed, and the frames that
+# took too long to be simulated
+PRINT_FRAME_PACING = False
@@ -0,0 +1,26 @@
+class SilentSoundInterface():
+    """
+    Sound event interface without audio input. Nobody calls the animals. Used by the benchmark, the bot
+    environments and the asset tools, which run the game without a microphone.
+    """
+
+    def __init__(self):
+        self.calling = False
+        self._call_listener = None
+
+    def start_threads(self):
+        pass
+
+    def stop_audio(self):
+        pass
+
+    def get_animal_call(self):
+        return None
+
+    def set_call_listener(self, listener):
+        """
+        Set the function called with each heard call. Nobody calls, so the listener is never called.
+        :param listener: function taking the name of the species, or None
+        :return: -
+        """
+        self._call_listener = listener
@@ -0,0 +1,202 @@
+class SpatialGrid():
+    """
+    A uniform grid for finding objects near an area without checking all of them. Objects are added with their rect
+    and moved when their rect changes. An object is only moved to other cells when it crosses a cell border. The
+    objects of a cell are kept in the order they were added, so the neighbours of an object are always found in the
+    same order and a restored level moves the same way as the original one.
+
+    The grid also knows an interior area (the play area without the gate). Objects whose cells are all inside it
+    cannot touch the borders or the gate, so their detailed collision checks can be skipped.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        # Objects in each cell as the keys of a dict, which keeps them in order. Key: (column, row)
+        self._cells = {}
+        # Cell range (first column, first row, last column, last row) of each object
+        self._object_cells = {}
+        # Is the object fully inside the interior cells
+        self._inside = {}
+        self._interior_cells = set()
+
+    def _cell_range(self, rect):
+        size = self.cell_size
+        return rect.left // size, rect.top // size, (rect.right - 1) // size, (rect.bottom - 1) // size
+
+    def set_interior(self, area, excluded_areas=()):
+        """
+        Set the area where objects need no collision checks with the borders. Cells that are not fully inside the
+        area, or that touch any of the excluded areas, are not interior cells.
+        :param area: Rect, usually the play area
+        :param excluded_areas: list of Rect, for example the gate
+        :return: -
+        """
+
+        size = self.cell_size
+        first_column, first_row, last_column, last_row = self._cell_range(area)
+        excluded_cells = set()
+        for excluded_area in excluded_areas:
+            excluded_cells.update(self._cells_in_range(self._cell_range(excluded_area)))
+
+        self._interior_cells = set()
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                if (column, row) in excluded_cells:
+                    continue
+                if area.left <= column * size and (column + 1) * size <= area.right and \
+                        area.top <= row * size and (row + 1) * size <= area.bottom:
+                    self._interior_cells.add((column, row))
+
+        for obj, cell_range in self._object_cells.items():
+            self._inside[obj] = self._is_inside(cell_range)
+
+    def _cells_in_range(self, cell_range):
+        first_column, first_row, last_column, last_row = cell_range
+        return [(column, row) for column in range(first_column, last_column + 1)
+                for row in range(first_row, last_row + 1)]
+
+    def _is_inside(self, cell_range):
+        interior_cells = self._interior_cells
+        for cell in self._cells_in_range(cell_range):
+            if cell not in interior_cells:
+                return False
+        return True
+
+    def insert(self, obj, rect):
+        """
+        Add an object to the grid.
+        :param obj: Object to add
+        :param rect: Rect of the object
+        :return: -
+        """
+
+        cell_range = self._cell_range(rect)
+        self._object_cells[obj] = cell_range
+        self._inside[obj] = self._is_inside(cell_range)
+        for cell in self._cells_in_range(cell_range):
+            self._cells.setdefault(cell, {})[obj] = None
+
+    def remove(self, obj):
+        """
+        Remove an object from the grid. Does nothing if the object is not in the grid.
+        :param obj: Object to remove
+        :return: -
+        """
+
+        cell_range = self._object_cells.pop(obj, None)
+        if cell_range is None:
+            return
+
+        del self._inside[obj]
+        for cell in self._cells_in_range(cell_range):
+            objects = self._cells[cell]
+            del objects[obj]
+            if not objects:
+                del self._cells[cell]
+
+    def move(self, obj, rect):
+        """
+        Update the position of an object that is in the grid.
+        :param obj: Object that has moved
+        :param rect: New rect of the object
+        :return: True if the object was near the edge (see near_edge) at the old or the new position or anywhere
+                 between them
+        """
+
+        size = self.cell_size
+        cell_range = (rect.left // size, rect.top // size, (rect.right - 1) // size, (rect.bottom - 1) // size)
+        old_range = self._object_cells[obj]
+        if cell_range == old_range:
+            return not self._inside[obj]
+
+        self.remove(obj)
+        self.insert(obj, rect)
+        # A long move can pass through cells that neither the old nor the new rect touches
+        swept_range = (min(cell_range[0], old_range[0]), min(cell_range[1], old_range[1]),
+                       max(cell_range[2], old_range[2]), max(cell_range[3], old_range[3]))
+        return not self._is_inside(swept_range)
+
+    def near_edge(self, obj):
+        """
+        Return True if the object is in a cell that touches the borders of the interior area or an excluded area.
+        :param obj: Object in the grid
+        :return: boolean
+        """
+        return not self._inside[obj]
+
+    def query(self, rect):
+        """
+        Return the objects in the cells that the rect touches. The objects are not necessarily inside the rect.
+        :param rect: Rect of the searched area
+        :return: dict whose keys are the objects
+        """
+
+        found = {}
+        cells = self._cells
+        for cell in self._cells_in_range(self._cell_range(rect)):
+            objects = cells.get(cell)
+            if objects:
+                found.update(objects)
+        return found
+
+    def neighbours(self, obj):
+        """
+        Yield the other objects that share a cell with an object in the grid, each of them once, in the same order as
+        query. Unlike query, no dict of the found objects is built, so the search can stop early cheaply.
+        :param obj: Object in the grid
+        :return: generator of objects
+        """
+
+        object_cells = self._object_cells
+        cells = self._cells
+        first_column, first_row, last_column, last_row = object_cells[obj]
+        for column in range(first_column, last_column + 1):
+            for row in range(first_row, last_row + 1):
+                for other in cells[(column, row)]:
+                    if other is obj:
+                        continue
+                    other_cells = object_cells[other]
+                    # An object that shares several cells is only yielded in the first of them. The other object
+                    # is in this cell, so it does not start after it.
+                    if (column == first_column or other_cells[0] == column) and \
+                            (row == first_row or other_cells[1] == row):
+                        yield other
+
+    def objects_at(self, point):
+        """
+        Return the objects in the cell of a point. The returned dict belongs to the grid and must not be changed.
+        :param point: Point as tuple (x, y)
+        :return: dict whose keys are the objects
+        """
+        return self._cells.get((point[0] // self.cell_size, point[1] // self.cell_size), ())
+
+    def get_cells(self):
+        """
+        Return the objects of each cell in their order.
+        :return: dict, key: (column, row), value: tuple of objects
+        """
+        return {cell: tuple(objects) for cell, objects in self._cells.items()}
+
+    def set_cells(self, cells, rects):
+        """
+        Replace the contents of the grid, keeping the order of the objects in each cell.
+        :param cells: dict like the one returned by get_cells
+        :param rects: dict, key: object, value: Rect of the object
+        :return: -
+        """
+
+        self.clear()
+        for obj, rect in rects.items():
+            cell_range = self._cell_range(rect)
+            self._object_cells[obj] = cell_range
+            self._inside[obj] = self._is_inside(cell_range)
+        for cell, objects in cells.items():
+            self._cells[cell] = dict.fromkeys(objects)
+
+    def clear(self):
+        self._cells.clear()
+        self._object_cells.clear()
+        self._inside.clear()
+
+    def __len__(self):
+        return len(self._object_cells)
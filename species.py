@@ -0,0 +1,85 @@
+import os
+import json
+
+# JSON file listing the species of the animals. The position of a species in the list is its id.
+MANIFEST_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "species.json")
+
+# Species loaded from the manifest. The index of a species is its id.
+_species = None
+# Id of each species. Key: name
+_ids = None
+
+
+class Species():
+    """
+    An animal species listed in the manifest. The game refers to species by their id, the names are used by the
+    audio classifier and by people.
+    """
+
+    __slots__ = ("id", "name", "frame_files", "cheat_key")
+
+    def __init__(self, species_id, name, frame_files, cheat_key):
+        """
+        :param species_id: index of the species in the manifest
+        :param name: name of the species, for example "cat"
+        :param frame_files: list of image files of the walking animation
+        :param cheat_key: name of the key that calls the species, or None
+        """
+
+        self.id = species_id
+        self.name = name
+        self.frame_files = frame_files
+        self.cheat_key = cheat_key
+
+    @property
+    def asset_key(self):
+        """
+        Key of the animation images of the species in the image dicts of the Game.
+        """
+        return "animal_" + self.name
+
+
+def load_manifest(path=MANIFEST_FILE):
+    """
+    Load the species from a manifest file. The manifest is a JSON list of species with the name, the file name pattern
+    and the number of the animation frames and the cheat key.
+    :param path: Manifest file
+    :return: -
+    """
+
+    global _species, _ids
+
+    with open(path) as manifest_file:
+        entries = json.load(manifest_file)
+
+    _species = [Species(species_id, entry["name"],
+                        [entry["frames"].format(i) for i in range(entry["frame_count"])],
+                        entry.get("cheat_key"))
+                for species_id, entry in enumerate(entries)]
+    _ids = {species.name: species.id for species in _species}
+
+
+def all_species():
+    """
+    Return all species. The manifest is loaded the first time.
+    :return: list of Species, index is the species id
+    """
+
+    if _species is None:
+        load_manifest()
+    return _species
+
+
+def get_species(species_id):
+    return all_species()[species_id]
+
+
+def species_id(name):
+    """
+    Return the id of a species.
+    :param name: name of the species
+    :return: int, or None if there is no such species
+    """
+
+    all_species()
+    return _ids.get(name)
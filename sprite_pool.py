@@ -0,0 +1,62 @@
+class SpritePool():
+    """
+    Keeps released sprites so that they can be reused instead of creating new ones. A pooled sprite class has a
+    reset method which takes the same parameters as the constructor and initializes the sprite again.
+    """
+
+    def __init__(self):
+        # Released sprites waiting for reuse. Key: sprite class
+        self._free_sprites = {}
+        # [hits, misses] for each sprite class. Key: name of the sprite class
+        self._statistics = {}
+
+    def acquire(self, sprite_class, *args):
+        """
+        Return a sprite of the given class. A released sprite is reused if there is one, otherwise a new one is created.
+        :param sprite_class: Class of the sprite
+        :param args: Parameters for the constructor (or the reset method) of the sprite
+        :return: sprite
+        """
+
+        statistics = self._statistics.setdefault(sprite_class.__name__, [0, 0])
+        free_sprites = self._free_sprites.get(sprite_class)
+
+        if free_sprites:
+            sprite = free_sprites.pop()
+            sprite.reset(*args)
+            statistics[0] += 1
+        else:
+            sprite = sprite_class(*args)
+            statistics[1] += 1
+
+        return sprite
+
+    def release(self, sprite):
+        """
+        Remove the sprite from all groups and keep it for reuse.
+        :param sprite: A sprite of a class with a reset method
+        :return: -
+        """
+
+        sprite.kill()
+        self._free_sprites.setdefault(type(sprite), []).append(sprite)
+
+    def is_pooled(self, sprite):
+        """
+        Return True if the sprite can be released to the pool (its class has a reset method).
+        :param sprite: sprite
+        :return: boolean
+        """
+        return hasattr(sprite, "reset")
+
+    def get_hit_rates(self):
+        """
+        Return the share of acquired sprites that were reused, for each sprite class.
+        :return: dict, key: name of the sprite class, value: hit rate between 0 and 1
+        """
+        return {name: hits / (hits + misses) for name, (hits, misses) in self._statistics.items() if hits + misses > 0}
+
+    def print_hit_rates(self):
+        for name, (hits, misses) in self._statistics.items():
+            print("{:<12} reused {:>6} / {:<6} ({:.0%})".format(name, hits, hits + misses,
+                                                              hits / (hits + misses) if hits + misses > 0 else 0))
@@ -0,0 +1,109 @@
+import os
+import weakref
+import pygame
+
+try:
+    from pygame._sdl2 import video
+except ImportError:
+    video = None
+
+
+class TextureRenderer():
+    """
+    Draws the game through an SDL renderer instead of blitting surfaces on the display surface. The images are
+    uploaded once as textures and the game levels are drawn with them every frame. The renderer draws on a canvas of
+    the size of the game world and SDL scales it to the window, so the images do not have to be scaled again when
+    the window is resized.
+
+    The menus are still drawn on a surface (the canvas), which is uploaded as a whole when it is shown. SDL scales
+    everything to the window. When the window is resized, pygame still sends VIDEORESIZE, but the game only draws
+    the current state again: the canvas, settings.screen_scale and the images stay the same.
+
+    Works with a GPU (accelerated renderer) and without one (SDL software renderer).
+    """
+
+    def __init__(self, window, renderer, size):
+        self._window = window
+        self._renderer = renderer
+        self._renderer.logical_size = size
+        # The game states draw on the canvas instead of the display surface
+        self.canvas = pygame.Surface(size)
+        # Texture of each uploaded image. A texture is freed when its image is not used anymore.
+        self._textures = weakref.WeakKeyDictionary()
+        # Texture for uploading the canvas
+        self._canvas_texture = None
+
+    @classmethod
+    def create(cls, title, size, accelerated=True):
+        """
+        Open a window with an SDL renderer. Use instead of pygame.display.set_mode.
+        :param title: Title of the window
+        :param size: Size of the window and of the canvas (the game world)
+        :param accelerated: Try a GPU renderer first. The software renderer is used if there is no GPU.
+        :return: TextureRenderer, or None if the SDL renderer is not available
+        """
+
+        if video is None:
+            print("SDL renderer is not available, using the software drawing")
+            return None
+
+        # Smooth scaling from the world size to the window size
+        os.environ.setdefault("SDL_RENDER_SCALE_QUALITY", "linear")
+
+        window = video.Window(title, size=size, resizable=True)
+        for use_gpu in ([1, 0] if accelerated else [0]):
+            try:
+                renderer = video.Renderer(window, accelerated=use_gpu)
+            except video.error as message:
+                print("Cannot create an SDL renderer:", message)
+                continue
+            return cls(window, renderer, size)
+
+        window.destroy()
+        print("Using the software drawing")
+        return None
+
+    def texture(self, image):
+        """
+        Return the texture of an image. The image is uploaded the first time it is drawn.
+        :param image: Surface
+        :return: Texture
+        """
+
+        texture = self._textures.get(image)
+        if texture is None:
+            texture = video.Texture.from_surface(self._renderer, image)
+            self._textures[image] = texture
+        return texture
+
+    def draw_level(self, background, shadows, sprites, decorations):
+        """
+        Draw a game level and show it in the window. Everything is drawn at its screen rect (rect).
+        :param background: Background image of the level
+        :param shadows: list of visible decorations drawn underneath the sprites
+        :param sprites: list of visible sprites in the drawing order
+        :param decorations: list of visible decorations drawn on top of the sprites
+        :return: -
+        """
+
+        texture = self.texture
+        self._renderer.clear()
+        texture(background).draw(dstrect=(0, 0))
+        for objects in (shadows, sprites, decorations):
+            for item in objects:
+                texture(item.image).draw(dstrect=item.rect)
+        self._renderer.present()
+
+    def present_surface(self, surface):
+        """
+        Upload the whole canvas and show it in the window.
+        :param surface: The canvas
+        :return: -
+        """
+
+        if self._canvas_texture is None:
+            self._canvas_texture = video.Texture(self._renderer, surface.get_size(), streaming=True)
+        self._canvas_texture.update(surface)
+        self._renderer.clear()
+        self._canvas_texture.draw(dstrect=(0, 0))
+        self._renderer.present()
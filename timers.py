@@ -0,0 +1,194 @@
+import heapq
+import settings
+
+
+class TimerScheduler():
+    """
+    Calls functions after a delay. The time is the simulation time of a game level, which is advanced by the level
+    with the same dt its sprites get, so timers work the same way with any frame rate or without a display.
+    The timers are kept in a heap, so checking them costs nothing unless a timer is due.
+    """
+
+    def __init__(self):
+        # Simulation time in milliseconds
+        self.time = 0
+        # Heap of timers: [due time, sequence number, callback]. The callback is None for cancelled and fired timers.
+        self._timers = []
+        self._counter = 0
+
+    def schedule(self, delay, callback):
+        """
+        Call a function after a delay.
+        :param delay: Delay in milliseconds of simulation time
+        :param callback: Function called without parameters
+        :return: Timer handle that can be used to cancel the timer
+        """
+
+        self._counter += 1
+        return self.schedule_at(self.time + delay, self._counter, callback)
+
+    def schedule_at(self, due_time, sequence_number, callback):
+        """
+        Add a timer with a given due time and sequence number. Used when a snapshot of a level is restored.
+        :param due_time: Simulation time in milliseconds when the function is called
+        :param sequence_number: Sequence number of the timer, orders the timers that are due at the same time
+        :param callback: Function called without parameters
+        :return: Timer handle that can be used to cancel the timer
+        """
+
+        timer = [due_time, sequence_number, callback]
+        heapq.heappush(self._timers, timer)
+        return timer
+
+    def cancel(self, timer):
+        """
+        Cancel a timer if it has not fired yet.
+        :param timer: Timer handle returned by schedule, or None
+        :return: -
+        """
+
+        if timer is not None:
+            timer[2] = None
+
+    def advance(self, dt):
+        """
+        Advance the simulation time and call the functions of the timers that are due.
+        :param dt: Milliseconds since last frame
+        :return: -
+        """
+
+        self.time += dt
+        timers = self._timers
+        while timers and timers[0][0] <= self.time:
+            timer = heapq.heappop(timers)
+            callback = timer[2]
+            timer[2] = None
+            if callback is not None:
+                callback()
+
+    def timer_values(self, timer):
+        """
+        Return the due time and the sequence number of a timer for a snapshot of a level.
+        :param timer: Timer handle returned by schedule, or None
+        :return: (due time, sequence number), or (0, 0) if the timer has fired or been cancelled
+        """
+
+        if timer is None or timer[2] is None:
+            return 0, 0
+        return timer[0], timer[1]
+
+    def restore_timer(self, due_time, sequence_number, callback):
+        """
+        Add a timer of a snapshot again.
+        :param due_time: Due time given by timer_values
+        :param sequence_number: Sequence number given by timer_values
+        :param callback: Function called without parameters
+        :return: Timer handle, or None if the timer was not pending in the snapshot
+        """
+
+        if sequence_number == 0:
+            return None
+        return self.schedule_at(due_time, sequence_number, callback)
+
+    def get_counter(self):
+        """
+        Return the sequence number of the latest scheduled timer.
+        """
+        return self._counter
+
+    def restore(self, time, counter):
+        """
+        Drop all timers and set the simulation time and the sequence number. The timers of a snapshot are added
+        again with restore_timer.
+        :param time: Simulation time in milliseconds
+        :param counter: Sequence number of the latest scheduled timer
+        :return: -
+        """
+
+        self.time = time
+        self._counter = counter
+        self._timers = []
+
+    def pending(self):
+        """
+        Return the number of timers that have not fired or been cancelled.
+        :return: int
+        """
+        return sum(1 for timer in self._timers if timer[2] is not None)
+
+
+class AnimationClock():
+    """
+    Shared clock of the walking animations of a game level. The frame index of each animation bucket is computed
+    once when the clock ticks to a new frame, and the sprites only look their frame up. A bucket is an animation
+    (for example a species) with a phase offset, so sprites of the same animation do not have to walk in step.
+    The clock runs in simulation time, so the animations have the same speed with any frame rate.
+    """
+
+    def __init__(self, frame_time=settings.ANIMATION_FRAME_TIME_MS):
+        """
+        :param frame_time: How long each frame is shown, in milliseconds
+        """
+
+        self.frame_time = frame_time
+        # Simulation time in milliseconds
+        self.time = 0
+        # Number of frames shown since the start
+        self._tick = 0
+        # Current frame index of each bucket. Key: (animation, phase offset, number of frames)
+        self._frames = {}
+
+    def bucket(self, animation, phase, number_of_frames):
+        """
+        Return the bucket of an animation with a phase offset. Sprites with the same bucket show the same frame.
+        :param animation: Key of the animation, for example a species id
+        :param phase: Phase offset in frames
+        :param number_of_frames: Number of frames in the animation
+        :return: bucket key for frame()
+        """
+
+        key = (animation, phase % number_of_frames, number_of_frames)
+        if key not in self._frames:
+            self._frames[key] = (self._tick + key[1]) % number_of_frames
+        return key
+
+    def advance(self, dt):
+        """
+        Advance the simulation time and update the frame indexes if a new frame is due.
+        :param dt: Milliseconds since last frame
+        :return: -
+        """
+
+        self.time += dt
+        tick = int(self.time // self.frame_time)
+        if tick != self._tick:
+            self._tick = tick
+            frames = self._frames
+            for key in frames:
+                frames[key] = (tick + key[1]) % key[2]
+
+    def frame(self, bucket):
+        """
+        Return the current frame index of a bucket.
+        """
+        return self._frames[bucket]
+
+    def get_tick(self):
+        """
+        Return the number of frames shown since the start.
+        """
+        return self._tick
+
+    def restore(self, time, tick):
+        """
+        Set the simulation time and the number of frames shown, and the frame indexes of all buckets to match them.
+        :param time: Simulation time in milliseconds
+        :param tick: Number of frames shown since the start
+        :return: -
+        """
+
+        self.time = time
+        self._tick = tick
+        frames = self._frames
+        for key in frames:
+            frames[key] = (tick + key[1]) % key[2]
@@ -1,16 +1,25 @@
 import pygame
 import settings
-from game_sprites import FiniteStateMachine
+from game_sprites import WorldSprite, FiniteStateMachine, GATE_CLOSED, GATE_MOVE_DOWN, GATE_OPEN, GATE_MOVE_UP
+from decorations import Decoration
+from help_functions import world_size
 
 
-class Paw(pygame.sprite.DirtySprite):
+class Paw(WorldSprite):
+
+    # Paws change only when a life is lost, so the game level does not update them every frame
+    ticks = False
+
     def __init__(self, image, image_deactivate, position):
         pygame.sprite.DirtySprite.__init__(self)
 
         self.image = image
         self.rect = self.image.get_rect()
-        self.rect.center = position
+        self.world_rect = pygame.Rect((0, 0), world_size(image))
+        self.world_rect.center = position
+        self.place_on_screen()
         self._position = position
+        self.image_activate = image
         self.image_deactivate = image_deactivate
         self.active = True
 
@@ -24,6 +33,17 @@ class Paw(pygame.sprite.DirtySprite):
     def is_active(self):
         return self.active
 
+    def set_active(self, active):
+        """
+        Show the paw as active or deactivated. Used when a snapshot of a level is restored.
+        :param active: boolean
+        :return: -
+        """
+
+        self.image = self.image_activate if active else self.image_deactivate
+        self.dirty = 1
+        self.active = active
+
     def update(self, dt):
         pass
 
@@ -33,21 +53,22 @@ class Paw(pygame.sprite.DirtySprite):
         else:
             self.image = image_deactive
 
+        self.image_activate = image_active
         self.image_deactivate = image_deactive
 
-        self.rect.size = self.image.get_rect().size
-        new_x = int(self.rect.topleft[0] * settings.scale_factor[0])
-        new_y = int(self.rect.topleft[1] * settings.scale_factor[1])
-        self.rect.topleft = (new_x, new_y)
 
+class Fence(WorldSprite):
+
+    # Fences never change, so the game level does not update them
+    ticks = False
 
-class Fence(pygame.sprite.DirtySprite):
     def __init__(self, image, position):
         pygame.sprite.DirtySprite.__init__(self)
 
         self.image = image
         self.rect = self.image.get_rect()
-        self.rect.topleft = position
+        self.world_rect = pygame.Rect(position, world_size(image))
+        self.place_on_screen()
         self.position = position
 
     def update(self, dt):
@@ -56,55 +77,50 @@ class Fence(pygame.sprite.DirtySprite):
 
     def scale(self, image):
         self.image = image
-        new_x = int(self.rect.topleft[0] * settings.scale_factor[0])
-        new_y = int(self.rect.topleft[1] * settings.scale_factor[1])
-        self.rect.topleft = (new_x, new_y)
-        self.rect.size = self.image.get_rect().size
 
 
-class Exclamation(pygame.sprite.DirtySprite):
-    def __init__(self, image):
-        pygame.sprite.DirtySprite.__init__(self)
+class Exclamation(Decoration):
+    """
+    Exclamation mark shown when a wrong animal hits the gate.
+    """
 
-        self.image = image
-        self.rect = self.image.get_rect()
-        self.visible = 0
-        self._call_start_time = 0
+    __slots__ = ()
 
     def show_exclamation(self, other_position):
-        self.rect.bottomright = other_position
+        self.world_rect.bottomright = other_position
         self.visible = 1
-        self.dirty = 1
 
     def hide_exclamation(self):
         self.visible = 0
-        self.dirty = 1
-
-    def update(self, dt):
-        pass
 
     def move(self, animal_position):
-        self.dirty = 1
-        self.rect.bottomright = animal_position
+        self.world_rect.bottomright = animal_position
 
 
-class Gate(pygame.sprite.DirtySprite):
+class Gate(WorldSprite):
     def __init__(self, image, position, owner):
         pygame.sprite.DirtySprite.__init__(self)
 
         self.image = image
         self.rect = self.image.get_rect()
-        self.rect.topleft = position
+        self.world_rect = pygame.Rect(position, world_size(image))
+        # Exact y coordinate of the top, the rect is rounded from it so the gate moves at the same speed with any dt
+        self._position_y = float(self.world_rect.y)
+        self.place_on_screen()
         self._speed = settings.GATE_SPEED
         self.owner = owner
-        self._brain = FiniteStateMachine(self._closed, "closed")
+        self._brain = FiniteStateMachine({GATE_CLOSED: self._closed, GATE_MOVE_DOWN: self._move_down,
+                                          GATE_OPEN: self._open, GATE_MOVE_UP: self._move_up},
+                                         GATE_CLOSED,
+                                         {GATE_CLOSED: (GATE_MOVE_DOWN,), GATE_MOVE_DOWN: (GATE_OPEN, GATE_MOVE_UP),
+                                          GATE_OPEN: (GATE_MOVE_UP,), GATE_MOVE_UP: (GATE_CLOSED, GATE_MOVE_DOWN)})
 
     def close_gate(self):
-        self._brain.set_state(self._move_up, "move_up")
+        self._brain.set_state(GATE_MOVE_UP)
 
 
     def open_gate(self):
-        self._brain.set_state(self._move_down, "move_down")
+        self._brain.set_state(GATE_MOVE_DOWN)
 
     def _closed(self, dt):
         pass
@@ -112,24 +128,60 @@ class Gate(pygame.sprite.DirtySprite):
     def _open(self, dt):
         pass
 
+    def _step(self, dt):
+        # The speed is given in pixels per frame
+        return self._speed * dt * settings.FPS / 1000
+
     def _move_up(self, dt):
-        if self.rect.top > settings.SCREEN_HEIGHT * 0.35:
-            self.rect.y -= self._speed
+        top = settings.SCREEN_HEIGHT * 0.35
+        if self.world_rect.top > top:
+            self._position_y = max(self._position_y - self._step(dt), int(top))
+            self.world_rect.y = round(self._position_y)
             self.dirty = 1
         else:
-            self._brain.set_state(self._closed, "closed")
+            self._brain.set_state(GATE_CLOSED)
 
     def _move_down(self, dt):
 
-        if self.rect.centery < settings.SCREEN_HEIGHT * 0.82:
-            self.rect.y -= -self._speed
+        centery = settings.SCREEN_HEIGHT * 0.82
+        if self.world_rect.centery < centery:
+            # The lowest top, where the center is one pixel below centery
+            bottom_top = int(centery) + 1 - self.world_rect.height // 2
+            self._position_y = min(self._position_y + self._step(dt), bottom_top)
+            self.world_rect.y = round(self._position_y)
             self.dirty = 1
         else:
-            self._brain.set_state(self._open, "open")
+            self._brain.set_state(GATE_OPEN)
 
     def get_state(self):
         return self._brain.get_state()
 
+    def add_listener(self, listener):
+        self._brain.add_listener(listener)
+
+    def snapshot(self, values):
+        """
+        Append the place and the state of the gate to the values of a level snapshot.
+        :param values: array of numbers
+        :return: -
+        """
+
+        values.extend((self.world_rect.x, self._position_y))
+        self._brain.snapshot(values)
+
+    def restore(self, values):
+        """
+        Take the place and the state of the gate from the values of a level snapshot.
+        :param values: iterator over the values, positioned where snapshot appended them
+        :return: -
+        """
+
+        self.world_rect.x = int(next(values))
+        self._position_y = next(values)
+        self.world_rect.y = round(self._position_y)
+        self.dirty = 1
+        self._brain.restore(values)
+
     def update(self, dt):
         self._brain.update(dt)
         #if self.owner.get_state() == "wait_for_animal":
@@ -137,33 +189,21 @@ class Gate(pygame.sprite.DirtySprite):
 
     def scale(self, image):
         self.image = image
-        new_x = int(self.rect.topleft[0] * settings.scale_factor[0])
-        new_y = int(self.rect.topleft[1] * settings.scale_factor[1])
-        self.rect.topleft = (new_x, new_y)
-        self.rect.size = self.image.get_rect().size
 
 
-class Heard(pygame.sprite.DirtySprite):
-    def __init__(self, image):
-        pygame.sprite.DirtySprite.__init__(self)
+class Heard(Decoration):
+    """
+    Question mark shown when an animal has heard a call.
+    """
 
-        self.image = image
-        self.rect = self.image.get_rect()
-        self.visible = 0
-        self._heard_start_time = 0
+    __slots__ = ()
 
     def show_heard(self, other_position):
-        self.rect.midbottom = other_position
+        self.world_rect.midbottom = other_position
         self.visible = 1
-        self.dirty = 1
 
     def hide_heard(self):
         self.visible = 0
-        self.dirty = 1
-
-    def update(self, dt):
-        pass
 
     def move(self, animal_position):
-        self.dirty = 1
-        self.rect.midbottom = animal_position
+        self.world_rect.midbottom = animal_position